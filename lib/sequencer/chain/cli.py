@@ -27,7 +27,8 @@ sequencer seqmake <options>   | \
 sequencer seqexec <options>
 
 It does the same thing without the creation of XML file at eath stages
-(wherever possible).
+(wherever possible): the instructions sequence model is built
+directly, without any XML document.
 """
 import optparse
 import os
@@ -39,6 +40,8 @@ from sequencer.commons import write_graph_to, CyclesDetectedError, \
      get_version, add_options_to
 from sequencer.dgm import cli as dgm_cli
 from sequencer.ise import cli as ise_cli
+from sequencer.ise.builder import ModelBuilder
+from sequencer.ise.model import actions_graph_of
 from sequencer.ism import cli as ism_cli
 
 
@@ -85,8 +88,11 @@ def _parse(config, args):
                           " related action should be forced.")
 
     add_options_to(parser, ['--depgraphto', '--actionsgraphto', '--progress',
-                            '--doexec', '--report', '--dostats',
-                            '--fanout', '--algo', '--docache'],
+                            '--doexec', '--report', '--reportformat',
+                            '--dostats',
+                            '--fanout', '--algo', '--coalesce',
+                            '--docache', '--jobs',
+                            '--schedule', '--history'],
                    config)
     (options, action_args) = parser.parse_args(args)
     if len(action_args) < 2:
@@ -133,8 +139,12 @@ def chain(db, config, chain_args):
     # A cycle has not been detected, we can continue.
     if depgraph is not None:
         seqmake_start = time.time()
+        coalesce = options.coalesce == 'yes'
+        # The XML document is not required: build the model directly
         (ise_model, xml_result, error) = ism_cli.makesequence(depgraph.dag,
-                                                              options.algo)
+                                                              options.algo,
+                                                              ModelBuilder(),
+                                                              coalesce)
         seqmake_stop = time.time()
         if ise_model is None:
             assert error is not None
@@ -143,10 +153,12 @@ def chain(db, config, chain_args):
         else:
             seqdag = ise_model.dag
             seqexec_start = time.time()
-            execution = ise_cli.execute(ise_model, options)
+            execution = ise_cli.execute(ise_model, options,
+                                        ise_cli.get_resource_limits(config))
             seqexec_stop = time.time()
 
-            ise_cli.report(options.report, ise_model, execution)
+            ise_cli.report(options.report, ise_model, execution,
+                           options.reportformat)
             if getattr(options, 'dostats', 'no') == 'yes':
                 stats = ise_cli.get_header(" STATS ",
                                            "=",
@@ -178,6 +190,6 @@ def chain(db, config, chain_args):
 
 
     if options.actionsgraphto is not None and seqdag is not None:
-        write_graph_to(seqdag, options.actionsgraphto)
+        write_graph_to(actions_graph_of(seqdag), options.actionsgraphto)
 
     return execution.rc if execution is not None else os.EX_DATAERR
@@ -23,13 +23,13 @@ This module defines common stuff to all sequencer modules.
 
 from __future__ import print_function, division
 from logging import getLogger
-from pygraph.algorithms.accessibility import mutual_accessibility
 from pygraph.algorithms.searching import depth_first_search
 from pygraph.readwrite.dot import write
 from pygraph.classes.digraph import digraph
 from pygraph.classes.exceptions import InvalidGraphType
 from pygraph.classes.graph import graph
 from pygraph.classes.hypergraph import hypergraph
+from sequencer.graph import to_pygraph, strongly_connected_components
 from operator import itemgetter
 from ConfigParser import RawConfigParser
 import cStringIO
@@ -82,6 +82,7 @@ def convert_uni_graph_to_str(G):
     Returns a graph filled with str values only.
     Inspired by pygraph.readwrite.markup.write
     """
+    G = to_pygraph(G)
     if (type(G) == graph):
         gr = graph()
     elif (type(G) == digraph ):
@@ -282,6 +283,21 @@ def get_option_for(opt_name, config):
                      ', '.join(ism_cli.ALGO_TYPES.keys()) + \
                      '. Default: %default'}
             ]
+    if opt_name == '--coalesce':
+        return [[opt_name],
+                {'dest':'coalesce',
+                 'metavar': '[yes|no]',
+                 'type':'choice',
+                 'action':'store',
+                 'choices':['yes', 'no'],
+                 'default':config.get(ism_cli.SEQMAKE_ACTION_NAME,
+                                      "coalesce"),
+                 'help':"If 'yes', components with the same remote" + \
+                     " actions and dependencies share a single action" + \
+                     " on the folded set of their names." + \
+                     " Default: %default."
+                 }
+                ]
     if opt_name == '--actionsgraphto':
         return [[opt_name],
                 {'metavar':'FILE',
@@ -293,6 +309,15 @@ def get_option_for(opt_name, config):
                      ' Use Graphviz dotty command for' + \
                      ' visualisation.'}
                 ]
+    if opt_name == '--compileto':
+        return [[opt_name],
+                {'metavar':'FILE',
+                 'dest':'compileto',
+                 'type':'string',
+                 'help':'Write the compiled instructions sequence' + \
+                     ' to the given FILE. It can be given as an' + \
+                     ' input to seqexec which then starts faster.'}
+                ]
     # Prevent circular dependencies
     import sequencer.ise.cli as ise_cli
     if opt_name == '--progress':
@@ -337,6 +362,31 @@ def get_option_for(opt_name, config):
                      '. Default: %default'
                  }
                 ]
+    if opt_name == '--reportformat':
+        return [[opt_name],
+                {'dest':'reportformat',
+                 'type':'choice',
+                 'metavar':'format',
+                 'action':'store',
+                 'choices':ise_cli.REPORT_FORMATS,
+                 'default':config.get(ise_cli.SEQEXEC_ACTION_NAME,
+                                      "reportformat"),
+                 'help':'The format of reports.' + \
+                     ' Can be one of: ' + \
+                     ', '.join(ise_cli.REPORT_FORMATS) + \
+                     ' (CSV and JSON lines are machine readable).' + \
+                     ' Default: %default'
+                 }
+                ]
+    if opt_name == '--novalidate':
+        return [[opt_name],
+                {'dest':'novalidate',
+                 'action':'store_true',
+                 'default':False,
+                 'help':'Do not validate the input against the' + \
+                     ' ISE schema. Faster, but for trusted input only.'
+                 }
+                ]
     if opt_name == '--dostats':
         return [[opt_name],
                 {'dest':'dostats',
@@ -361,6 +411,35 @@ def get_option_for(opt_name, config):
                      ' Default: %default'
                  }
                 ]
+    if opt_name == '--schedule':
+        import sequencer.ise.api as ise_api
+        return [[opt_name],
+                {'dest':'schedule',
+                 'type':'choice',
+                 'metavar':'type',
+                 'action':'store',
+                 'choices':ise_api.SCHEDULE_TYPES,
+                 'default':config.get(ise_cli.SEQEXEC_ACTION_NAME,
+                                      "schedule"),
+                 'help':"How ready actions are submitted. Can be one" + \
+                     " of: " + ', '.join(ise_api.SCHEDULE_TYPES) + \
+                     ". With 'critical', actions starting the longest" + \
+                     " remaining path are submitted first, up to the" + \
+                     " fanout. Default: %default"
+                 }
+                ]
+    if opt_name == '--history':
+        return [[opt_name],
+                {'metavar':'FILE',
+                 'dest':'history',
+                 'type':'string',
+                 'default':config.get(ise_cli.SEQEXEC_ACTION_NAME,
+                                      "history"),
+                 'help':"Read the durations of actions from the given" + \
+                     " FILE for the 'critical' schedule, and update" + \
+                     " it after the execution. Default: %default"
+                 }
+                ]
     if opt_name == '--nodeps':
         return [[opt_name],
                 {'dest':'nodeps',
@@ -383,6 +462,16 @@ def get_option_for(opt_name, config):
                                       "docache"),
                  'help':'Use a cache for filtering decision. Default: %default'
                  }]
+    if opt_name == '--jobs':
+        return [['-j', opt_name],
+                {'metavar':'n',
+                 'dest':'jobs',
+                 'type':'int',
+                 'default':config.getint(dgm_cli.DEPMAKE_ACTION_NAME,
+                                         "jobs"),
+                 'help':'Call a maximum of n depsfinders and filters' + \
+                     ' in parallel. Default: %default'
+                 }]
     raise ValueError("Unknown option: %s" % opt_name)
 
 
@@ -887,7 +976,7 @@ def output_graph(graph, root=None):
     - a dot format output of the given graph (display it using graphviz
       dotty command)
     """
-
+    graph = to_pygraph(graph)
     dfs = depth_first_search(graph, root)
     dot = write(graph)
     return [dfs, dot]
@@ -993,14 +1082,18 @@ class CyclesDetectedError(SequencerError):
 
     def get_all_cycles(self):
         """
-        Currently, this just return the result of the call to
-        mutual_accessibility which actually returns the set of
-        strongly connected components in the graph. From that result,
-        it should be possible to get the actual cycles.
+        Return the list of the strongly connected components of the
+        graph that contain a cycle: the ones with several nodes, and
+        the nodes with an edge to themselves. Each cycle of the graph
+        is in one of them.
 
-        But this is not implemented yet.
+        The graph is visited once (see
+        sequencer.graph.strongly_connected_components()).
         """
-        return mutual_accessibility(self.graph)
+        return [component
+                for component in strongly_connected_components(self.graph)
+                if len(component) > 1 or \
+                    self.graph.has_edge((component[0], component[0]))]
 
 
 class SQLError(Exception):
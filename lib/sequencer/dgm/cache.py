@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Persistent caches of depsfinder results and of filter decisions.
+
+Depsfinder entries are keyed on the checksum of the rule (see
+sequencer.dgm.db._update_hash()) and on the component id: any change
+to the rule definition therefore invalidates its entries. Filter
+decisions are keyed on the filter expression and on the component id.
+
+Writes are kept in memory and committed BATCH_SIZE at a time in short
+transactions, so that several processes can share a cache file. A
+cache that can't be opened or written (for example because another
+process holds its lock for too long) is disabled with a warning for
+the rest of the session: its lookups are misses.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from sequencer.commons import get_version, to_unicode
+from sequencer.dgm.db import _update_hash
+
+__author__ = "Pierre Vigneras"
+__copyright__ = "Copyright (c) 2010 Bull S.A.S."
+__credits__ = ["Pierre Vigneras"]
+__version__ = get_version()
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TTL = 86400
+DEFAULT_SIZE = 100000
+
+STATS_NAMES = [u"hits", u"misses", u"expired", u"evicted"]
+
+# Number of pending writes committed at once
+BATCH_SIZE = 100
+
+
+def rule_checksum(rule):
+    """
+    Return the hexadecimal checksum of the given rule.
+    """
+    checksum = hashlib.md5()
+    _update_hash(checksum, rule)
+    return checksum.hexdigest()
+
+def _connect(filename, statements):
+    """
+    Return a connection to the given sqlite3 file, once the given
+    statements have been executed, or None if it can't be opened.
+    """
+    try:
+        connection = sqlite3.connect(filename, check_same_thread=False)
+        with connection:
+            for statement in statements:
+                connection.execute(statement)
+        return connection
+    except sqlite3.Error as error:
+        _LOGGER.warning("Can't open cache %s: %s. Cache disabled.",
+                        filename, error)
+        return None
+
+
+class _SQLiteCache(object):
+    """
+    Base class of the caches stored in a sqlite3 file.
+
+    Instances can be shared by threads: subclasses use self._lock.
+    """
+    def __init__(self, filename, statements):
+        self.filename = filename
+        self.batch_size = BATCH_SIZE
+        self._lock = threading.Lock()
+        self._connection = _connect(filename, statements)
+
+    def _disable(self, error):
+        """
+        Disable this cache after the given sqlite3 error: it is not
+        used anymore during this session.
+        """
+        _LOGGER.warning("%s: %s. Cache disabled.", self, error)
+        try:
+            self._connection.close()
+        except sqlite3.Error:
+            pass
+        self._connection = None
+
+    def _get_connection(self):
+        """
+        Return the connection of this cache. Raise an
+        sqlite3.OperationalError if the cache is disabled.
+        """
+        if self._connection is None:
+            raise sqlite3.OperationalError("%s: cache disabled" % self)
+        return self._connection
+
+    def _pending_count(self):
+        """
+        Return the number of writes not committed yet.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def _write_pending(self, connection):
+        """
+        Write pending writes to the given connection (in a
+        transaction) and forget them.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def _flush(self, force=False):
+        """
+        Commit pending writes, when they reach self.batch_size or if
+        force is True. Must be called with self._lock held.
+        """
+        count = self._pending_count()
+        if count == 0 or (not force and count < self.batch_size):
+            return
+        if self._connection is None:
+            self._write_pending(None)
+            return
+        try:
+            with self._connection:
+                self._write_pending(self._connection)
+        except sqlite3.Error as error:
+            self._disable(error)
+
+
+class DepsFinderCache(_SQLiteCache):
+    """
+    A depsfinder results cache stored in the given sqlite3 'filename'.
+
+    Entries older than 'ttl' seconds are ignored (and removed). The
+    least recently used entries are evicted when new ones are written
+    so that at most 'size' entries remain.
+
+    Instances can be shared by threads.
+    """
+    def __init__(self, filename, ttl=DEFAULT_TTL, size=DEFAULT_SIZE):
+        _SQLiteCache.__init__(self, filename,
+                              ["CREATE TABLE IF NOT EXISTS " + \
+                                   "depsfinder_cache(" + \
+                                   "checksum text NOT NULL, " + \
+                                   "component text NOT NULL, " + \
+                                   "ruleset text NOT NULL, " + \
+                                   "rulename text NOT NULL, " + \
+                                   "deps text NOT NULL, " + \
+                                   "created real NOT NULL, " + \
+                                   "accessed real NOT NULL, " + \
+                                   "PRIMARY KEY (checksum, component))",
+                               "CREATE TABLE IF NOT EXISTS " + \
+                                   "depsfinder_cache_stats(" + \
+                                   "name text PRIMARY KEY, " + \
+                                   "value integer NOT NULL)"])
+        self.ttl = ttl
+        self.size = size
+        # Statistics of the current session
+        self.stats = dict((name, 0) for name in STATS_NAMES)
+        self._checksum_for = dict()
+        # Writes not committed yet, by (checksum, component.id): new
+        # entries, access times and expired entries
+        self._new = dict()
+        self._accessed = dict()
+        self._expired = set()
+
+    def __str__(self):
+        return "DepsFinderCache(%s, ttl=%s, size=%s)" % (self.filename,
+                                                         self.ttl,
+                                                         self.size)
+
+    def _checksum(self, rule):
+        """
+        Return the (memoized) checksum of the given rule.
+        """
+        # The rule is kept in the mapping so its id() cannot be reused
+        (_, checksum) = self._checksum_for.get(id(rule), (None, None))
+        if checksum is None:
+            checksum = rule_checksum(rule)
+            self._checksum_for[id(rule)] = (rule, checksum)
+        return checksum
+
+    def _pending_count(self):
+        return len(self._new) + len(self._accessed) + len(self._expired)
+
+    def _write_pending(self, connection):
+        if connection is not None:
+            connection.executemany("DELETE FROM depsfinder_cache " + \
+                                       "WHERE checksum=? AND component=?",
+                                   self._expired)
+            connection.executemany("INSERT OR REPLACE INTO " + \
+                                       "depsfinder_cache VALUES " + \
+                                       "(?, ?, ?, ?, ?, ?, ?)",
+                                   self._new.values())
+            connection.executemany("UPDATE depsfinder_cache " + \
+                                       "SET accessed=? WHERE " + \
+                                       "checksum=? AND component=?",
+                                   [(accessed, checksum, component)
+                                    for ((checksum, component), accessed) \
+                                        in self._accessed.iteritems()])
+            count = connection.execute("SELECT count(*) FROM " + \
+                                           "depsfinder_cache").fetchone()[0]
+            if count > self.size:
+                connection.execute("DELETE FROM depsfinder_cache " + \
+                                       "WHERE rowid IN (SELECT rowid " + \
+                                       "FROM depsfinder_cache " + \
+                                       "ORDER BY accessed LIMIT ?)",
+                                   (count - self.size,))
+                self.stats[u"evicted"] += count - self.size
+        self._new.clear()
+        self._accessed.clear()
+        self._expired.clear()
+
+    def _lookup(self, key):
+        """
+        Return the (deps, created) pair of the given (checksum,
+        component.id) key or None if it is not in the cache.
+        """
+        new = self._new.get(key)
+        if new is not None:
+            return (new[4], new[5])
+        if self._connection is None:
+            return None
+        try:
+            return self._connection.execute("SELECT deps, created FROM " + \
+                                                "depsfinder_cache WHERE " + \
+                                                "checksum=? AND component=?",
+                                            key).fetchone()
+        except sqlite3.Error as error:
+            self._disable(error)
+            return None
+
+    def get(self, rule, component):
+        """
+        Return the list of dependency ids cached for the given
+        (rule, component) pair or None if it is not in the cache.
+        """
+        key = (self._checksum(rule), component.id)
+        now = time.time()
+        with self._lock:
+            row = self._lookup(key)
+            if row is None:
+                self.stats[u"misses"] += 1
+                return None
+            expired = now - row[1] > self.ttl
+            if expired:
+                self._new.pop(key, None)
+                self._accessed.pop(key, None)
+                self._expired.add(key)
+                self.stats[u"expired"] += 1
+                self.stats[u"misses"] += 1
+            else:
+                self._accessed[key] = now
+                self.stats[u"hits"] += 1
+            self._flush()
+        return None if expired else row[0].splitlines()
+
+    def put(self, rule, component, dep_ids):
+        """
+        Store the given list of dependency ids for the given (rule,
+        component) pair.
+        """
+        key = (self._checksum(rule), component.id)
+        now = time.time()
+        with self._lock:
+            if self._connection is None:
+                return
+            self._expired.discard(key)
+            self._accessed.pop(key, None)
+            self._new[key] = (key[0], component.id,
+                              rule.ruleset, rule.name,
+                              u"\n".join(dep_ids), now, now)
+            self._flush()
+
+    def invalidate(self, ruleset=None, rulenames=None):
+        """
+        Remove entries of the given rulenames in the given
+        ruleset. All entries of the ruleset are removed if rulenames
+        is None or empty. All entries are removed if ruleset is None.
+        Return the number of removed entries.
+        """
+        sql = "DELETE FROM depsfinder_cache"
+        values = []
+        if ruleset is not None:
+            sql += " WHERE ruleset=?"
+            values.append(ruleset)
+            if rulenames:
+                sql += " AND rulename IN (%s)" % \
+                    ", ".join("?" * len(rulenames))
+                values.extend(rulenames)
+        with self._lock:
+            self._flush(True)
+            connection = self._get_connection()
+            with connection:
+                count = connection.execute(sql, values).rowcount
+        return count
+
+    def get_entries_count(self):
+        """
+        Return the mapping {(ruleset, rulename): count} of entries
+        currently in the cache.
+        """
+        with self._lock:
+            self._flush(True)
+            connection = self._get_connection()
+            rows = connection.execute("SELECT ruleset, rulename, " + \
+                                          "count(*) FROM " + \
+                                          "depsfinder_cache GROUP BY " + \
+                                          "ruleset, rulename").fetchall()
+        return dict(((to_unicode(row[0]), to_unicode(row[1])), row[2])
+                    for row in rows)
+
+    def get_total_stats(self):
+        """
+        Return the mapping {name: value} of statistics accumulated
+        by all sessions (including the current one).
+        """
+        with self._lock:
+            connection = self._get_connection()
+            rows = connection.execute("SELECT name, value FROM " + \
+                                          "depsfinder_cache_stats").fetchall()
+        result = dict((name, 0) for name in STATS_NAMES)
+        for (name, value) in rows:
+            result[to_unicode(name)] = value
+        for name in STATS_NAMES:
+            result[name] += self.stats[name]
+        return result
+
+    def close(self):
+        """
+        Commit pending writes, record statistics and close the cache.
+        """
+        with self._lock:
+            self._flush(True)
+            if self._connection is not None:
+                try:
+                    with self._connection:
+                        for name in STATS_NAMES:
+                            self._connection.execute("INSERT OR IGNORE " + \
+                                                         "INTO depsfinder_" + \
+                                                         "cache_stats " + \
+                                                         "VALUES (?, 0)",
+                                                     (name,))
+                            self._connection.execute("UPDATE depsfinder_" + \
+                                                         "cache_stats SET " + \
+                                                         "value=value+? " + \
+                                                         "WHERE name=?",
+                                                     (self.stats[name], name))
+                    self._connection.close()
+                except sqlite3.Error as error:
+                    self._disable(error)
+                self._connection = None
+        _LOGGER.info("%s: %s", self, ", ".join("%s=%d" % (name,
+                                                          self.stats[name])
+                                                for name in STATS_NAMES))
+
+
+class FilterCache(_SQLiteCache):
+    """
+    A filter decisions cache stored in the given sqlite3 'filename'.
+
+    Decisions are keyed on the filter expression (with %ruleset and
+    %rulename substituted) and on the component id. Decisions older
+    than 'ttl' seconds are ignored. Decisions of the filters of rules
+    named in 'exclude' are not stored (see accepts()).
+
+    Instances can be shared by threads.
+    """
+    def __init__(self, filename, ttl=DEFAULT_TTL, exclude=()):
+        _SQLiteCache.__init__(self, filename,
+                              ["CREATE TABLE IF NOT EXISTS " + \
+                                   "filter_cache(" + \
+                                   "expression text NOT NULL, " + \
+                                   "component text NOT NULL, " + \
+                                   "result integer NOT NULL, " + \
+                                   "created real NOT NULL, " + \
+                                   "PRIMARY KEY (expression, component))"])
+        self.ttl = ttl
+        self.exclude = set(exclude)
+        self.stats = {u"hits": 0, u"misses": 0}
+        # Decisions not committed yet, by (expression, component.id)
+        self._new = dict()
+
+    def __str__(self):
+        return "FilterCache(%s, ttl=%s)" % (self.filename, self.ttl)
+
+    def accepts(self, rule):
+        """
+        Return True if decisions of the filter of the given rule may be
+        stored.
+        """
+        return rule.name not in self.exclude
+
+    def _pending_count(self):
+        return len(self._new)
+
+    def _write_pending(self, connection):
+        if connection is not None:
+            connection.executemany("INSERT OR REPLACE INTO filter_cache " + \
+                                       "VALUES (?, ?, ?, ?)",
+                                   self._new.values())
+        self._new.clear()
+
+    def get(self, expression, component):
+        """
+        Return the decision cached for the given (expression,
+        component) pair or None if it is not in the cache.
+        """
+        key = (expression, component.id)
+        with self._lock:
+            new = self._new.get(key)
+            if new is not None:
+                row = new[2:]
+            elif self._connection is None:
+                row = None
+            else:
+                try:
+                    row = self._connection.execute("SELECT result FROM " + \
+                                                       "filter_cache " + \
+                                                       "WHERE expression=?" + \
+                                                       " AND component=?" + \
+                                                       " AND created>=?",
+                                                   (expression, component.id,
+                                                    time.time() - self.ttl))\
+                                                   .fetchone()
+                except sqlite3.Error as error:
+                    self._disable(error)
+                    row = None
+            if row is None:
+                self.stats[u"misses"] += 1
+                return None
+            self.stats[u"hits"] += 1
+        return bool(row[0])
+
+    def put(self, expression, component, result):
+        """
+        Store the given decision for the given (expression, component)
+        pair.
+        """
+        with self._lock:
+            if self._connection is None:
+                return
+            self._new[(expression, component.id)] = (expression,
+                                                     component.id,
+                                                     1 if result else 0,
+                                                     time.time())
+            self._flush()
+
+    def close(self):
+        """
+        Commit pending decisions, remove expired ones and close the
+        cache.
+        """
+        with self._lock:
+            self._flush(True)
+            if self._connection is not None:
+                try:
+                    with self._connection:
+                        self._connection.execute("DELETE FROM " + \
+                                                     "filter_cache WHERE " + \
+                                                     "created<?",
+                                                 (time.time() - self.ttl,))
+                    self._connection.close()
+                except sqlite3.Error as error:
+                    self._disable(error)
+                self._connection = None
+        _LOGGER.info("%s: hits=%d, misses=%d", self,
+                     self.stats[u"hits"], self.stats[u"misses"])
@@ -33,6 +33,7 @@ from sequencer.commons import confirm, UnknownRuleSet, smart_display, \
     write_graph_to, CyclesDetectedError, get_version, add_options_to, \
     replace_if_none, DuplicateRuleError, NoSuchRuleError, to_str_from_unicode,\
     to_unicode, convert_uni_graph_to_str
+from sequencer.dgm.cache import DepsFinderCache, FilterCache, STATS_NAMES
 from sequencer.dgm.db import create_rule_from_strings_array
 from sequencer.dgm.model import RuleSet, Component, NOT_FORCE_OP
 from sequencer.ise import cli as ise_cli
@@ -75,9 +76,17 @@ DBUPDATE_ACTION_NAME = 'dbupdate'
 DBUPDATE_DOC = 'Update a rule'
 DBCHECKSUM_ACTION_NAME = 'dbchecksum'
 DBCHECKSUM_DOC = "Display ruleset checksums"
+DEPSCACHE_ACTION_NAME = 'depscache'
+DEPSCACHE_DOC = "Display statistics of, or clear, the depsfinder cache"
 
 GUESSER_MODULE_NAME = 'guesser.module.name'
 GUESSER_PARAMS_NAME = 'guesser.factory.params'
+DEPSCACHE_FILE_NAME = 'depsfinder.cache'
+DEPSCACHE_TTL_NAME = 'depsfinder.cache.ttl'
+DEPSCACHE_SIZE_NAME = 'depsfinder.cache.size'
+FILTERCACHE_FILE_NAME = 'filter.cache'
+FILTERCACHE_TTL_NAME = 'filter.cache.ttl'
+FILTERCACHE_EXCLUDE_NAME = 'filter.cache.exclude'
 
 
 def get_usage_data():
@@ -108,13 +117,16 @@ def get_usage_data():
             DBCOPY_ACTION_NAME: {'doc': DBCOPY_DOC,
                                  'main': dbcopy},
             DBCHECKSUM_ACTION_NAME: {'doc': DBCHECKSUM_DOC,
-                                     'main': dbchecksum}
+                                     'main': dbchecksum},
+            DEPSCACHE_ACTION_NAME: {'doc': DEPSCACHE_DOC,
+                                    'main': depscache}
             }
 
 # Warning: Unicode strings are required here (see smart_display())
 RULES_HEADER = [u"ruleset", u"name", u"types", u"filter",
                 u"action", u"depsfinder", u"dependson", u"comments", u"help"]
 CHECKSUM_HEADER = [u"ruleset", u"name", u"checksum"]
+DEPSCACHE_HEADER = [u"ruleset", u"name", u"entries"]
 
 
 def graphrules(db, config, args):
@@ -249,7 +261,8 @@ def _parse_depmake_cmdline(config, args):
                           " Sequence Executor (see '" + \
                           ise_cli.SEQEXEC_ACTION_NAME + "')")
 
-    add_options_to(parser, ['--out', '--depgraphto', '--docache'], config)
+    add_options_to(parser, ['--out', '--depgraphto', '--docache', '--jobs'],
+                   config)
     (options, action_args) = parser.parse_args(args)
     if len(action_args) < 2:
         parser.error(DEPMAKE_ACTION_NAME + \
@@ -292,6 +305,37 @@ def get_component_set_from(config, components_lists):
     return all_set
 
 
+def get_depsfinder_cache(config):
+    """
+    Return the DepsFinderCache specified by the given configuration
+    or None if no cache has been configured.
+    """
+    filename = replace_if_none(config.get(DEPMAKE_ACTION_NAME,
+                                          DEPSCACHE_FILE_NAME))
+    if filename is None:
+        return None
+    ttl = config.getint(DEPMAKE_ACTION_NAME, DEPSCACHE_TTL_NAME)
+    size = config.getint(DEPMAKE_ACTION_NAME, DEPSCACHE_SIZE_NAME)
+    return DepsFinderCache(to_str_from_unicode(filename), ttl, size)
+
+
+def get_filter_cache(config):
+    """
+    Return the FilterCache specified by the given configuration or
+    None if no cache has been configured.
+    """
+    filename = replace_if_none(config.get(DEPMAKE_ACTION_NAME,
+                                          FILTERCACHE_FILE_NAME))
+    if filename is None:
+        return None
+    ttl = config.getint(DEPMAKE_ACTION_NAME, FILTERCACHE_TTL_NAME)
+    exclude = replace_if_none(config.get(DEPMAKE_ACTION_NAME,
+                                         FILTERCACHE_EXCLUDE_NAME))
+    exclude = [] if exclude is None else [x.strip()
+                                          for x in exclude.split(',')]
+    return FilterCache(to_str_from_unicode(filename), ttl, exclude)
+
+
 def makedepgraph(config, rules, components_lists, options):
     """
     Return the dependency graph for the given pair ('req_ruleset',
@@ -303,7 +347,20 @@ def makedepgraph(config, rules, components_lists, options):
     force_rule = force_opt.split(',') if force_opt is not None else []
     docache = True if getattr(options, 'docache', 'yes') == 'yes' else False
     _LOGGER.debug("Caching filter results (docache) is: %s", docache)
-    depgraph = ruleset.get_depgraph(all_set, force_rule, docache)
+    jobs = getattr(options, 'jobs', 1)
+    _LOGGER.debug("Depsfinders and filters parallelism (jobs) is: %s", jobs)
+    cache = get_depsfinder_cache(config)
+    _LOGGER.debug("Depsfinder cache: %s", cache)
+    filter_cache = get_filter_cache(config) if docache else None
+    _LOGGER.debug("Filter cache: %s", filter_cache)
+    try:
+        depgraph = ruleset.get_depgraph(all_set, force_rule, docache, jobs,
+                                        cache, filter_cache)
+    finally:
+        if cache is not None:
+            cache.close()
+        if filter_cache is not None:
+            filter_cache.close()
     if _LOGGER.isEnabledFor(logging.DEBUG):
         _LOGGER.debug("Components set: %s",
                       NodeSet.fromlist([to_str_from_unicode(x.id) for x in all_set]))
@@ -703,3 +760,52 @@ def dbchecksum(db, config, args):
     _LOGGER.output(smart_display(CHECKSUM_HEADER,
                                  tab_values,
                                  vsep=u' | '))
+
+
+def depscache(db, config, args):
+    """
+    Display the depsfinder cache statistics or clear it.
+    """
+    usage = "%prog [options] depscache [ruleset [rule...]]"
+    doc = DEPSCACHE_DOC + ". Entries related to the given rules," + \
+        " or to all rules of the given ruleset, or all entries if no" + \
+        " ruleset is given are considered."
+    cmd = os.path.basename(sys.argv[0])
+    progname=to_unicode(cmd).encode('ascii', 'replace')
+    parser = optparse.OptionParser(usage, description=doc, prog=progname)
+    parser.add_option("-c", "--clear", dest="clear",
+                      action='store_true', default=False,
+                      help="Remove the specified entries from the cache.")
+    (options, action_args) = parser.parse_args(args)
+    cache = get_depsfinder_cache(config)
+    if cache is None:
+        _LOGGER.error(DEPSCACHE_ACTION_NAME + \
+                          ": no depsfinder cache configured (see '%s'" % \
+                          DEPSCACHE_FILE_NAME + \
+                          " in section '%s')" % DEPMAKE_ACTION_NAME)
+        return os.EX_CONFIG
+    ruleset = action_args[0] if len(action_args) > 0 else None
+    rulenames = action_args[1:]
+    try:
+        if options.clear:
+            count = cache.invalidate(ruleset, rulenames)
+            _LOGGER.output("%d entries removed." % count)
+            return os.EX_OK
+        count_for = cache.get_entries_count()
+        tab_values = []
+        for (ruleset_name, rulename) in sorted(count_for):
+            if ruleset is not None and \
+                    (ruleset_name != ruleset or \
+                         (len(rulenames) != 0 and rulename not in rulenames)):
+                continue
+            tab_values.append([ruleset_name, rulename,
+                               unicode(count_for[(ruleset_name, rulename)])])
+        _LOGGER.output(smart_display(DEPSCACHE_HEADER,
+                                     tab_values,
+                                     vsep=u' | '))
+        stats = cache.get_total_stats()
+        _LOGGER.output(", ".join("%s: %d" % (name, stats[name])
+                                 for name in STATS_NAMES))
+    finally:
+        cache.close()
+    return os.EX_OK
@@ -27,14 +27,18 @@ import os
 import re
 import shlex
 import subprocess
+import sys
+import threading
+import weakref
 from io import StringIO
+from multiprocessing.pool import ThreadPool
 
 from ClusterShell.NodeSet import NodeSet
 from sequencer.commons import CyclesDetectedError, substitute, get_version,\
                                 to_unicode, to_str_from_unicode
 from sequencer.dgm.errors import UnknownDepError
+from sequencer.graph import find_cycle, strongly_connected_components
 from sequencer.ise.rc import FORCE_ALWAYS, FORCE_NEVER
-from pygraph.algorithms.cycles import find_cycle
 from pygraph.classes.digraph import digraph
 
 
@@ -49,6 +53,17 @@ NONE = None
 ALL = 'ALL'
 FILTER_RE_OP = ['=~', '!~']
 NOT_FORCE_OP = '^'
+BATCH_PREFIX = 'batch:'
+PLUGIN_PREFIX = 'py:'
+
+# Mapping {(type, category): FullType} shared by living components:
+# entries are removed with the last component of their type (see
+# _get_fulltype())
+_FULLTYPES = weakref.WeakValueDictionary()
+
+# Mapping {'package.module:function': function} of loaded plugins
+_PLUGINS = dict()
+_PLUGINS_LOCK = threading.Lock()
 
 def _get_var_map(id_, name, type_, category, ruleset, rulename, help):
     """
@@ -65,6 +80,59 @@ def _get_var_map(id_, name, type_, category, ruleset, rulename, help):
 
 VARS = _get_var_map(None, None, None, None, None, None, None).keys()
 
+
+def _is_plugin(expression):
+    """
+    Return true if the given depsfinder or filter expression is a
+    plugin of the form: py:package.module:function [args...]
+    """
+    return expression is not None and expression.startswith(PLUGIN_PREFIX)
+
+
+def _get_plugin(spec):
+    """
+    Return the function specified by the given
+    'package.module:function' string. Functions are loaded once.
+    Raise ValueError if the function can't be loaded.
+    """
+    with _PLUGINS_LOCK:
+        function = _PLUGINS.get(spec)
+        if function is not None:
+            return function
+        (module_name, sep, function_name) = spec.rpartition(':')
+        if len(module_name) == 0 or len(function_name) == 0:
+            raise ValueError("Invalid plugin: %s. " % spec + \
+                                 "Use %spackage.module:function" % \
+                                 PLUGIN_PREFIX)
+        module_name = to_str_from_unicode(module_name, should_be_uni=True)
+        try:
+            __import__(module_name)
+            # Go through sys.modules to find modules inside packages
+            function = getattr(sys.modules[module_name],
+                               to_str_from_unicode(function_name,
+                                                   should_be_uni=True))
+        except (ImportError, AttributeError) as error:
+            raise ValueError("Can't load plugin %s: %s" % (spec, error))
+        _LOGGER.debug("Plugin %s loaded: %s", spec, function)
+        _PLUGINS[spec] = function
+        return function
+
+
+def _call_plugin(expression, var_map):
+    """
+    Call the plugin specified by the given expression of the form:
+
+    py:package.module:function [args...]
+
+    The function is called with the given var_map (see _get_var_map())
+    followed by the given args (where variables are substituted).
+    Return the function result.
+    """
+    fields = shlex.split(to_str_from_unicode(substitute(var_map, expression),
+                                             should_be_uni=True))
+    function = _get_plugin(to_unicode(fields[0][len(PLUGIN_PREFIX):]))
+    return function(var_map, *[to_unicode(arg) for arg in fields[1:]])
+
 class FullType(object):
     """
     Implementation of a type of the form: type@category
@@ -104,6 +172,51 @@ class FullType(object):
         return self.type.__hash__() + self.category.__hash__()
 
 
+class TypeIndex(object):
+    """
+    An index of values (usually rules) by (type, category), ALL
+    wildcards included. It is built from an iterable of (FullType,
+    value) pairs. Finding the values whose type matches a component
+    is then a few dictionary lookups (see lookup()).
+    """
+
+    def __init__(self, pairs):
+        self._values_for = dict()
+        for (fulltype, value) in pairs:
+            key = (fulltype.type, fulltype.category)
+            self._values_for.setdefault(key, set()).add(value)
+        # Mapping {(component.type, component.category): values}
+        self._lookup_cache = dict()
+
+    @classmethod
+    def from_rules(cls, rules):
+        """
+        Return the index of the given rules by their types.
+        """
+        return cls((fulltype, rule) for rule in rules \
+                       for fulltype in rule.types.values())
+
+    def lookup(self, component):
+        """
+        Return the set of values whose type matches the given
+        component.
+        """
+        key = (component.type, component.category)
+        result = self._lookup_cache.get(key)
+        if result is None:
+            result = set()
+            for candidate in (key,
+                              (component.type, ALL),
+                              (ALL, component.category),
+                              (ALL, ALL)):
+                values = self._values_for.get(candidate)
+                if values is not None:
+                    result.update(values)
+            result = frozenset(result)
+            self._lookup_cache[key] = result
+        return result
+
+
 def _is_all_filter(filter_):
     """
     Return true if the given filter is the special 'ALL' filter
@@ -129,6 +242,13 @@ class AbstractFilter(object):
         """
         raise NotImplementedError("Subclasses should implement this method")
 
+    def filter_all(self, components):
+        """
+        Return the list of the given components that pass this filter.
+        """
+        return [component for component in components \
+                    if self.filter(component)]
+
 class AllFilter(AbstractFilter):
     """
     This implementation always returns True.
@@ -136,6 +256,9 @@ class AllFilter(AbstractFilter):
     def filter(self, component):
         return True
 
+    def filter_all(self, components):
+        return list(components)
+
 class NoneFilter(AbstractFilter):
     """
     This implementation always returns False.
@@ -143,11 +266,16 @@ class NoneFilter(AbstractFilter):
     def filter(self, component):
         return False
 
+    def filter_all(self, components):
+        return []
+
 class CacheFilter(AbstractFilter):
     def __init__(self):
         AbstractFilter.__init__(self)
         self._cache = dict()
         self.docache = True
+        # Persistent store of decisions (see sequencer.dgm.cache.FilterCache)
+        self.store = None
 
     def filter(self, component):
         """
@@ -162,7 +290,10 @@ class CacheFilter(AbstractFilter):
                     _LOGGER.debug("Component %s found in cache, returning %s",
                                   component.id, result)
             else:
-                result = self._filter_impl(component)
+                result = self._load(component)
+                if result is None:
+                    result = self._filter_impl(component)
+                    self._save(component, result)
                 self._cache[component.id] = result
                 if _LOGGER.isEnabledFor(DEBUG):
                     _LOGGER.debug("Component %s not found in cache, storing %s",
@@ -170,12 +301,78 @@ class CacheFilter(AbstractFilter):
             return result
         return self._filter_impl(component)
 
+    def filter_all(self, components):
+        """
+        Perform caching before calling _filter_all_impl() on
+        components not found in the cache if self.docache is True.
+        """
+        if not self.docache:
+            return self._filter_all_impl(components)
+        result = []
+        uncached = []
+        for component in components:
+            decision = self._cache.get(component.id)
+            if decision is None:
+                decision = self._load(component)
+                if decision is not None:
+                    self._cache[component.id] = decision
+            if decision is None:
+                uncached.append(component)
+            elif decision:
+                result.append(component)
+        if len(uncached) != 0:
+            accepted = self._filter_all_impl(uncached)
+            accepted_ids = set(component.id for component in accepted)
+            for component in uncached:
+                decision = component.id in accepted_ids
+                self._cache[component.id] = decision
+                self._save(component, decision)
+            result.extend(accepted)
+        return result
+
+    def get_expression(self):
+        """
+        Return the expression that identifies this filter in the
+        persistent store or None if decisions of this filter should
+        not be stored (the default).
+        """
+        return None
+
+    def _load(self, component):
+        """
+        Return the decision found in the persistent store for the
+        given component or None.
+        """
+        expression = self.get_expression() if self.store is not None else None
+        if expression is None:
+            return None
+        return self.store.get(expression, component)
+
+    def _save(self, component, decision):
+        """
+        Store the given decision for the given component in the
+        persistent store if any.
+        """
+        expression = self.get_expression() if self.store is not None else None
+        if expression is not None:
+            self.store.put(expression, component, decision)
+
     def _filter_impl(self, component):
         """
         Subclasses should implement this function
         """
         raise NotImplementedError("Subclasses should implement this method")
 
+    def _filter_all_impl(self, components):
+        """
+        Return the list of the given components that pass this
+        filter. Subclasses may redefine this function when filtering
+        many components at once is cheaper than filtering them one by
+        one.
+        """
+        return [component for component in components \
+                    if self._filter_impl(component)]
+
 class ReFilter(CacheFilter):
     """
     This class implements a filter of the following forms:
@@ -207,6 +404,18 @@ class ReFilter(CacheFilter):
         match = re.match(self.pattern, var_value)
         return (match and self.eq == '=~') or (not match and self.eq == '!~')
 
+def _get_rule_expression(rule, expression):
+    """
+    Return the given expression of the given rule where only variables
+    that do not depend on a component are substituted.
+    """
+    var_map = _get_var_map(None, None, None, None,
+                           rule.ruleset,
+                           rule.name,
+                           rule.help)
+    var_map = dict((k, v) for (k, v) in var_map.items() if v is not None)
+    return substitute(var_map, expression)
+
 class ScriptFilter(CacheFilter):
     """
     This class implements a script filter.
@@ -215,6 +424,9 @@ class ScriptFilter(CacheFilter):
         CacheFilter.__init__(self)
         self.rule = rule
 
+    def get_expression(self):
+        return _get_rule_expression(self.rule, self.rule.filter)
+
     def _filter_impl(self, component):
         var_map = _get_var_map(component.id,
                                component.name,
@@ -254,28 +466,141 @@ class ScriptFilter(CacheFilter):
 
         return popen.returncode == os.EX_OK
 
+class PluginFilter(CacheFilter):
+    """
+    This class implements an in-process filter of the form:
+
+    py:package.module:function [args...]
 
-def _find_match(rules, components):
+    The function is called with the variables mapping (see
+    _get_var_map()) followed by the given args and should return
+    True if the component is filtered in.
+    """
+    def __init__(self, rule):
+        CacheFilter.__init__(self)
+        self.rule = rule
+
+    def _filter_impl(self, component):
+        var_map = _get_var_map(component.id,
+                               component.name,
+                               component.type,
+                               component.category,
+                               self.rule.ruleset,
+                               self.rule.name,
+                               self.rule.help)
+        _LOGGER.debug("%s: calling filter plugin: %s",
+                      self.rule.name, self.rule.filter)
+        try:
+            return bool(_call_plugin(self.rule.filter, var_map))
+        # Any error raised by the plugin is reported as a filter error
+        except Exception as error:
+            _LOGGER.error("%s: error when applying filter plugin " + \
+                              "%s to component %s: %s",
+                          self.rule.name, self.rule.filter,
+                          component, error)
+            return False
+
+class BatchScriptFilter(CacheFilter):
+    """
+    This class implements a script filter called once for many
+    components. The filter is of the form:
+
+    batch: /usr/bin/my_filter %rulename
+
+    Components ids are given on the standard input of the command,
+    one per line. The command returns the ids of the accepted
+    components on its standard output, one per line.
+    """
+    def __init__(self, rule):
+        CacheFilter.__init__(self)
+        self.rule = rule
+
+    def get_expression(self):
+        return _get_rule_expression(self.rule, self.rule.filter)
+
+    def _filter_impl(self, component):
+        return len(self._filter_all_impl([component])) != 0
+
+    def _filter_all_impl(self, components):
+        cmd_string = _get_rule_expression(self.rule,
+                                          self.rule.filter[len(BATCH_PREFIX):]\
+                                              .strip())
+        cmd = shlex.split(to_str_from_unicode(cmd_string, should_be_uni=True))
+        _LOGGER.debug("%s: calling batch filter cmd on %d components: %s",
+                      self.rule.name, len(components), cmd)
+        try:
+            popen = subprocess.Popen(cmd,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     bufsize=-1) # Use system default
+        except OSError as ose:
+            _LOGGER.error("%s: can't call filter '%s': %s",
+                          self.rule.name, cmd_string, ose)
+            return []
+
+        ids = u"".join(component.id + u"\n" for component in components)
+        (msg_std, msg_err) = popen.communicate(to_str_from_unicode(ids))
+        msg_std = msg_std.strip()
+        msg_err = msg_err.strip()
+        if len(msg_err) != 0:
+            _LOGGER.warning("%s: error when applying filter command " + \
+                                "%s to %d components: %s",
+                            self.rule.name, cmd_string,
+                            len(components), msg_err)
+        _LOGGER.debug("%s: filter command: %s RC: %d",
+                      self.rule.name,
+                      cmd_string,
+                      popen.returncode)
+        if popen.returncode != os.EX_OK:
+            _LOGGER.error("%s: filter command %s failed (RC: %d):" + \
+                              " all components filtered out",
+                          self.rule.name, cmd_string, popen.returncode)
+            return []
+        accepted = set()
+        with StringIO(to_unicode(msg_std)) as reader:
+            for line in reader:
+                id_ = line.strip()
+                if len(id_) != 0:
+                    accepted.add(id_)
+        return [component for component in components \
+                    if component.id in accepted]
+
+
+def _find_match(index, components, rules=None, deferred=None):
     """
     Returns a mapping {component.id: (rule, ..., )} representing rules
-    that should be applied to each component
+    that should be applied to each component. Rules are taken from
+    the given TypeIndex, restricted to the given rules if not None.
+
+    When 'deferred' is a mapping, rules with a batch filter are not
+    applied: they are kept in the result for each of their candidates,
+    which are appended to deferred[rule] (see DepGraph._prefetch()).
     """
-    result = {}
+    candidates_for = dict()
     for component in components:
-        for rule in rules:
-            if rule.match_type(component):
-                if rule.pass_filter(component):
-                    #test_unicode("%s" % component, False, 'FIND_MATCH')
-                    _LOGGER.debug("Component %s has been" + \
-                                  " filtered in by rule %s ",
-                                  component, rule)
-                    ruleset = result.get(component.id, set())
-                    ruleset.add(rule)
-                    result[component.id] = ruleset
-                else:
-                    _LOGGER.info("Component %s has been" + \
-                                 " filtered out by rule %s ",
-                                 component, rule)
+        for rule in index.lookup(component):
+            if rules is None or rule in rules:
+                candidates_for.setdefault(rule, []).append(component)
+    result = {}
+    for (rule, candidates) in candidates_for.iteritems():
+        if deferred is not None and rule.batch_filter:
+            deferred.setdefault(rule, []).extend(candidates)
+            for component in candidates:
+                result.setdefault(component.id, set()).add(rule)
+            continue
+        accepted = set(component.id for component in \
+                           rule.pass_filter_all(candidates))
+        for component in candidates:
+            if component.id in accepted:
+                _LOGGER.debug("Component %s has been" + \
+                              " filtered in by rule %s ",
+                              component, rule)
+                result.setdefault(component.id, set()).add(rule)
+            else:
+                _LOGGER.info("Component %s has been" + \
+                             " filtered out by rule %s ",
+                             component, rule)
     return result
 
 def _update_graph_with_node(graph, node):
@@ -333,8 +658,15 @@ class Rule(object):
             self.types[type_] = FullType(type_)
         self.filter = filter_
         self._filter_impl = self._get_filter_impl_from(filter_)
+        # A filter prefixed by 'batch:' is called once for many
+        # components (see DepGraph._prefetch())
+        self.batch_filter = isinstance(self._filter_impl, BatchScriptFilter)
         self.action = action
         self.depsfinder = depsfinder
+        # A depsfinder prefixed by 'batch:' is called once for many
+        # components (see DepGraph._call_batch_depsfinder())
+        self.batch_depsfinder = depsfinder is not None and \
+            depsfinder.startswith(BATCH_PREFIX)
         # if None convert to an empty set to prevent special case treatment.
         self.dependson = set() if dependson is None else set(dependson)
         self.comments = comments
@@ -372,6 +704,10 @@ class Rule(object):
             return AllFilter()
         if _is_none_filter(filter_):
             return NoneFilter()
+        if filter_.startswith(BATCH_PREFIX):
+            return BatchScriptFilter(self)
+        if _is_plugin(filter_):
+            return PluginFilter(self)
         for var in VARS:
             # The filter starts with a known variable: it is a regexp
             # We try to look after a string that looks like:
@@ -387,11 +723,13 @@ class Rule(object):
                 return ReFilter(self, var, eq, match.group(3))
         return ScriptFilter(self)
 
-    def set_filter_caching_policy(self, docache):
+    def set_filter_caching_policy(self, docache, store=None):
         """
-        Specifies filter caching policy
+        Specifies filter caching policy and the persistent store of
+        filter decisions (if any).
         """
         self._filter_impl.docache = docache
+        self._filter_impl.store = store
 
 
     def pass_filter(self, component):
@@ -401,6 +739,13 @@ class Rule(object):
         """
         return self._filter_impl.filter(component)
 
+    def pass_filter_all(self, components):
+        """
+        Return the list of the given components that pass this rule
+        filter.
+        """
+        return self._filter_impl.filter_all(components)
+
 class RuleSet(object):
     """
     Represents a set of rules in the dependency table.
@@ -415,6 +760,11 @@ class RuleSet(object):
         self._make_graph()
         self._check_deps()
         self.root_rules_for = self._compute_root_rules_mapping()
+        # Indexes used to match components against rules and root rules
+        self.type_index = TypeIndex.from_rules(self.rules)
+        self._root_index = TypeIndex((FullType(fulltype), rule) \
+                                     for fulltype in self.root_rules_for \
+                                     for rule in self.root_rules_for[fulltype])
         if self.name is not None:
             _LOGGER.debug("root_rules mapping for %s is: %s",
                           self.name, ", ".join(self.root_rules_for))
@@ -467,62 +817,85 @@ class RuleSet(object):
         """
         return self.dag
 
-    def get_depgraph(self, components, force_rule=list(), docache=True):
+    def get_depgraph(self, components, force_rule=list(), docache=True,
+                     jobs=1, cache=None, filter_cache=None):
         """
         Return a DepGraph instance representing the components
         dependency graph.
         """
-        depgraph = DepGraph(self, components, force_rule, docache)
+        depgraph = DepGraph(self, components, force_rule, docache, jobs,
+                            cache, filter_cache)
         return depgraph
 
-    def _compute_root_rules_mapping(self, types=None):
+    def _compute_root_rules_mapping(self):
         """
         Compute the root rules mapping, i.e. the set of rules that
         will be applied to a component given on the command line
         (the initial set).
 
+        The rules graph is condensed into its strongly connected
+        components: rules of a cycle (such as TALIM -> TALIM or TALIM
+        -> ETH Switch -> TALIM) are considered together. Components
+        are then considered layer after layer (Kahn's algorithm): the
+        first layer is made of rules no rule of another component
+        depends on, the next one of rules only the previous layers
+        depend on, and so on. A type is mapped to the rules of the
+        first layer it appears in.
+
         The result is a mapping {fulltype : [rule1, rule2, ..., ruleN]}
         """
-        if types is None:
-            types = dict()
-        roots = set()
+        types = dict()
 
-        def _update_types(rules):
+        def _update_types(layer):
             """
-            Update the result types for the given set of rules.
+            Update the result types for the given layer of rules.
             """
-            for rule in rules:
+            for rule in layer:
                 for type_ in rule.types:
                     # Check wether other root rules are available
                     # for type_ or if the current rule is not a
                     # real root rule (another parent rule already
                     # matched)
-                    if type_ in types and not types[type_].issubset(rules):
+                    if type_ in types and not types[type_].issubset(layer):
                         _LOGGER.debug("Type %s is already mapped" + \
                                       " skipping rule %s",
                                       type_, rule.name)
                     else:
                         _LOGGER.debug("Adding rule %s to type %s",
                                       rule.name, type_)
-                        rules = types.setdefault(type_, set())
-                        rules.add(rule)
-
-        # Finding roots in the graph
+                        types.setdefault(type_, set()).add(rule)
+
+        components = strongly_connected_components(self.dag)
+        component_of = dict()
+        for (i, component) in enumerate(components):
+            if len(component) > 1:
+                _LOGGER.debug("Cycle found: %s are potential roots" + \
+                                  " together", ", ".join(component))
+            for rulename in component:
+                component_of[rulename] = i
+        # Number of rules of other components depending on the rules
+        # of a given component
+        incidents_nb = [0] * len(components)
         for rule in self.rules:
-            if len(self.dag.incidents(rule.name)) == 0:
-                roots.add(rule)
-
-        if len(roots) == 0:
-            if len(self.rules) == 0:
-                return types
-            _LOGGER.debug("Cycle found: any rule is a potential root")
-            _update_types(self.rules)
-            return types
-        # We do have roots
-        _update_types(roots)
-        # Remove roots, and start again
-        new_ruleset = RuleSet(self.rules - roots)
-        return new_ruleset._compute_root_rules_mapping(types)
+            for dep_rule in rule.dependson:
+                if component_of[dep_rule] != component_of[rule.name]:
+                    incidents_nb[component_of[dep_rule]] += 1
+
+        layer = [i for i in xrange(len(components)) if incidents_nb[i] == 0]
+        while len(layer) != 0:
+            rules = set(self.rules_for[rulename]
+                        for i in layer for rulename in components[i])
+            _update_types(rules)
+            layer = []
+            for rule in rules:
+                for dep_rule in rule.dependson:
+                    i = component_of[dep_rule]
+                    if i == component_of[rule.name]:
+                        continue
+                    incidents_nb[i] -= 1
+                    if incidents_nb[i] == 0:
+                        layer.append(i)
+        return types
 
     def _find_roots(self, components):
         """
@@ -549,17 +922,37 @@ class RuleSet(object):
 
         roots = set()
         for component in components:
-            for fulltype in self.root_rules_for:
-                if FullType(fulltype).match(component):
-                    roots.update(self.root_rules_for[fulltype])
+            roots.update(self._root_index.lookup(component))
+
+        return _find_match(self.type_index, components, roots)
+
+def _get_fulltype(type_, category):
+    """
+    Return the FullType shared by all components of the given type
+    and category. Its type and category strings are shared too
+    (intern() does not accept unicode).
+    """
+    key = (type_, category)
+    fulltype = _FULLTYPES.get(key)
+    if fulltype is None:
+        fulltype = _FULLTYPES.setdefault(key,
+                                         FullType(type_ + '@' + category))
+    return fulltype
 
-        return _find_match(roots, components)
 
 class Component(object):
     """
     A component is defined from a string of the form: name#type@cat
     Both name and type are mandatory.
+
+    Type and category strings and the FullType are shared between
+    components. Actions are not stored in the component: they are
+    the attributes of its node in the dependency graph it belongs to
+    (see the 'actions' property). A component belongs to the first
+    DepGraph it is registered in: other graphs register a copy of it
+    (see DepGraph._register()).
     """
+    __slots__ = ('id', 'name', 'type', 'category', 'fulltype', '_dag')
 
     def __init__(self, *args):
         if len(args) == 1:
@@ -592,8 +985,21 @@ class Component(object):
             raise ValueError("Wrong number of arguments: %d. Expecting: %d" %\
                                  (len(args), 3))
 
-        self.fulltype = FullType(self.type + '@' + self.category)
-        self.actions = {}
+        self.fulltype = _get_fulltype(self.type, self.category)
+        self.type = self.fulltype.type
+        self.category = self.fulltype.category
+        # Set by the DepGraph this component belongs to
+        self._dag = None
+
+    @property
+    def actions(self):
+        """
+        The mapping {rule_name: action} of actions of this component
+        (taken from its node attributes in the dependency graph).
+        """
+        if self._dag is None or not self._dag.has_node(self.id):
+            return {}
+        return dict(self._dag.node_attributes(self.id))
 
     def __eq__(self, other):
         return self.id == other.id
@@ -607,7 +1013,9 @@ class Component(object):
         #return "%s" % to_str_from_unicode(self.id, should_be_uni=True)
 
     def __repr__(self):
-        return "%s(%r)" % (self.__class__, self.__dict__)
+        return "%s(%r)" % (self.__class__,
+                           dict((name, getattr(self, name)) \
+                                    for name in self.__slots__))
 
 
 class DepGraph(object):
@@ -620,17 +1028,52 @@ class DepGraph(object):
 
     'components_map': a mapping 'id': Component instance of all
     components in the dependency graph
+
+    When 'jobs' is greater than 1, depsfinders (and the filters of the
+    rules they lead to) are called concurrently, 'jobs' at a time, on
+    the whole discovery frontier before rules are actually
+    applied. The resulting graph is the same as with 'jobs' = 1.
+
+    The same discovery is done whatever 'jobs' is when at least one
+    rule has a batch depsfinder or a batch filter: such a depsfinder
+    or filter is called once per discovery wave with all the
+    components it has to be applied to.
+
+    When 'cache' is given (see sequencer.dgm.cache.DepsFinderCache),
+    depsfinder results are taken from it whenever possible.
+
+    When 'filter_cache' is given (see sequencer.dgm.cache.FilterCache),
+    script filter decisions are taken from and stored into it, unless
+    'docache' is False. Decisions of the rules it does not accept are
+    not stored: they are only cached during this computation, as any
+    decision when 'docache' is True.
     """
     def __init__(self, ruleset, requested_components,
-                 force_rule=list(), docache=True):
+                 force_rule=list(), docache=True, jobs=1, cache=None,
+                 filter_cache=None):
         self.remaining_components = requested_components
         self.ruleset = ruleset
         self.dag = digraph()
         self.components_map = dict()
         self.force_for_rule = dict()
+        self.jobs = jobs
+        self.cache = cache
+        self._has_batch = any(rule.batch_depsfinder or rule.batch_filter
+                              for rule in self.ruleset.rules_for.values())
+        # Mapping {(component.id, rule.name): (deps, rules_for)}
+        # filled by _prefetch()
+        self._prefetched = dict()
+        # Mapping {rule.name: TypeIndex of rule.dependson}
+        self._deps_index_for = dict()
+        # Set of (component.id, rule.name) already applied
+        self._applied = set()
         # Set each filter 'docache'' to their specified value
         for rule in self.ruleset.rules_for.values():
-            rule.set_filter_caching_policy(docache)
+            store = None
+            if docache and filter_cache is not None and \
+                    filter_cache.accepts(rule):
+                store = filter_cache
+            rule.set_filter_caching_policy(docache, store)
         for rulename in force_rule:
             mode = FORCE_ALWAYS
             if rulename[0] == NOT_FORCE_OP:
@@ -654,7 +1097,7 @@ class DepGraph(object):
         # graph.
         for component in self.remaining_components:
             self.dag.add_node(component.id)
-            self.components_map[component.id] = component
+            self._register(component)
 
         # For each requested nodes
         while (len(self.remaining_components) != 0):
@@ -665,6 +1108,8 @@ class DepGraph(object):
                 _LOGGER.debug("No roots found. Stopping.")
                 break
             _LOGGER.debug("Roots found: %s", ",".join(roots))
+            if self.jobs > 1 or self._has_batch:
+                self._prefetch(roots)
             for component_id in roots:
                 component = self.components_map[component_id]
                 self.remaining_components.remove(component)
@@ -674,22 +1119,45 @@ class DepGraph(object):
 
     def _apply(self, rule, component):
         """
-        Application of a rule to a component
+        Application of a rule to a component, and of the rules it
+        leads to on its dependencies, using an explicit stack of
+        _expand() generators (the depth of the graph is therefore not
+        limited by the interpreter recursion limit).
         """
-        # Find out if the rule has already been applied to the given
-        # component
-
-        attributes = self.dag.node_attributes(component.id)
-        for (rulename, action) in attributes:
-            last_rule_char = rulename.rfind('?')
-            if last_rule_char != -1:
-                rulename = rulename[0:last_rule_char]
-            if rulename == rule.name:
-                _LOGGER.debug("Rule %s already applied to %s." + \
+        if not self._mark_applied(rule, component):
+            return
+        stack = [self._expand(rule, component)]
+        while len(stack) != 0:
+            try:
+                (dep_rule, dependency) = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if self._mark_applied(dep_rule, dependency):
+                stack.append(self._expand(dep_rule, dependency))
+
+    def _mark_applied(self, rule, component):
+        """
+        Return False if the given rule has already been applied (or
+        is being applied) to the given component. Otherwise, record
+        it as applied and return True.
+        """
+        key = (component.id, rule.name)
+        if key in self._applied:
+            _LOGGER.debug("Rule %s already applied to %s." + \
                               " Application skipped",
-                              rule.name, component)
-                return
+                          rule.name, component)
+            return False
+        self._applied.add(key)
+        return True
 
+    def _expand(self, rule, component):
+        """
+        Generator that applies the given rule to the given component:
+        it yields each (dep_rule, dependency) pair that should be
+        applied first and resumes once it has been. The component is
+        updated with its action after all its dependencies.
+        """
         # Fetch all dependencies of the component first!
         rules_for = self._get_deps(component, rule)
         for id_ in rules_for:
@@ -701,13 +1169,32 @@ class DepGraph(object):
             for dep_rule in rules_for[id_]:
                 # For each rule applicable to the dependency, applies
                 # it.
-                self._apply(dep_rule, self.components_map[id_])
+                yield (dep_rule, self.components_map[id_])
                 edge_label.append(dep_rule.name)
             self.dag.set_edge_label(edge, ", ".join(edge_label))
 
         # All dependencies have been treated, update the component.
         self._update_from(rule, component)
 
+    def _register(self, component):
+        """
+        Register the given component in this graph components_map
+        (unless a component with the same id is already registered)
+        and return the registered one.
+
+        A component that already belongs to another graph is not
+        modified: a copy of it is registered, so that its actions in
+        that graph remain the same.
+        """
+        registered = self.components_map.get(component.id)
+        if registered is not None:
+            return registered
+        if component._dag is not None and component._dag is not self.dag:
+            component = Component(component.id)
+        component._dag = self.dag
+        self.components_map[component.id] = component
+        return component
+
     def _update_from(self, rule, component):
         """
         Update the component with its action. Substitution of
@@ -732,23 +1219,210 @@ class DepGraph(object):
             key += '?force=' + force
         if action is not None:
             self.dag.add_node_attribute(component.id, (key, action))
-            component.actions[key] = action
 
-    def _get_deps(self, component, rule):
+    def _prefetch(self, roots):
         """
-        Find dependencies of a given component. This implies calling
-        the rule.depsfinder script. Substitution of variables is done.
-        Returns None if the given rule has already been applied on
-        the given component.
+        Call depsfinders of each (component, rule) pair reachable from
+        the given roots mapping, wave after wave, using a pool of
+        self.jobs workers. Each wave is the set of pairs discovered
+        by the previous one. Pairs sharing the same rule with a batch
+        depsfinder are grouped into a single call. Batch filters are
+        called once per rule for the whole wave.
+
+        Results are stored so that _get_deps() does not have to call
+        anything when rules are applied afterwards.
+        """
+        pending = set()
+        for component_id in roots:
+            for rule in roots[component_id]:
+                pending.add((component_id, rule.name))
+        visited = set()
+        pool = ThreadPool(self.jobs)
+        try:
+            while len(pending) != 0:
+                visited.update(pending)
+                _LOGGER.debug("Prefetching dependencies of %d" + \
+                                  " (component, rule) pairs", len(pending))
+                wave = self._make_wave(pending)
+                results = pool.map(self._prefetch_deps, wave)
+                rejected = self._apply_batch_filters([x[1] for x in results])
+                pending = set()
+                for (key, (deps, rules_for)) in [x for (batch, _) in results
+                                                 for x in batch]:
+                    if len(rejected) != 0:
+                        rules_for = self._without_rejected(rules_for,
+                                                           rejected)
+                    self._prefetched[key] = (deps, rules_for)
+                    for dependency in deps:
+                        self._register(dependency)
+                    for id_ in rules_for:
+                        for dep_rule in rules_for[id_]:
+                            key = (id_, dep_rule.name)
+                            if key not in visited:
+                                pending.add(key)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _make_wave(self, pairs):
+        """
+        Return the list of (rule, [component, ...]) work items for the
+        given set of (component.id, rule.name) pairs. Components are
+        grouped for rules having a batch depsfinder.
+        """
+        wave = []
+        batches = dict()
+        for (component_id, rulename) in pairs:
+            rule = self.ruleset.rules_for[rulename]
+            component = self.components_map[component_id]
+            if rule.batch_depsfinder:
+                batches.setdefault(rule, []).append(component)
+            else:
+                wave.append((rule, [component]))
+        wave.extend(batches.items())
+        return wave
+
+    def _apply_batch_filters(self, deferreds):
+        """
+        Apply batch filters deferred by _prefetch_deps(): the filter of
+        each rule in the given {rule: [component, ...]} mappings is
+        called once with all its candidates. Return the set of
+        (component.id, rule.name) pairs filtered out.
+        """
+        candidates_for = dict()
+        for deferred in deferreds:
+            for (rule, candidates) in deferred.iteritems():
+                by_id = candidates_for.setdefault(rule, dict())
+                for component in candidates:
+                    by_id.setdefault(component.id, component)
+        rejected = set()
+        for (rule, by_id) in candidates_for.iteritems():
+            accepted = set(component.id for component in \
+                               rule.pass_filter_all(by_id.values()))
+            for id_ in by_id:
+                if id_ in accepted:
+                    _LOGGER.debug("Component %s has been" + \
+                                      " filtered in by rule %s ", id_, rule)
+                else:
+                    _LOGGER.info("Component %s has been" + \
+                                     " filtered out by rule %s ", id_, rule)
+                    rejected.add((id_, rule.name))
+        return rejected
+
+    def _without_rejected(self, rules_for, rejected):
+        """
+        Return the given {component.id: set(rule, ...)} mapping without
+        the (component.id, rule.name) pairs in the given rejected set.
         """
         result = dict()
+        for (id_, rules) in rules_for.iteritems():
+            kept = set(rule for rule in rules \
+                           if (id_, rule.name) not in rejected)
+            if len(kept) != 0:
+                result[id_] = kept
+        return result
+
+    def _prefetch_deps(self, item):
+        """
+        Worker function used by _prefetch(): return the tuple (items,
+        deferred) for the given (rule, [component, ...]) work item
+        where items is the list of ((component.id, rule.name), (deps,
+        rules_for)) and deferred the {rule: [component, ...]} mapping of
+        the batch filters still to apply (see _find_match()). The
+        components_map is not modified here.
+        """
+        (rule, components) = item
+        deferred = dict()
+        deps_for = self._find_deps(components, rule)
+        if deps_for is None:
+            return ([((component.id, rule.name), (set(), dict()))
+                     for component in components], deferred)
+        # Dependencies of all components are matched at once so that
+        # batch filters are called once for the whole work item.
+        created = dict()
+        deps_of = dict()
+        for component in components:
+            deps = set()
+            for dep_id in deps_for[component.id]:
+                dependency = self.components_map.get(dep_id)
+                if dependency is None:
+                    dependency = created.setdefault(dep_id, Component(dep_id))
+                deps.add(dependency)
+            deps_of[component.id] = deps
+        all_rules_for = self._match_deps(rule,
+                                         set().union(*deps_of.values()),
+                                         deferred)
+        result = []
+        for component in components:
+            deps = deps_of[component.id]
+            rules_for = dict((dep.id, all_rules_for[dep.id]) for dep in deps \
+                                 if dep.id in all_rules_for)
+            result.append(((component.id, rule.name), (deps, rules_for)))
+        return (result, deferred)
+
+    def _match_deps(self, rule, deps, deferred=None):
+        """
+        Return the rules that should be applied to the given
+        dependencies of a component for the given rule. See
+        _find_match() for 'deferred'.
+        """
+        # Find match only on rule.dependson
+        index = self._deps_index_for.get(rule.name)
+        if index is None:
+            index = TypeIndex.from_rules([self.ruleset.rules_for[x] \
+                                              for x in rule.dependson])
+            self._deps_index_for[rule.name] = index
+        return _find_match(index, deps, deferred=deferred)
+
+    def _find_deps(self, components, rule):
+        """
+        Return the mapping {component.id: [dep_id, ...]} of the
+        dependency ids of each given component for the given rule or
+        None if the rule does not specify any depsfinder.
+
+        Dependencies are taken from self.cache when available. Others
+        are computed by the rule.depsfinder and stored in the cache
+        if the depsfinder did not fail.
+        """
         depsfinder = rule.depsfinder
         if rule.dependson is None or len(rule.dependson) == 0 or \
                 depsfinder is None or len(depsfinder) == 0:
             _LOGGER.debug("No 'DepsFinder' or 'DependsOn' specified" + \
-                              " in rule %s for component %s. Skipping.",
-                          rule, component)
+                              " in rule %s. Skipping.", rule)
+            return None
+        result = dict()
+        missing = []
+        for component in components:
+            dep_ids = None if self.cache is None \
+                else self.cache.get(rule, component)
+            if dep_ids is None:
+                missing.append(component)
+            else:
+                _LOGGER.debug("Dependencies of component %s for rule %s" + \
+                                  " found in cache", component, rule)
+                result[component.id] = dep_ids
+        if len(missing) == 0:
             return result
+        if rule.batch_depsfinder:
+            (found, succeeded) = self._call_batch_depsfinder(missing, rule)
+        else:
+            (dep_ids, succeeded) = self._call_depsfinder(missing[0], rule)
+            found = {missing[0].id: dep_ids}
+        for component in missing:
+            dep_ids = found.get(component.id, [])
+            result[component.id] = dep_ids
+            if succeeded and self.cache is not None:
+                self.cache.put(rule, component, dep_ids)
+        return result
+
+    def _call_depsfinder(self, component, rule):
+        """
+        Call the rule.depsfinder script for the given
+        component. Substitution of variables is done. Returns the
+        tuple (dep_ids, succeeded) where dep_ids is the list of
+        dependency ids and succeeded is False if the depsfinder could
+        not be called or returned an error.
+        """
         var_map = _get_var_map(component.id,
                                component.name,
                                component.type,
@@ -756,7 +1430,9 @@ class DepGraph(object):
                                self.ruleset.name,
                                rule.name,
                                rule.help)
-        cmd = substitute(var_map, depsfinder)
+        if _is_plugin(rule.depsfinder):
+            return self._call_plugin_depsfinder(component, rule, var_map)
+        cmd = substitute(var_map, rule.depsfinder)
         _LOGGER.debug("Calling depsfinder for component %s: %s", component, cmd)
         popen_args = shlex.split(to_str_from_unicode(cmd, should_be_uni=True))
         try:
@@ -766,7 +1442,7 @@ class DepGraph(object):
                                      bufsize=-1) # Use system default
         except OSError as ose:
             _LOGGER.error("Can't call depsfinder '%s': %s", cmd, ose)
-            return result
+            return ([], False)
 
         (msg_std, msg_err) = popen.communicate()
         msg_std = msg_std.strip()
@@ -775,27 +1451,115 @@ class DepGraph(object):
             _LOGGER.warning("Depsfinder error when " + \
                                 "applying rule %s to component %s: %s",
                             rule, component, msg_err)
-        deps = set()
+        result = []
         with StringIO(to_unicode(msg_std)) as reader:
             for dep in reader:
                 dep_id = dep.strip()
                 if len(dep_id) == 0:
                     continue
+                result.append(dep_id)
+        return (result, popen.returncode == os.EX_OK and len(msg_err) == 0)
+
+    def _call_plugin_depsfinder(self, component, rule, var_map):
+        """
+        Call the rule.depsfinder plugin for the given component (see
+        _call_plugin()). The plugin should return an iterable of
+        dependency ids. Returns the tuple (dep_ids, succeeded).
+        """
+        _LOGGER.debug("Calling depsfinder plugin for component %s: %s",
+                      component, rule.depsfinder)
+        try:
+            result = [to_unicode(dep_id).strip()
+                      for dep_id in _call_plugin(rule.depsfinder, var_map)]
+        # Any error raised by the plugin is reported as a depsfinder error
+        except Exception as error:
+            _LOGGER.error("Depsfinder plugin error when " + \
+                              "applying rule %s to component %s: %s",
+                          rule, component, error)
+            return ([], False)
+        return ([dep_id for dep_id in result if len(dep_id) != 0], True)
+
+    def _call_batch_depsfinder(self, components, rule):
+        """
+        Call the rule.depsfinder script (without its 'batch:' prefix)
+        once for all the given components. Only %ruleset and
+        %rulename are substituted. Component ids are given on the
+        standard input, one per line. Each line of the standard output
+        should be of the form:
+
+        component_id dep_id1 dep_id2 ...
+
+        Returns the tuple (deps_for, succeeded) where deps_for is the
+        mapping {component.id: [dep_id, ...]} and succeeded is False
+        if the depsfinder could not be called or returned an error.
+        """
+        cmd = _get_rule_expression(rule,
+                                   rule.depsfinder[len(BATCH_PREFIX):].strip())
+        _LOGGER.debug("Calling batch depsfinder for %d components: %s",
+                      len(components), cmd)
+        popen_args = shlex.split(to_str_from_unicode(cmd, should_be_uni=True))
+        try:
+            popen = subprocess.Popen(popen_args,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     bufsize=-1) # Use system default
+        except OSError as ose:
+            _LOGGER.error("Can't call depsfinder '%s': %s", cmd, ose)
+            return (dict(), False)
+
+        ids = u"".join(component.id + u"\n" for component in components)
+        (msg_std, msg_err) = popen.communicate(to_str_from_unicode(ids))
+        msg_std = msg_std.strip()
+        msg_err = msg_err.strip()
+        if len(msg_err) != 0:
+            _LOGGER.warning("Depsfinder error when " + \
+                                "applying rule %s to components %s: %s",
+                            rule,
+                            NodeSet.fromlist([str(x.id) for x in components]),
+                            msg_err)
+        result = dict()
+        with StringIO(to_unicode(msg_std)) as reader:
+            for line in reader:
+                fields = line.split()
+                if len(fields) == 0:
+                    continue
+                result.setdefault(fields[0], []).extend(fields[1:])
+        return (result, popen.returncode == os.EX_OK and len(msg_err) == 0)
+
+    def _get_deps(self, component, rule):
+        """
+        Find dependencies of a given component. This implies calling
+        the rule.depsfinder script unless it has already been done by
+        _prefetch(). Returns the mapping {dep.id: (rule, ...)} of
+        rules to apply on each dependency.
+        """
+        prefetched = self._prefetched.get((component.id, rule.name))
+        if prefetched is not None:
+            (deps, rules_for) = prefetched
+            for dependency in deps:
+                _update_graph_with_node(self.dag, dependency.id)
+        else:
+            deps_for = self._find_deps([component], rule)
+            if deps_for is None:
+                return dict()
+            deps = set()
+            for dep_id in deps_for[component.id]:
                 dependency = self.components_map.get(dep_id)
                 if dependency is None:
                     _LOGGER.debug("Creating dep for component %s with id: %r",
                                   component, dep_id)
                     dependency = Component(dep_id)
-                    self.components_map[dep_id] = dependency
+                    self._register(dependency)
 
                 deps.add(dependency)
                 _update_graph_with_node(self.dag, dep_id)
+            rules_for = None
 
         if _LOGGER.isEnabledFor(INFO):
             _LOGGER.info("%s.depsfinder(%s): %s",
                          rule.name, component.id,
                          NodeSet.fromlist([str(x.id) for x in deps]))
-        # Find match only on rule.dependson
-        return _find_match([self.ruleset.rules_for[x] for x in rule.dependson],
-                           deps)
-
+        if rules_for is None:
+            rules_for = self._match_deps(rule, deps)
+        return rules_for
@@ -0,0 +1,794 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Compact directed graphs used by the sequencer on large graphs.
+
+Nodes are given by the caller (usually strings) as with pygraph, but
+they are mapped to integer ids internally, and adjacency is stored in
+arrays of integers instead of dicts of lists:
+
+    - Digraph: a growable graph used during construction;
+    - FrozenDigraph: a read-only graph, in CSR (Compressed Sparse
+      Row) format, obtained with Digraph.freeze().
+
+Both classes provide the subset of the pygraph digraph API used by
+the sequencer, so they can be used where a pygraph digraph was used,
+except with pygraph algorithms and writers that check the graph
+class. Use to_pygraph() (and from_pygraph()) in such cases.
+"""
+from array import array
+
+from pygraph.classes.digraph import digraph
+from pygraph.classes.exceptions import AdditionError
+
+
+__author__ = "Pierre Vigneras"
+__copyright__ = "Copyright (c) 2010 Bull S.A.S."
+__credits__ = ["Pierre Vigneras"]
+
+# Same defaults than pygraph
+DEFAULT_WEIGHT = 1
+DEFAULT_LABEL = ""
+
+# Edges are stored in sets and dicts as single integers: this is much
+# more compact than a tuple of nodes.
+_EDGE_SHIFT = 32
+
+def _edge_key(src, dst):
+    """
+    Return the integer key of the edge (src, dst) given as node ids.
+    """
+    return (src << _EDGE_SHIFT) | dst
+
+
+class _BaseDigraph(object):
+    """
+    Methods shared by Digraph and FrozenDigraph.
+
+    Subclasses should provide _successors(i) and _predecessors(i)
+    that return the node ids adjacent to the node id i.
+    """
+
+    DIRECTED = True
+
+    def __init__(self):
+        # node -> id
+        self._ids = {}
+        # id -> node (None if the node has been deleted)
+        self._nodes = []
+        # id -> [(name, value), ...] only for nodes having attributes
+        self._node_attrs = {}
+        # Edge properties, only for edges not having default values:
+        # edge key -> value
+        self._edge_labels = {}
+        self._edge_weights = {}
+        self._edge_attrs = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def __getitem__(self, node):
+        return self.neighbors(node)
+
+    def __repr__(self):
+        return "%s(%d nodes, %d edges)" % (self.__class__.__name__,
+                                           len(self), self.edges_count())
+
+    def node_id(self, node):
+        """
+        Return the integer id of the given node.
+        """
+        return self._ids[node]
+
+    def node_from_id(self, node_id):
+        """
+        Return the node of the given integer id.
+        """
+        return self._nodes[node_id]
+
+    def ids_count(self):
+        """
+        Return the upper bound (excluded) of node ids.
+        """
+        return len(self._nodes)
+
+    def nodes(self):
+        """
+        Return the list of nodes, in insertion order.
+        """
+        return [node for node in self._nodes if node is not None]
+
+    def has_node(self, node):
+        """
+        Return True if the given node is in the graph.
+        """
+        return node in self._ids
+
+    def neighbors(self, node):
+        """
+        Return the list of nodes the given node has an edge to.
+        """
+        names = self._nodes
+        return [names[i] for i in self._successors(self._ids[node])]
+
+    def incidents(self, node):
+        """
+        Return the list of nodes that have an edge to the given node.
+        """
+        names = self._nodes
+        return [names[i] for i in self._predecessors(self._ids[node])]
+
+    def node_order(self, node):
+        """
+        Return the number of neighbors of the given node.
+        """
+        return len(self._successors(self._ids[node]))
+
+    def edges(self):
+        """
+        Return the list of edges as (src, dst) tuples.
+        """
+        names = self._nodes
+        result = []
+        for src, name in enumerate(names):
+            if name is None:
+                continue
+            for dst in self._successors(src):
+                result.append((name, names[dst]))
+        return result
+
+    def edges_count(self):
+        """
+        Return the number of edges.
+        """
+        return sum(len(self._successors(i))
+                   for i in xrange(len(self._nodes)))
+
+    def has_edge(self, edge):
+        """
+        Return True if the given (src, dst) edge is in the graph.
+        """
+        src, dst = edge
+        ids = self._ids
+        if src not in ids or dst not in ids:
+            return False
+        src = ids[src]
+        dst = ids[dst]
+        successors = self._successors(src)
+        predecessors = self._predecessors(dst)
+        if len(successors) <= len(predecessors):
+            return dst in successors
+        return src in predecessors
+
+    def _key(self, edge):
+        """
+        Return the key of the given edge.
+        """
+        return _edge_key(self._ids[edge[0]], self._ids[edge[1]])
+
+    def node_attributes(self, node):
+        """
+        Return the list of (name, value) attributes of the given node.
+        """
+        i = self._ids[node]
+        attrs = self._node_attrs.get(i)
+        if attrs is None:
+            attrs = self._node_attrs[i] = []
+        return attrs
+
+    def edge_label(self, edge):
+        """
+        Return the label of the given edge.
+        """
+        return self._edge_labels.get(self._key(edge), DEFAULT_LABEL)
+
+    def edge_weight(self, edge):
+        """
+        Return the weight of the given edge.
+        """
+        return self._edge_weights.get(self._key(edge), DEFAULT_WEIGHT)
+
+    def edge_attributes(self, edge):
+        """
+        Return the list of (name, value) attributes of the given edge.
+        """
+        return self._edge_attrs.get(self._key(edge), [])
+
+    def to_pygraph(self):
+        """
+        Return a pygraph digraph equivalent to this graph.
+        """
+        result = digraph()
+        for node in self.nodes():
+            result.add_node(node, list(self.node_attributes(node)))
+        for edge in self.edges():
+            result.add_edge(edge,
+                            wt=self.edge_weight(edge),
+                            label=self.edge_label(edge),
+                            attrs=list(self.edge_attributes(edge)))
+        return result
+
+
+class Digraph(_BaseDigraph):
+    """
+    A growable directed graph with integer-indexed adjacency arrays.
+
+    It provides the same API than pygraph digraph for nodes, edges and
+    their attributes. Since the adjacency is stored in arrays, it is
+    not well suited for graphs where many edges are deleted from high
+    degree nodes.
+    """
+
+    def __init__(self):
+        _BaseDigraph.__init__(self)
+        # id -> array of neighbors ids
+        self._succ = []
+        # id -> array of incidents ids
+        self._pred = []
+        # Set of edge keys: this makes add_edge() and has_edge() O(1)
+        self._edge_keys = set()
+
+    def _successors(self, i):
+        return self._succ[i]
+
+    def _predecessors(self, i):
+        return self._pred[i]
+
+    def edges_count(self):
+        return len(self._edge_keys)
+
+    def has_edge(self, edge):
+        src, dst = edge
+        ids = self._ids
+        if src not in ids or dst not in ids:
+            return False
+        return _edge_key(ids[src], ids[dst]) in self._edge_keys
+
+    def add_node(self, node, attrs=None):
+        """
+        Add the given node. Raise an AdditionError if it already exists.
+        """
+        if node in self._ids:
+            raise AdditionError("Node %s already in digraph" % node)
+        i = len(self._nodes)
+        self._ids[node] = i
+        self._nodes.append(node)
+        self._succ.append(array('i'))
+        self._pred.append(array('i'))
+        if attrs:
+            self._node_attrs[i] = list(attrs)
+        return i
+
+    def add_nodes(self, nodes):
+        """
+        Add all given nodes.
+        """
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node_attribute(self, node, attr):
+        """
+        Add the given (name, value) attribute to the given node.
+        """
+        self._node_attrs.setdefault(self._ids[node], []).append(attr)
+
+    def del_node(self, node):
+        """
+        Remove the given node and all its edges.
+        """
+        i = self._ids.pop(node)
+        for dst in set(self._succ[i]):
+            self._del_edge(i, dst)
+        for src in set(self._pred[i]):
+            self._del_edge(src, i)
+        self._nodes[i] = None
+        self._node_attrs.pop(i, None)
+
+    def add_edge(self, edge, wt=DEFAULT_WEIGHT, label=DEFAULT_LABEL,
+                 attrs=None):
+        """
+        Add the given (src, dst) edge. Both nodes must already be in
+        the graph. Raise an AdditionError if the edge already exists.
+        """
+        src, dst = edge
+        for node in edge:
+            if node not in self._ids:
+                raise AdditionError("%s is missing from the digraph" % node)
+        key = _edge_key(self._ids[src], self._ids[dst])
+        if key in self._edge_keys:
+            raise AdditionError("Edge (%s, %s) already in digraph" % (src,
+                                                                      dst))
+        src = self._ids[src]
+        dst = self._ids[dst]
+        self._edge_keys.add(key)
+        self._succ[src].append(dst)
+        self._pred[dst].append(src)
+        if wt != DEFAULT_WEIGHT:
+            self._edge_weights[key] = wt
+        if label != DEFAULT_LABEL:
+            self._edge_labels[key] = label
+        if attrs:
+            self._edge_attrs[key] = list(attrs)
+
+    def del_edge(self, edge):
+        """
+        Remove the given (src, dst) edge.
+        """
+        self._del_edge(self._ids[edge[0]], self._ids[edge[1]])
+
+    def _del_edge(self, src, dst):
+        """
+        Remove the edge between the given node ids.
+        """
+        key = _edge_key(src, dst)
+        self._edge_keys.remove(key)
+        self._succ[src].remove(dst)
+        self._pred[dst].remove(src)
+        self._edge_labels.pop(key, None)
+        self._edge_weights.pop(key, None)
+        self._edge_attrs.pop(key, None)
+
+    def set_edge_label(self, edge, label):
+        """
+        Set the label of the given edge.
+        """
+        key = self._key(edge)
+        if label == DEFAULT_LABEL:
+            self._edge_labels.pop(key, None)
+        else:
+            self._edge_labels[key] = label
+
+    def set_edge_weight(self, edge, wt):
+        """
+        Set the weight of the given edge.
+        """
+        key = self._key(edge)
+        if wt == DEFAULT_WEIGHT:
+            self._edge_weights.pop(key, None)
+        else:
+            self._edge_weights[key] = wt
+
+    def add_edge_attribute(self, edge, attr):
+        """
+        Add the given (name, value) attribute to the given edge.
+        """
+        self._edge_attrs.setdefault(self._key(edge), []).append(attr)
+
+    def reverse(self):
+        """
+        Return a new graph with all edges reversed.
+        """
+        result = Digraph()
+        for node in self.nodes():
+            result.add_node(node, self._node_attrs.get(self._ids[node]))
+        for src, dst in self.edges():
+            result.add_edge((dst, src),
+                            wt=self.edge_weight((src, dst)),
+                            label=self.edge_label((src, dst)),
+                            attrs=self.edge_attributes((src, dst)))
+        return result
+
+    def freeze(self):
+        """
+        Return a read-only copy of this graph in CSR format. Node ids
+        are preserved.
+        """
+        return FrozenDigraph(self)
+
+    @classmethod
+    def from_pygraph(cls, pygraph):
+        """
+        Return a new Digraph equivalent to the given pygraph digraph.
+        """
+        result = cls()
+        for node in pygraph.nodes():
+            result.add_node(node, pygraph.node_attributes(node))
+        for edge in pygraph.edges():
+            result.add_edge(edge,
+                            wt=pygraph.edge_weight(edge),
+                            label=pygraph.edge_label(edge),
+                            attrs=pygraph.edge_attributes(edge))
+        return result
+
+
+def _to_csr(adjacency):
+    """
+    Return the (offsets, targets) arrays of the given list of
+    adjacency arrays: the targets of node i are
+    targets[offsets[i]:offsets[i+1]].
+    """
+    offsets = array('l', [0])
+    targets = array('i')
+    for row in adjacency:
+        targets.extend(row)
+        offsets.append(len(targets))
+    return (offsets, targets)
+
+
+class FrozenDigraph(_BaseDigraph):
+    """
+    A read-only directed graph with adjacency stored in CSR format.
+
+    Use Digraph.freeze() to get an instance.
+    """
+
+    def __init__(self, graph):
+        _BaseDigraph.__init__(self)
+        self._ids = dict(graph._ids)
+        self._nodes = list(graph._nodes)
+        self._node_attrs = dict((i, list(attrs))
+                                for i, attrs in graph._node_attrs.items())
+        self._edge_labels = dict(graph._edge_labels)
+        self._edge_weights = dict(graph._edge_weights)
+        self._edge_attrs = dict((key, list(attrs))
+                                for key, attrs in graph._edge_attrs.items())
+        (self._succ_offsets, self._succ_targets) = _to_csr(graph._succ)
+        (self._pred_offsets, self._pred_targets) = _to_csr(graph._pred)
+        self._edges_count = len(self._succ_targets)
+
+    def _successors(self, i):
+        return self._succ_targets[self._succ_offsets[i]:
+                                      self._succ_offsets[i + 1]]
+
+    def _predecessors(self, i):
+        return self._pred_targets[self._pred_offsets[i]:
+                                      self._pred_offsets[i + 1]]
+
+    def edges_count(self):
+        return self._edges_count
+
+    def successors_ids(self, i):
+        """
+        Return the array of neighbors ids of the given node id.
+        """
+        return self._successors(i)
+
+    def predecessors_ids(self, i):
+        """
+        Return the array of incidents ids of the given node id.
+        """
+        return self._predecessors(i)
+
+    def csr_arrays(self):
+        """
+        Return the tuple (succ_offsets, succ_targets, pred_offsets,
+        pred_targets) of the arrays of this graph adjacency: the
+        neighbors ids of the node id i are
+        succ_targets[succ_offsets[i]:succ_offsets[i + 1]], and its
+        incidents ids are
+        pred_targets[pred_offsets[i]:pred_offsets[i + 1]].
+        """
+        return (self._succ_offsets, self._succ_targets,
+                self._pred_offsets, self._pred_targets)
+
+    @classmethod
+    def from_csr_arrays(cls, nodes, arrays):
+        """
+        Return the graph of the given list of nodes (indexed by node
+        id, None for a deleted node) with the given adjacency arrays
+        (see csr_arrays()). Nodes and edges have no attributes.
+        """
+        result = cls.__new__(cls)
+        _BaseDigraph.__init__(result)
+        result._nodes = nodes
+        result._ids = dict((node, i) for i, node in enumerate(nodes)
+                           if node is not None)
+        (result._succ_offsets, result._succ_targets,
+         result._pred_offsets, result._pred_targets) = arrays
+        result._edges_count = len(result._succ_targets)
+        return result
+
+    def thaw(self):
+        """
+        Return a growable copy of this graph.
+        """
+        result = Digraph()
+        for i, node in enumerate(self._nodes):
+            # Keep node ids, including holes of deleted nodes
+            result._nodes.append(node)
+            result._succ.append(array('i', self._successors(i)))
+            result._pred.append(array('i', self._predecessors(i)))
+            if node is not None:
+                result._ids[node] = i
+                for dst in self._successors(i):
+                    result._edge_keys.add(_edge_key(i, dst))
+        result._node_attrs = dict((i, list(attrs))
+                                  for i, attrs in self._node_attrs.items())
+        result._edge_labels = dict(self._edge_labels)
+        result._edge_weights = dict(self._edge_weights)
+        result._edge_attrs = dict((key, list(attrs))
+                                  for key, attrs in self._edge_attrs.items())
+        return result
+
+
+def to_pygraph(graph):
+    """
+    Return the given graph as a pygraph graph. The graph is returned
+    as is if it is not a Digraph or a FrozenDigraph.
+    """
+    if isinstance(graph, _BaseDigraph):
+        return graph.to_pygraph()
+    return graph
+
+
+def _indexed_adjacency_of(graph):
+    """
+    Return a tuple (names, successors) for the given Digraph,
+    FrozenDigraph or pygraph-like graph where successors(i) returns
+    the indexes of the neighbors of names[i]. names[i] is None for a
+    deleted node.
+    """
+    if isinstance(graph, _BaseDigraph):
+        return (graph._nodes, graph._successors)
+    (nodes, successors) = _adjacency_of(graph)
+    return (nodes, successors.__getitem__)
+
+
+def find_cycle(graph):
+    """
+    Return a list of nodes that form a cycle in the given Digraph,
+    FrozenDigraph or pygraph-like graph, or an empty list if the graph
+    is acyclic.
+
+    Contrary to pygraph find_cycle(), the depth-first search is
+    iterative and does not depend on the recursion limit.
+    """
+    (names, successors) = _indexed_adjacency_of(graph)
+    # 0: not visited, 1: on the current path, 2: done
+    state = bytearray(len(names))
+    for root in xrange(len(names)):
+        if names[root] is None or state[root]:
+            continue
+        path = [root]
+        stack = [iter(successors(root))]
+        state[root] = 1
+        while stack:
+            for dst in stack[-1]:
+                if state[dst] == 1:
+                    return [names[i] for i in path[path.index(dst):]]
+                if state[dst] == 0:
+                    state[dst] = 1
+                    path.append(dst)
+                    stack.append(iter(successors(dst)))
+                    break
+            else:
+                state[path.pop()] = 2
+                stack.pop()
+    return []
+
+
+def strongly_connected_components(graph):
+    """
+    Return the list of the strongly connected components of the given
+    Digraph, FrozenDigraph or pygraph-like graph, each one being a
+    list of nodes. A component comes after the components its nodes
+    have an edge to.
+
+    This is the Tarjan algorithm: nodes and edges are visited once.
+    Contrary to pygraph mutual_accessibility(), the depth-first
+    search is iterative and does not depend on the recursion limit.
+    """
+    (names, successors) = _indexed_adjacency_of(graph)
+    size = len(names)
+    # Visiting order of each node, -1 if not visited yet
+    index = [-1] * size
+    # Lowest visiting order reachable from each node in its component
+    low = [0] * size
+    on_stack = bytearray(size)
+    stack = []
+    components = []
+    visited = 0
+    for root in xrange(size):
+        if names[root] is None or index[root] >= 0:
+            continue
+        index[root] = low[root] = visited
+        visited += 1
+        stack.append(root)
+        on_stack[root] = 1
+        path = [root]
+        iterators = [iter(successors(root))]
+        while iterators:
+            node = path[-1]
+            for dst in iterators[-1]:
+                if index[dst] < 0:
+                    index[dst] = low[dst] = visited
+                    visited += 1
+                    stack.append(dst)
+                    on_stack[dst] = 1
+                    path.append(dst)
+                    iterators.append(iter(successors(dst)))
+                    break
+                if on_stack[dst] and index[dst] < low[node]:
+                    low[node] = index[dst]
+            else:
+                iterators.pop()
+                path.pop()
+                if path and low[node] < low[path[-1]]:
+                    low[path[-1]] = low[node]
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        i = stack.pop()
+                        on_stack[i] = 0
+                        component.append(names[i])
+                        if i == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _adjacency_of(graph):
+    """
+    Return a tuple (nodes, successors) for the given pygraph-like
+    graph where successors[i] is the list of the indexes (in nodes)
+    of the neighbors of nodes[i].
+    """
+    nodes = graph.nodes()
+    index = dict((node, i) for i, node in enumerate(nodes))
+    successors = [[index[dst] for dst in graph.neighbors(node)]
+                  for node in nodes]
+    return (nodes, successors)
+
+
+def _reverse_topological_order(successors):
+    """
+    Return the list of indexes such that each index comes after all
+    its successors (leaves first), or None if there is a cycle.
+    """
+    remaining = [len(row) for row in successors]
+    predecessors = [[] for _ in successors]
+    for src, row in enumerate(successors):
+        for dst in row:
+            predecessors[dst].append(src)
+    order = [i for i, count in enumerate(remaining) if count == 0]
+    for i in order:
+        for src in predecessors[i]:
+            remaining[src] -= 1
+            if remaining[src] == 0:
+                order.append(src)
+    if len(order) != len(successors):
+        return None
+    return order
+
+
+def _reduce(successors, kept):
+    """
+    Return the transitive reduction of the given graph (as returned
+    by _adjacency_of()) contracted on kept nodes: the result is a
+    list where result[i] is the list of the successors of i in the
+    reduced graph if kept[i] is True, None otherwise. The result is
+    None if the graph contains a cycle.
+
+    In the contracted graph, a kept node a has an edge to a kept node
+    c when a path a -> n1 -> ... -> c exists where n1, ... are not
+    kept. Such an edge is in the reduction unless c can also be
+    reached from another successor of a in the contracted graph.
+
+    Nodes are visited once, leaves first. For each node, the
+    following is computed from its successors:
+
+        - its frontier: the kept nodes reachable through non-kept
+          nodes only (the node itself if it is kept), without
+          redundant ones;
+        - a bitset of kept nodes below its frontier.
+
+    A candidate successor of a node is redundant when it is in one of
+    the bitsets of its successors. Bit positions follow the visiting
+    order so that bitsets only grow up to the node position, and data
+    of a node are freed as soon as all its incidents have been
+    visited.
+    """
+    order = _reverse_topological_order(successors)
+    if order is None:
+        return None
+    size = len(successors)
+    position = [0] * size
+    bits = 0
+    for i in order:
+        if kept[i]:
+            position[i] = bits
+            bits += 1
+    # Number of incidents not visited yet
+    pending = [0] * size
+    for row in successors:
+        for dst in row:
+            pending[dst] += 1
+    frontiers = [None] * size
+    belows = [None] * size
+    result = [None] * size
+    for i in order:
+        candidates = []
+        seen = set()
+        below = 0
+        for dst in successors[i]:
+            below |= belows[dst]
+            for candidate in frontiers[dst]:
+                if candidate not in seen:
+                    seen.add(candidate)
+                    candidates.append(candidate)
+        if below:
+            candidates = [candidate for candidate in candidates
+                          if not (below >> position[candidate]) & 1]
+        if kept[i]:
+            result[i] = candidates
+            if pending[i]:
+                for candidate in candidates:
+                    below |= 1 << position[candidate]
+                frontiers[i] = (i,)
+                belows[i] = below
+        elif pending[i]:
+            frontiers[i] = candidates
+            belows[i] = below
+        for dst in successors[i]:
+            pending[dst] -= 1
+            if not pending[dst]:
+                frontiers[dst] = None
+                belows[dst] = None
+    return result
+
+
+def transitive_edges(graph):
+    """
+    Return the list of transitive edges of the given acyclic graph
+    (a pygraph digraph, a Digraph or a FrozenDigraph): (a, c) is
+    transitive when a path a -> b -> ... -> c also exists.
+
+    This returns the same set of edges than pygraph transitive_edges()
+    (and an empty list if the graph contains a cycle), with a single
+    pass over nodes (see _reduce()) instead of a traversal per node.
+    """
+    (nodes, successors) = _adjacency_of(graph)
+    reduction = _reduce(successors, [True] * len(nodes))
+    if reduction is None:
+        return []
+    result = []
+    for src, row in enumerate(successors):
+        if len(reduction[src]) != len(row):
+            kept = set(reduction[src])
+            result.extend((nodes[src], nodes[dst])
+                          for dst in row if dst not in kept)
+    return result
+
+
+def reduced_edges(graph, keep):
+    """
+    Return the list of edges of the transitive reduction of the given
+    acyclic graph once contracted on nodes for which keep(node) is
+    True: other nodes are removed and replaced by edges from each of
+    their (kept) ancestors to each of their (kept) descendants, but
+    only when such an edge is not transitive.
+
+    Return None if the graph contains a cycle.
+    """
+    (nodes, successors) = _adjacency_of(graph)
+    reduction = _reduce(successors, [keep(node) for node in nodes])
+    if reduction is None:
+        return None
+    result = []
+    for src, row in enumerate(reduction):
+        if row is not None:
+            result.extend((nodes[src], nodes[dst]) for dst in row)
+    return result
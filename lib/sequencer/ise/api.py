@@ -20,13 +20,16 @@
 """
 ISE API implementation
 """
+import heapq
+import itertools
 import logging
 import time
 from datetime import datetime as dt
 
+from ClusterShell.NodeSet import NodeSet
 from ClusterShell.Task import EventHandler, task_self
 from sequencer.commons import get_nodes_from, get_version
-from sequencer.ise import parser, model
+from sequencer.ise import history, model
 from sequencer.ise.rc import should_stop, is_error_rc, is_warning_rc, \
     ACTION_RC_OK, ACTION_RC_WARNING, ACTION_RC_UNEXECUTED
 
@@ -38,6 +41,22 @@ __version__ = get_version()
 
 _LOGGER = logging.getLogger(__name__)
 
+# Ready actions are submitted as soon as they are ready
+SCHEDULE_FIFO = 'fifo'
+# Ready actions are submitted up to the fanout, those starting the
+# longest remaining path first.
+SCHEDULE_CRITICAL = 'critical'
+SCHEDULE_TYPES = [SCHEDULE_FIFO, SCHEDULE_CRITICAL]
+
+# Separates the kind from the name in a resource tag: 'pdu:pdu12'
+RESOURCE_KIND_SEPARATOR = ':'
+
+def get_resource_kind(tag):
+    """
+    Return the kind of the given resource tag: 'pdu' for 'pdu:pdu12'.
+    """
+    return tag.split(RESOURCE_KIND_SEPARATOR, 1)[0]
+
 class ProgressReporter(EventHandler):
     """
     This EventHandler is just used to report progress of the given execution
@@ -63,9 +82,6 @@ class ActionUpdater(EventHandler):
         EventHandler.__init__(self)
         self.action = action
         self.execution = execution
-        self.execution.running = self.execution.running + 1
-        self.execution.best_fanout = max(self.execution.best_fanout,
-                                         self.execution.running)
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__, self.__dict__)
@@ -127,6 +143,11 @@ class ActionUpdater(EventHandler):
         self.action.rc = overall_rc
         self.action.stdout = overall_stdout
         self.action.stderr = overall_stderr
+        # Per node results: a remote action can be executed on many
+        # nodes (see sequencer.ism.algo._coalesce_remote_actions())
+        self.action.nodes_for_rc = dict((rc, NodeSet.fromlist(nodes))
+                                        for rc, nodes \
+                                            in ssh_worker.iter_retcodes())
 
     def _update_local_action(self, popen_worker):
         """
@@ -148,6 +169,7 @@ class ActionUpdater(EventHandler):
 
         self.execution.executed_actions[self.action.id] = self.action
         self.execution.running = self.execution.running - 1
+        self.execution.release_resources(self.action)
         if should_stop(self.action.rc,
                        self.execution.force,
                        self.action.force):
@@ -156,28 +178,136 @@ class ActionUpdater(EventHandler):
             _LOGGER.error("%s: [rc=%s] %s",
                           self.action.id, self.action.rc, errmsg)
             self.execution.error_actions[self.action.id] = self.action
-            return
-
-        for next_id in self.action.next():
-            self.execution.schedule_action(next_id)
+        else:
+            self.execution.complete_action(self.action.id)
+        self.execution.submit_ready()
 
 
-def execute(a_file, force=False, doexec=True, progress=0.0, fanout=64):
+def execute(a_file, force=False, doexec=True, progress=0.0, fanout=64,
+            schedule=SCHEDULE_FIFO, durations=None, limits=None):
     """
     Execute the instructions sequence specified in the model described
     in the given XML file
     """
-    return execute_model(model.Model(parser.ISEParser(a_file).root),
+    return execute_model(model.load(a_file),
                          force,
                          doexec,
                          progress,
-                         fanout)
+                         fanout,
+                         schedule,
+                         durations,
+                         limits)
 
-def execute_model(a_model, force=False, doexec=True, progress=0.0, fanout=64):
+def execute_model(a_model, force=False, doexec=True, progress=0.0, fanout=64,
+                  schedule=SCHEDULE_FIFO, durations=None, limits=None):
     """
     Execute the instructions sequence specified in the given model
     """
-    return Execution(a_model, force, doexec, progress, fanout)
+    return Execution(a_model, force, doexec, progress, fanout,
+                     schedule, durations, limits)
+
+def get_priorities(a_model, durations=None):
+    """
+    Return the list of priorities of each node id of the given model
+    graph: the length of the longest path from the node to the end of
+    the execution, following Action.next().
+
+    Each action weighs its duration in the given {action_id: duration}
+    mapping (see history.duration_of()), or the average of known
+    durations if it is missing from the mapping. Without durations,
+    each action weighs 1. Barriers weigh 0.
+
+    Nodes are visited once, in topological order.
+    """
+    dag = a_model.dag
+    size = dag.ids_count()
+    if durations:
+        default = sum(durations.values()) / len(durations)
+    else:
+        durations = {}
+        default = 1.0
+    # Number of incidents not visited yet
+    remaining = [len(dag.predecessors_ids(i)) for i in xrange(size)]
+    ready = [i for i in xrange(size)
+             if not remaining[i] and dag.node_from_id(i) is not None]
+    priorities = [0.0] * size
+    for i in ready:
+        node = dag.node_from_id(i)
+        if node in a_model.actions:
+            weight = history.duration_of(durations, node, default)
+        else:
+            weight = 0.0
+        priorities[i] = weight + max([priorities[j]
+                                      for j in dag.predecessors_ids(i)]
+                                     or [0.0])
+        for j in dag.successors_ids(i):
+            remaining[j] -= 1
+            if not remaining[j]:
+                ready.append(j)
+    return priorities
+
+def get_critical_path(execution):
+    """
+    Return the tuple (optimal_time, path, slacks) computed from the
+    durations of the actions executed by the given execution:
+
+    - optimal_time is the time the execution would have taken with an
+      unlimited fanout (the length of the longest path);
+    - path is the list of the ids of the actions on such a path, in
+      execution order;
+    - slacks is the {action_id: slack} mapping of the time each
+      executed action could have been delayed without delaying the
+      whole execution.
+
+    Unexecuted actions and barriers weigh 0. Nodes are visited once
+    in each direction.
+    """
+    dag = execution.model.dag
+    actions = execution.executed_actions
+    size = dag.ids_count()
+    durations = [0.0] * size
+    for id_, action in actions.items():
+        durations[dag.node_id(id_)] = action.ended_time - action.started_time
+    # Earliest end time of each node and the dependency reaching it
+    ends = [0.0] * size
+    critical_deps = [None] * size
+    # Number of dependencies not visited yet
+    remaining = [len(dag.successors_ids(i)) for i in xrange(size)]
+    order = [i for i in xrange(size)
+             if not remaining[i] and dag.node_from_id(i) is not None]
+    for i in order:
+        start = 0.0
+        for j in dag.successors_ids(i):
+            if critical_deps[i] is None or ends[j] > start:
+                start = ends[j]
+                critical_deps[i] = j
+        ends[i] = start + durations[i]
+        for j in dag.predecessors_ids(i):
+            remaining[j] -= 1
+            if not remaining[j]:
+                order.append(j)
+    if not order:
+        return (0.0, [], {})
+    last = max(order, key=lambda i: ends[i])
+    optimal_time = ends[last]
+    # Latest end time of each node not delaying the execution
+    latest_ends = [optimal_time] * size
+    for i in reversed(order):
+        latest_start = latest_ends[i] - durations[i]
+        for j in dag.successors_ids(i):
+            latest_ends[j] = min(latest_ends[j], latest_start)
+    path = []
+    i = last
+    while i is not None:
+        id_ = dag.node_from_id(i)
+        if id_ in actions:
+            path.append(id_)
+        i = critical_deps[i]
+    path.reverse()
+    slacks = dict((id_, latest_ends[dag.node_id(id_)] - \
+                       ends[dag.node_id(id_)])
+                  for id_ in actions)
+    return (optimal_time, path, slacks)
 
 
 class Execution(object):
@@ -188,15 +318,52 @@ class Execution(object):
     """
 
     def __init__(self, a_model, force=False,
-                 doexec=True, progress=0.0, fanout=64):
+                 doexec=True, progress=0.0, fanout=64,
+                 schedule=SCHEDULE_FIFO, durations=None, limits=None):
         """
         force defines how warning should be handled. When set to false,
         warning == error.
+
+        schedule is one of SCHEDULE_TYPES. With SCHEDULE_CRITICAL,
+        durations is the {action_id: duration} mapping used to compute
+        priorities (see get_priorities()).
+
+        limits is the {resource_kind: limit} mapping of the maximal
+        number of running actions using a given resource tag of each
+        kind (see Action.resources). Resource kinds missing from the
+        mapping are not limited.
         """
+        assert schedule in SCHEDULE_TYPES
         self.force = force
         self.model = a_model
         self.executed_actions = {}
         self.error_actions = {}
+        # Number of dependencies not completed yet for each node id
+        # of the model graph
+        dag = a_model.dag
+        self._pending = []
+        # Ids of the actions without dependencies (see schedule_all())
+        self._roots = []
+        for i in xrange(dag.ids_count()):
+            pending = len(dag.successors_ids(i))
+            self._pending.append(pending)
+            if not pending and dag.node_from_id(i) in a_model.actions:
+                self._roots.append(dag.node_from_id(i))
+        # Priority queue of ready actions (critical scheduling only)
+        self._ready = []
+        # Submission order of ready actions having the same priority
+        self._ready_order = itertools.count()
+        self._priorities = None
+        if schedule == SCHEDULE_CRITICAL:
+            self._priorities = get_priorities(a_model, durations)
+        self.limits = limits if limits is not None else dict()
+        # Ready actions go through the queue when they have to wait for
+        # either a higher priority or a resource.
+        self._queued = self._priorities is not None or bool(self.limits)
+        # Number of running actions for each resource tag
+        self._usage = dict()
+        # Ready queue entries waiting for each saturated resource tag
+        self._blocked = dict()
         self.running = 0
         self.best_fanout = 0
         self.fanout = fanout
@@ -278,11 +445,34 @@ class Execution(object):
 
     def schedule_all(self):
         """
-        Schedule the execution of the instructions set
+        Schedule the execution of the instructions set: actions
+        without dependencies are submitted, others will be when their
+        dependencies complete (see complete_action()).
         """
-        for id_ in self.model.actions.keys():
-            # Schedule each action.
+        for id_ in self._roots:
             self.schedule_action(id_)
+        self.submit_ready()
+
+    def complete_action(self, id_):
+        """
+        Called when the action with the given id_ has completed
+        successfully: each action depending on it is submitted if it
+        was its last dependency.
+        """
+        dag = self.model.dag
+        pending = self._pending
+        completed = [dag.node_id(id_)]
+        while completed:
+            for i in dag.predecessors_ids(completed.pop()):
+                pending[i] -= 1
+                if pending[i]:
+                    continue
+                next_id = dag.node_from_id(i)
+                if next_id in self.model.actions:
+                    self.schedule_action(next_id)
+                else:
+                    # A barrier: all its dependencies have completed
+                    completed.append(i)
 
     def schedule_action(self, id_):
         """
@@ -290,17 +480,69 @@ class Execution(object):
         Dependencies are checked before.
         """
         action = self.model.actions[id_]
-        all_deps = action.all_deps()
-        for dep in all_deps:
-            if (not dep in self.executed_actions) \
-                   or (dep in self.error_actions):
+        pending = self._pending[self.model.dag.node_id(id_)]
+        if pending:
+            _LOGGER.debug("Can't currently execute %s because of %d"
+                          " uncompleted dependencies", id_, pending)
+            return
 
-                _LOGGER.debug("Can't currently execute %s because of %s",
-                              id_, dep)
-                return
+        if self._queued:
+            priority = 0.0
+            if self._priorities is not None:
+                priority = self._priorities[self.model.dag.node_id(id_)]
+            _LOGGER.debug("%s is ready, priority: %s", id_, priority)
+            heapq.heappush(self._ready,
+                           (-priority, next(self._ready_order), id_))
+            return
+        self._submit_action(action)
+
+    def submit_ready(self):
+        """
+        Submit ready actions with the highest priorities while the
+        fanout is not reached. An action using a resource tag that has
+        reached its limit waits for the release of that tag (see
+        release_resources()).
+        """
+        while self._ready and self.running < self.fanout:
+            entry = heapq.heappop(self._ready)
+            action = self.model.actions[entry[2]]
+            tag = self._saturated_resource(action)
+            if tag is not None:
+                _LOGGER.debug("%s is waiting for resource %s",
+                              action.id, tag)
+                self._blocked.setdefault(tag, []).append(entry)
+                continue
+            self._submit_action(action)
 
-        _LOGGER.debug("Submitting execution of %s, all deps satisfied: %s",
-                      id_, ', '.join(all_deps))
+    def _saturated_resource(self, action):
+        """
+        Return the first resource tag of the given action that has
+        reached its limit, None if there is no such tag.
+        """
+        for tag in action.resources:
+            limit = self.limits.get(get_resource_kind(tag))
+            if limit is not None and self._usage.get(tag, 0) >= limit:
+                return tag
+        return None
+
+    def release_resources(self, action):
+        """
+        Called when the given action completes: its resource tags are
+        released, and actions waiting for them are ready again.
+        """
+        for tag in action.resources:
+            self._usage[tag] -= 1
+            for entry in self._blocked.pop(tag, []):
+                heapq.heappush(self._ready, entry)
+
+    def _submit_action(self, action):
+        """
+        Submit the given action, its dependencies being satisfied.
+        """
+        id_ = action.id
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Submitting execution of %s, all deps satisfied: %s",
+                          id_, ', '.join(action.all_deps()))
         try:
             self._submit(action)
         except Exception as exception:
@@ -332,6 +574,12 @@ class Execution(object):
                                        key=action.component_set,
                                        stderr='enable_stderr',
                                        handler=event_handler)
+        # Only submitted actions are running (see submit_ready()):
+        # task.shell() may raise.
+        self.running = self.running + 1
+        self.best_fanout = max(self.best_fanout, self.running)
+        for tag in action.resources:
+            self._usage[tag] = self._usage.get(tag, 0) + 1
 
         return action
 
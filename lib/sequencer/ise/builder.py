@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+ISE instructions builders.
+
+A builder creates instructions sequences for the ISM algorithms (see
+sequencer.ism.algo). Its methods mirror the ACTION, SEQ, PAR and ISE
+element makers of sequencer.ise.parser: instructions are built
+bottom-up, an instruction given to seq() or par() is never modified
+afterwards.
+
+Two builders are available:
+
+    - XMLBuilder creates the XML document, then its model;
+    - ModelBuilder creates the model directly, without any XML.
+"""
+import logging
+
+from sequencer.commons import SequencerError, get_version
+from sequencer.ise import model
+from sequencer.ise.parser import ACTION, SEQ, PAR, ISE
+from lxml import etree as ET
+
+
+__author__ = "Pierre Vigneras"
+__copyright__ = "Copyright (c) 2010 Bull S.A.S."
+__credits__ = ["Pierre Vigneras"]
+__version__ = get_version()
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class InstructionsBuilder(object):
+    """
+    Defines an abstract instructions builder.
+    """
+    def action(self, command, **attributes):
+        """
+        Return a new action for the given command and XML attributes.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def seq(self, *instructions):
+        """
+        Return a new sequence of the given instructions.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def par(self, *instructions):
+        """
+        Return a new parallel of the given instructions.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def result(self, instructions, acyclic=False):
+        """
+        Return a tuple (ise_model, xml_document, error) for the given
+        list of top level instructions. If ise_model is None, error is
+        the exception that has been raised. xml_document is None if
+        this builder does not create XML.
+
+        If acyclic is True, the caller guarantees that instructions
+        are acyclic: the model is not checked for cycles.
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class XMLBuilder(InstructionsBuilder):
+    """
+    Build the XML document of the instructions sequence. The model is
+    created from it in result().
+    """
+    def action(self, command, **attributes):
+        return ACTION(command, **attributes)
+
+    def seq(self, *instructions):
+        return SEQ(*instructions)
+
+    def par(self, *instructions):
+        return PAR(*instructions)
+
+    def result(self, instructions, acyclic=False):
+        xml_result = ISE(*instructions)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("XML result is: %s",
+                          ET.tostring(xml_result, pretty_print=True))
+
+        # Gives the XML to the model so various check can be performed!
+        ise_model = None
+        error = None
+        # Do not prevent cycle detections from writing the XML result
+        # to a file. This can be used for debugging purpose!
+        try:
+            ise_model = model.Model(xml_result, acyclic)
+        except SequencerError as se:
+            error = se
+
+        return (ise_model, xml_result, error)
+
+
+class ModelBuilder(InstructionsBuilder):
+    """
+    Build the model of the instructions sequence directly: instructions
+    are model instructions added to the graph of the model as soon as
+    they are created. No XML is created.
+    """
+    # Containers built here have no XML attribute
+    _NO_ATTRIBUTES = {}
+
+    def __init__(self):
+        self.model = model.Model()
+
+    def action(self, command, **attributes):
+        # As parsed from XML: an empty command is no command
+        return model.Action.create(attributes,
+                                   command if command else None,
+                                   self.model.dag)
+
+    def seq(self, *instructions):
+        return model.Sequence(self._NO_ATTRIBUTES, self.model.dag,
+                              instructions)
+
+    def par(self, *instructions):
+        return model.Parallel(self._NO_ATTRIBUTES, self.model.dag,
+                              instructions)
+
+    def result(self, instructions, acyclic=False):
+        for instruction in instructions:
+            self.model.add_instruction(instruction)
+        _LOGGER.debug("Model result is: %s",
+                      ", ".join(str(x) for x in instructions))
+        try:
+            self.model.close(acyclic)
+        except SequencerError as se:
+            return (None, None, se)
+        return (self.model, None, None)
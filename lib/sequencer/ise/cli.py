@@ -27,17 +27,22 @@ sequencer ISE API.
 """
 from __future__ import division
 
+import csv
+import cStringIO
+import json
 import optparse
 import os, sys
 import time
+from collections import OrderedDict
 from datetime import datetime as dt, timedelta
 from logging import getLogger
 
 from ClusterShell.NodeSet import NodeSet
 from sequencer.commons import write_graph_to, get_header, \
     smart_display, FILL_EMPTY_ENTRY, CyclesDetectedError, td_to_seconds, get_version, \
-    add_options_to, to_unicode
-from sequencer.ise import api, model, parser
+    add_options_to, to_unicode, replace_if_none
+from sequencer.ise import api, compiled, history, model
+from sequencer.ise.rc import ACTION_RC_OK
 
 
 __author__ = "Pierre Vigneras"
@@ -47,11 +52,19 @@ __version__ = get_version()
 
 _LOGGER = getLogger(__name__)
 
-REPORT_TYPES = ['all', 'none', 'model', 'exec', 'error', 'unexec']
+REPORT_TYPES = ['all', 'none', 'model', 'exec', 'error', 'unexec',
+                'critical']
 REPORT_HEADER_SIZE = 80
+REPORT_FORMAT_TEXT = 'text'
+REPORT_FORMAT_CSV = 'csv'
+REPORT_FORMAT_JSON = 'json'
+REPORT_FORMATS = [REPORT_FORMAT_TEXT, REPORT_FORMAT_CSV, REPORT_FORMAT_JSON]
 
 SEQEXEC_ACTION_NAME = 'seqexec'
 SEQEXEC_DOC = """Execute the given instructions sequence."""
+# Prefix of the configuration options limiting resource kinds:
+# resource.pdu = 4
+RESOURCE_LIMIT_PREFIX = 'resource.'
 
 _ID_LEN = 16
 _COMPSET_LEN = 20
@@ -105,7 +118,10 @@ def _parse(basedir, config, args):
                               " one of its dependencies exits" + \
                               " with a WARNING error code.")
     add_options_to(opt_parser, ['--file', '--actionsgraphto', '--progress',
-                            '--doexec', '--report', '--dostats', '--fanout'],
+                            '--doexec', '--report', '--reportformat',
+                            '--dostats', '--fanout', '--novalidate',
+                            '--compileto',
+                            '--schedule', '--history'],
                    config)
 
 
@@ -117,34 +133,117 @@ def _parse(basedir, config, args):
     return (ise_options, action_args)
 
 
-def _report_model(a_model):
+def _csv_line(cells):
+    """
+    Return the CSV line (without the line terminator) of the given
+    unicode cells.
+    """
+    buf = cStringIO.StringIO()
+    csv.writer(buf, lineterminator='').writerow([cell.encode('utf-8')
+                                                 for cell in cells])
+    return buf.getvalue()
+
+def _ids_cell(ids, report_format):
+    """
+    Return the cell of the given action ids: folded into a NodeSet in
+    the text format, a sorted comma separated list otherwise (folding
+    costs much more than the rest of a row).
+    """
+    ids = [id_ for id_ in ids if len(id_) != 0]
+    if report_format == REPORT_FORMAT_TEXT:
+        return str(NodeSet.fromlist(ids))
+    return u",".join(sorted(ids))
+
+def _output_rows(report_format, report_type, header, rows):
+    """
+    Output each of the given rows of the given report type in the
+    given machine readable format as soon as it is produced.
+
+    In the 'csv' format, the header comes first, each line starts
+    with the report type. In the 'json' format, each row is an object
+    on its own line, mapping each header to its cell, and 'report' to
+    the report type.
+    """
+    assert report_format in REPORT_FORMATS
+    assert report_format != REPORT_FORMAT_TEXT
+    if report_format == REPORT_FORMAT_CSV:
+        _LOGGER.output("%s", _csv_line([u"report"] + header))
+        for row in rows:
+            _LOGGER.output("%s", _csv_line([report_type] + row))
+    else:
+        keys = [u"report"] + header
+        for row in rows:
+            _LOGGER.output("%s", json.dumps(OrderedDict(zip(keys,
+                                                            [report_type] + \
+                                                                row))))
+
+class _PrefixedReader(object):
+    """
+    A file object reading the given prefix first, then the given file
+    object.
+    """
+    def __init__(self, prefix, afile):
+        self.prefix = prefix
+        self.afile = afile
+
+    def read(self, size=-1):
+        """
+        Read at most size bytes.
+        """
+        if not self.prefix:
+            return self.afile.read(size)
+        if size < 0:
+            data = self.prefix + self.afile.read()
+        else:
+            data = self.prefix[:size]
+        self.prefix = self.prefix[len(data):]
+        return data
+
+
+def load_model(afile, validate=True):
+    """
+    Return the model read from the given file object: either a
+    compiled model (see sequencer.ise.compiled), or an ISE XML
+    document validated only if validate is True.
+    """
+    header = afile.read(len(compiled.MAGIC))
+    if compiled.is_compiled(header):
+        _LOGGER.debug("Loading compiled model")
+        return compiled.load(afile, header)
+    return model.load(_PrefixedReader(header, afile), validate)
+
+
+def _report_model(a_model, report_format=REPORT_FORMAT_TEXT):
     """
     Display the 'model' type of report
     """
     header = [u"Id", u"[@]Component Set", u"Deps", u"Description"]
     actions = a_model.actions.values()
     actions_nb = len(actions)
+    deps_total = [0]
+    def _rows():
+        """
+        Yield the row of each action
+        """
+        # Sort by len() first then alphabetically so:
+        # b1, b2, b20, c1, c2, c10, c100 appears in that order
+        sorted_list = sorted(actions, key=lambda action: len(action.id))
+        for action in sorted(sorted_list, key=lambda action: action.id):
+            deps = action.all_deps()
+            deps_total[0] += len(deps)
+            yield [action.id,
+                   ("@" if action.remote else "") + action.component_set,
+                   _ids_cell(deps, report_format),
+                   action.description]
+    if report_format != REPORT_FORMAT_TEXT:
+        _output_rows(report_format, u'model', header, _rows())
+        return
     _LOGGER.output("Actions in Model: %d\tLegend: @=remote, Deps=Dependencies",
                    actions_nb)
-    tab_values = []
-    deps_total_nb = 0
-    # Sort by len() first then alphabetically so:
-    # b1, b2, b20, c1, c2, c10, c100 appears in that order
-    sorted_list = sorted(actions, key=lambda action: len(action.id))
-    for action in sorted(sorted_list, key=lambda action: action.id):
-        nodeset = NodeSet()
-        deps = action.all_deps()
-        deps_total_nb += len(deps)
-        for dep in deps:
-            if len(dep) != 0:
-                nodeset.add(dep)
-        tab_values.append([action.id,
-                           ("@" if action.remote else "")+action.component_set,
-                           str(nodeset),
-                           action.description])
+    tab_values = list(_rows())
     tab_values.append([FILL_EMPTY_ENTRY] * len(header))
     try:
-        average_deps = float(deps_total_nb) / actions_nb
+        average_deps = float(deps_total[0]) / actions_nb
     except ZeroDivisionError:
         average_deps = 0
     tab_values.append(["Average #Deps:", "-",
@@ -168,40 +267,7 @@ def _compute_seq_total_time(execution):
 
     return seq_duration
 
-def _compute_optimal_time(execution):
-    """
-    Compute the optimal time that can be reached with the given
-    execution.
-    """
-    actions = execution.executed_actions
-    dag = execution.model.dag
-    def _compute_optimal_time_rec(root):
-        """
-        Recursive function
-        """
-        result = 0.0
-        try:
-            max_dep = 0
-            for dep in dag.neighbors(root):
-                max_dep = max(max_dep, _compute_optimal_time_rec(dep))
-
-            if root in actions:
-                result = max_dep + \
-                    (actions[root].ended_time - actions[root].started_time)
-            else:
-                result = max_dep
-            return result
-        finally:
-            _LOGGER.debug("Optimal time for %s: %s", root, result)
-
-    result = 0
-    for node in dag.nodes():
-        if len(dag.incidents(node)) == 0:
-            result = max(result, _compute_optimal_time_rec(node))
-
-    return result
-
-def _report_exec(execution):
+def _report_exec(execution, report_format=REPORT_FORMAT_TEXT):
     """
     Display the 'exec' type of report
     """
@@ -210,6 +276,28 @@ def _report_exec(execution):
               u"RC", u"[@]Component Set"]
     executed_actions = execution.executed_actions.values()
     executed_actions_nb = len(executed_actions)
+    def _rows():
+        """
+        Yield the row of each executed action
+        """
+        for execaction in sorted(executed_actions,
+                                 key=lambda execaction: \
+                                     execaction.submitted_time):
+            submit = dt.fromtimestamp(execaction.submitted_time)
+            start  = dt.fromtimestamp(execaction.started_time)
+            end = dt.fromtimestamp(execaction.ended_time)
+            duration = end - start
+            submitted_time = submit.strftime(_TIME_FORMAT)
+            started_time = start.strftime(_TIME_FORMAT)
+            ended_time = end.strftime(_TIME_FORMAT)
+            cs_label = ("@" if execaction.remote else "") + \
+                execaction.component_set
+            yield [execaction.id,  submitted_time,
+                   started_time, ended_time, str(duration),
+                   str(execaction.rc), cs_label]
+    if report_format != REPORT_FORMAT_TEXT:
+        _output_rows(report_format, u'exec', header, _rows())
+        return
     model_actions_nb = len(execution.model.actions)
     try:
         percentage = (float(executed_actions_nb) / model_actions_nb) * 100
@@ -218,39 +306,16 @@ def _report_exec(execution):
     _LOGGER.output("\nExecuted Actions: %d (%2.1f %%)\tLegend:" + \
                        " @=remote, RC=Returned Code",
                    executed_actions_nb, percentage)
-    tab_values = []
-    # Initialise with worst case so they will get replace by first
-    # occurence
-    if executed_actions_nb > 0:
-        first_started = min(executed_actions,
-                            key=lambda execaction: \
-                                execaction.started_time).started_time
-        last_started = max(executed_actions,
-                           key=lambda execaction: \
-                               execaction.started_time).started_time
-        first_ended = min(executed_actions,
-                          key=lambda execaction: \
-                              execaction.ended_time).ended_time
-        last_ended =  max(executed_actions,
-                          key=lambda execaction: \
-                              execaction.ended_time).ended_time
-    for execaction in sorted(executed_actions,
-                                  key=lambda execaction: \
-                                      execaction.submitted_time):
-
-        submit = dt.fromtimestamp(execaction.submitted_time)
-        start  = dt.fromtimestamp(execaction.started_time)
-        end = dt.fromtimestamp(execaction.ended_time)
-        duration = end - start
-        submitted_time = submit.strftime(_TIME_FORMAT)
-        started_time = start.strftime(_TIME_FORMAT)
-        ended_time = end.strftime(_TIME_FORMAT)
-        cs_label = ("@" if execaction.remote else "") + execaction.component_set
-
-        tab_values.append([execaction.id,  submitted_time,
-                           started_time, ended_time, str(duration),
-                           str(execaction.rc), cs_label])
+    tab_values = list(_rows())
     try:
+        first_started = min(execaction.started_time
+                            for execaction in executed_actions)
+        last_started = max(execaction.started_time
+                           for execaction in executed_actions)
+        first_ended = min(execaction.ended_time
+                          for execaction in executed_actions)
+        last_ended = max(execaction.ended_time
+                         for execaction in executed_actions)
         seq_total_time = _compute_seq_total_time(execution)
         average_duration = seq_total_time // executed_actions_nb
         tab_values.append([FILL_EMPTY_ENTRY] * len(header))
@@ -269,7 +334,8 @@ def _report_exec(execution):
         tab_values.append(["Average:", "-", "-", "-",
                            str(average_duration),
                            "-", "-"])
-    except ZeroDivisionError:
+    except (ValueError, ZeroDivisionError):
+        # No executed action
         average_duration = 0
     output = smart_display(header,
                            tab_values, vsep=u' | ',
@@ -278,44 +344,62 @@ def _report_exec(execution):
                                        str.center, str.ljust])
     _LOGGER.output(output)
 
-def _report_error(execution):
+def _failed_nodes_of(action):
+    """
+    Return the folded set of nodes the given remote action did not
+    succeed on, an empty string for a local action.
+    """
+    nodes_for_rc = getattr(action, 'nodes_for_rc', None)
+    if not nodes_for_rc:
+        return u""
+    failed = NodeSet()
+    for rc, nodes in nodes_for_rc.items():
+        if rc != ACTION_RC_OK:
+            failed.update(nodes)
+    return unicode(failed)
+
+def _report_error(execution, report_format=REPORT_FORMAT_TEXT):
     """
     Display the 'error' type of report
     """
+    header = [u"Id", u"RC", u"#rDeps", u"%rDeps", u"rDeps", u"[@]Nodes"]
     actions_nb = len(execution.model.actions)
     error_actions = execution.error_actions.values()
     error_actions_nb = len(error_actions)
+    def _rows():
+        """
+        Yield the row of each action in error
+        """
+        # Sort by len() first then alphabetically so:
+        # b1, b2, b20, c1, c2, c10, c100 appears in that order
+        sorted_list = sorted(error_actions,
+                             key=lambda error_action: len(error_action.id))
+        for error_action in sorted(sorted_list,
+                                   key=lambda error_action: error_action.id):
+            rdeps = error_action.next()
+            rdeps_nb = len(rdeps)
+            percentage = (float(rdeps_nb) / actions_nb) * 100
+            yield [error_action.id, str(error_action.rc),
+                   str(rdeps_nb), u"%2.1f" % percentage,
+                   _ids_cell(rdeps, report_format),
+                   _failed_nodes_of(error_action)]
+    if report_format != REPORT_FORMAT_TEXT:
+        _output_rows(report_format, u'error', header, _rows())
+        return
     try:
         percentage = (float(error_actions_nb) / actions_nb) * 100
     except ZeroDivisionError:
         percentage = 0.0
 
     _LOGGER.output("\nErrors: %d (%2.1f %%)\tLegend: " + \
-                   "rDeps=reverse dependencies, RC=returned code",
+                   "rDeps=reverse dependencies, RC=returned code," + \
+                   " @Nodes=nodes a remote action failed on",
                    error_actions_nb, percentage)
-    tab_values = []
-    # Sort by len() first then alphabetically so:
-    # b1, b2, b20, c1, c2, c10, c100 appears in that order
-    sorted_list = sorted(error_actions,
-                         key=lambda error_action: len(error_action.id))
-    for error_action in sorted(sorted_list,
-                               key=lambda error_action: error_action.id):
-        rdeps = error_action.next()
-        rdeps_nb = len(rdeps)
-        percentage = (float(rdeps_nb) / actions_nb) * 100
-        nodeset = NodeSet()
-        for rdep in error_action.next():
-            if len(rdep) != 0:
-                nodeset.add(rdep)
-        tab_values.append([error_action.id, str(error_action.rc),
-                           str(rdeps_nb), u"%2.1f" % percentage, str(nodeset)])
-    output = smart_display([u"Id", u"RC",
-                            u"#rDeps", u"%rDeps",
-                            u"rDeps"],
-                           tab_values, vsep=u" | ",
+    output = smart_display(header,
+                           list(_rows()), vsep=u" | ",
                            justify=[str.center, str.center,
                                     str.center, str.center,
-                                    str.ljust])
+                                    str.ljust, str.ljust])
     _LOGGER.output(output)
 
 def _report_unexec_line(id_, deps_nb, mdeps_nb, mdeps_percent, mdeps):
@@ -329,15 +413,43 @@ def _report_unexec_line(id_, deps_nb, mdeps_nb, mdeps_percent, mdeps):
                                          mdeps_percent,
                                          mdeps))
 
-def _report_unexec(a_model, execution):
+def _report_unexec(a_model, execution, report_format=REPORT_FORMAT_TEXT):
     """
     Display the 'unexec' type of report
     """
+    header = [u"Id", u"#Deps", u"#mDeps", u"%mDeps", u"mDeps"]
     all_actions_set = set(a_model.actions.keys())
     all_actions_set_nb = len(all_actions_set)
     executed_actions_set = set(execution.executed_actions.keys())
+    error_actions_set = set(execution.error_actions.keys())
     unexecuted_actions_set = all_actions_set.difference(executed_actions_set)
     unexecuted_actions_nb = len(unexecuted_actions_set)
+    def _rows():
+        """
+        Yield the row of each unexecuted action
+        """
+        # Sort by len() first then alphabetically so:
+        # b1, b2, b20, c1, c2, c10, c100 appears in that order
+        sorted_list = sorted(unexecuted_actions_set, key = len)
+        for id_ in sorted(sorted_list):
+            action = a_model.actions[id_]
+            all_deps = action.all_deps()
+            all_deps_nb = len(all_deps)
+            missings = set(dep for dep in all_deps
+                           if dep not in executed_actions_set or \
+                               dep in error_actions_set)
+            missing_nb = len(missings)
+            try:
+                percentage = ((float(missing_nb) / all_deps_nb) * 100)
+            except ZeroDivisionError:
+                percentage = 0.0
+            yield [id_, str(all_deps_nb),
+                   str(missing_nb),
+                   u"%2.1f" % percentage,
+                   _ids_cell(missings, report_format)]
+    if report_format != REPORT_FORMAT_TEXT:
+        _output_rows(report_format, u'unexec', header, _rows())
+        return
     try:
         percentage = (float(unexecuted_actions_nb) / all_actions_set_nb) * 100
     except ZeroDivisionError:
@@ -346,80 +458,79 @@ def _report_unexec(a_model, execution):
                        "Legend: mDeps=missings (error or unexecuted)" + \
                        " dependencies",
                    unexecuted_actions_nb, percentage)
-    tab_values = []
-    # Sort by len() first then alphabetically so:
-    # b1, b2, b20, c1, c2, c10, c100 appears in that order
-    sorted_list = sorted(unexecuted_actions_set, key = len)
-    for id_ in sorted(sorted_list):
-        action = a_model.actions[id_]
-        all_deps = action.all_deps()
-        all_deps_nb = len(all_deps)
-        unexec = set(all_deps) - set(execution.executed_actions.keys())
-        error = set(all_deps) & set(execution.error_actions.keys())
-        missings = unexec.union(error)
-        nodeset = NodeSet()
-        missing_nb = len(missings)
-        for missing in missings:
-            if len(missing) != 0:
-                nodeset.add(missing)
-        try:
-            percentage = ((float(missing_nb) / all_deps_nb) * 100)
-        except ZeroDivisionError:
-            percentage = 0.0
-        tab_values.append([id_, str(len(all_deps)),
-                           str(missing_nb),
-                           u"%2.1f" % percentage,
-                           str(nodeset)])
-    output = smart_display([u"Id", u"#Deps",
-                            u"#mDeps", u"%mDeps",
-                            u"mDeps"],
-                           tab_values, vsep=u" | ",
+    output = smart_display(header,
+                           list(_rows()), vsep=u" | ",
                            justify=[str.center, str.center,
                                     str.center, str.center,
                                     str.ljust])
     _LOGGER.output(output)
 
+def _report_critical(execution, report_format=REPORT_FORMAT_TEXT):
+    """
+    Display the 'critical' type of report
+    """
+    header = [u"Id", u"Critical", u"Duration", u"Slack"]
+    (optimal_time, path, slacks) = api.get_critical_path(execution)
+    critical = set(path)
+    actions = execution.executed_actions
+    def _rows():
+        """
+        Yield the row of each executed action: the critical path
+        first, in execution order, then other actions by increasing
+        slack.
+        """
+        others = sorted(set(actions) - critical,
+                        key=lambda id_: (slacks[id_], id_))
+        for id_ in path + others:
+            action = actions[id_]
+            duration = action.ended_time - action.started_time
+            yield [id_, "*" if id_ in critical else "",
+                   str(timedelta(seconds=duration)),
+                   str(timedelta(seconds=slacks[id_]))]
+    if report_format != REPORT_FORMAT_TEXT:
+        _output_rows(report_format, u'critical', header, _rows())
+        return
+    _LOGGER.output("\nCritical Path: %d actions, Optimal Time: %s\t" + \
+                       "Legend: *=on the critical path",
+                   len(path), timedelta(seconds=optimal_time))
+    output = smart_display(header,
+                           list(_rows()), vsep=u" | ",
+                           justify=[str.ljust, str.center,
+                                    str.center, str.center])
+    _LOGGER.output(output)
+
 def _diplay_stats_duration(type_, duration, percent):
     """
     Return a string representing a duration in the stats report.
     """
     return "%s Duration: %s (%2.1f %%)" % (type_, duration, percent)
 
-def report_stats(execution, prep_info, model_info, exec_info):
+def report_stats(execution, *stages_info):
     """
     Return a list of strings representing statistics on the given
     execution.
 
     - 'execution' is the execution for which stats should be produced.
-    - '*_info' are 3-tuplet (label, start, stop) where 'start' and
-      'stop' are time values and 'label' is a string.
+    - 'stages_info' are 3-tuplet (label, start, stop) where 'start' and
+      'stop' are time values and 'label' is a string, one for each
+      stage, in order. The last stage is the execution.
 
-    prep label is (normally) one of: 'DepMake', 'Parsing'
-    model label is (normally) one of: 'SeqMake', 'Modeling'
-    exec label is (normally) one of: 'SeqExec', 'Execution'
+    labels are (normally) either: 'DepMake', 'SeqMake', 'SeqExec' or
+    'Loading', 'Execution'
     """
     strings = []
-    (prep_label, prep_start, prep_stop) = prep_info
-    (model_label, model_start, model_stop) = model_info
-    (exec_label, exec_start, exec_stop) = exec_info
-    overall_time = dt.fromtimestamp(exec_stop) - dt.fromtimestamp(prep_start)
+    overall_time = dt.fromtimestamp(stages_info[-1][2]) - \
+        dt.fromtimestamp(stages_info[0][1])
     overall_raw = td_to_seconds(overall_time)
 
-    duration = dt.fromtimestamp(prep_stop) - dt.fromtimestamp(prep_start)
-    percent = (td_to_seconds(duration) /  overall_raw) * 100
-    strings.append(_diplay_stats_duration(prep_label, duration, percent))
-
-    duration = dt.fromtimestamp(model_stop) - dt.fromtimestamp(model_start)
-    percent = (td_to_seconds(duration) /  overall_raw) * 100
-    strings.append(_diplay_stats_duration(model_label, duration, percent))
-
-    duration = dt.fromtimestamp(exec_stop) - dt.fromtimestamp(exec_start)
-    percent = (td_to_seconds(duration) / overall_raw) * 100
-    strings.append(_diplay_stats_duration(exec_label, duration, percent))
+    for (label, start, stop) in stages_info:
+        duration = dt.fromtimestamp(stop) - dt.fromtimestamp(start)
+        percent = (td_to_seconds(duration) /  overall_raw) * 100
+        strings.append(_diplay_stats_duration(label, duration, percent))
 
     seq_time = _compute_seq_total_time(execution)
     speedup = td_to_seconds(seq_time) / td_to_seconds(overall_time)
-    optimal_time = _compute_optimal_time(execution)
+    optimal_time = api.get_critical_path(execution)[0]
     try:
         overhead = td_to_seconds(overall_time) / optimal_time
     except ZeroDivisionError:
@@ -436,39 +547,82 @@ def report_stats(execution, prep_info, model_info, exec_info):
     return strings
 
 
-def execute(the_model, options):
+def get_resource_limits(config):
+    """
+    Return the {resource_kind: limit} mapping specified by the
+    'resource.<kind>' options of the seqexec section of the given
+    configuration.
+    """
+    limits = dict()
+    if not config.has_section(SEQEXEC_ACTION_NAME):
+        return limits
+    for (name, value) in config.items(SEQEXEC_ACTION_NAME):
+        if not name.startswith(RESOURCE_LIMIT_PREFIX):
+            continue
+        kind = name[len(RESOURCE_LIMIT_PREFIX):]
+        limit = int(value)
+        if limit < 1:
+            raise ValueError("Resource limit %s should be positive: %s" % \
+                                 (name, value))
+        limits[kind] = limit
+    return limits
+
+
+def execute(the_model, options, limits=None):
     """
     Execute the sequence of instructions represented by the given
-    model using the given options.
+    model using the given options and the given resource limits (see
+    get_resource_limits()).
 
     Options should have the following attributes:
     - force
     - doexec
     - progress
+    - fanout
+    - schedule (optional)
+    - history (optional): the durations history file, used by the
+      critical scheduling, and updated after the execution.
     """
     doexec = True if getattr(options, 'doexec', 'yes') == 'yes' else False
-    return api.execute_model(the_model,
-                             options.force,
-                             doexec,
-                             options.progress,
-                             options.fanout)
-
-
-def report(report_type, the_model, execution):
+    schedule = getattr(options, 'schedule', api.SCHEDULE_FIFO)
+    history_file = replace_if_none(getattr(options, 'history', None))
+    durations = None
+    if history_file is not None and schedule == api.SCHEDULE_CRITICAL:
+        durations = history.load(history_file)
+    execution = api.execute_model(the_model,
+                                  options.force,
+                                  doexec,
+                                  options.progress,
+                                  options.fanout,
+                                  schedule,
+                                  durations,
+                                  limits)
+    if history_file is not None and doexec:
+        history.update(history_file, execution)
+    return execution
+
+
+def report(report_type, the_model, execution,
+           report_format=REPORT_FORMAT_TEXT):
     """
-    Output a report of the given type, for the given model and execution.
+    Output a report of the given type, for the given model and
+    execution, in the given format (one of REPORT_FORMATS).
     """
     assert report_type in REPORT_TYPES
+    assert report_format in REPORT_FORMATS
     if report_type != 'none':
-        _LOGGER.output(get_header(" REPORTS ", "=", REPORT_HEADER_SIZE))
+        if report_format == REPORT_FORMAT_TEXT:
+            _LOGGER.output(get_header(" REPORTS ", "=", REPORT_HEADER_SIZE))
         if report_type == 'all' or report_type == 'model':
-            _report_model(the_model)
+            _report_model(the_model, report_format)
         if report_type == 'all' or report_type == 'exec':
-            _report_exec(execution)
+            _report_exec(execution, report_format)
         if report_type == 'all' or report_type == 'error':
-            _report_error(execution)
+            _report_error(execution, report_format)
         if report_type == 'all' or report_type == 'unexec':
-            _report_unexec(the_model, execution)
+            _report_unexec(the_model, execution, report_format)
+        if report_type == 'all' or report_type == 'critical':
+            _report_critical(execution, report_format)
 
 
 def seqexec(db, config, args):
@@ -479,40 +633,43 @@ def seqexec(db, config, args):
 
     _LOGGER.debug("Reading from: %s", options.src)
     src = options.src
-    if src == '-':
-        src = sys.stdin
-
-    parser_start = time.time()
-    the_parser = parser.ISEParser(src)
-    parser_stop = time.time()
 
     # Provide the graphing capability even in the case of a
     # CycleDetectedError. Graph can be used to visualize such cycles.
     the_model = None
     dag = None
     try:
-        model_start = time.time()
-        the_model = model.Model(the_parser.root)
+        load_start = time.time()
+        if src == '-':
+            the_model = load_model(sys.stdin, not options.novalidate)
+        else:
+            with open(src, 'rb') as afile:
+                the_model = load_model(afile, not options.novalidate)
         dag = the_model.dag
-        model_stop = time.time()
+        load_stop = time.time()
     except CyclesDetectedError as cde:
         # A cycle leads to an error, since it prevents the normal
         # execution.
         _LOGGER.critical(str(cde))
         dag = cde.graph
 
+    if the_model is not None and options.compileto is not None:
+        with open(options.compileto, 'wb') as afile:
+            compiled.dump(the_model, afile)
+        _LOGGER.debug("Compiled model written to: %s", options.compileto)
+
     if the_model is not None:
         exec_start = time.time()
-        execution = execute(the_model, options)
+        execution = execute(the_model, options,
+                            get_resource_limits(config))
         exec_stop = time.time()
 
-        report(options.report, the_model, execution)
+        report(options.report, the_model, execution, options.reportformat)
 
         if getattr(options, 'dostats', 'no') == 'yes':
             _LOGGER.output(get_header(" STATS ", "=", REPORT_HEADER_SIZE))
             for line in report_stats(execution,
-                                     ('Parsing', parser_start, parser_stop),
-                                     ('Modelling', model_start, model_stop),
+                                     ('Loading', load_start, load_stop),
                                      ('Execution', exec_start, exec_stop)):
                 _LOGGER.output(line)
 
@@ -530,7 +687,7 @@ def seqexec(db, config, args):
     # - if an error occurs in next steps it does not prevent the
     # execution of anything useful
     if options.actionsgraphto is not None:
-        write_graph_to(dag, options.actionsgraphto)
+        write_graph_to(model.actions_graph_of(dag), options.actionsgraphto)
 
     return execution.rc if the_model is not None else os.EX_DATAERR
 
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Compiled ISE models.
+
+A compiled model is a binary serialization of an already checked ISE
+model: loading it requires neither XML parsing, nor validation, nor
+graph construction and checks. Its layout is:
+
+    - the header: MAGIC, FORMAT_VERSION, and the length and CRC32 of
+      the payload (little-endian unsigned 32 bits integers);
+    - the payload: a sequence of sections, each one prefixed by its
+      length in bytes.
+
+Sections are, in order:
+
+    - the strings table: each distinct string of the model, UTF-8
+      encoded and separated by NUL characters (which XML forbids);
+    - the nodes of the graph, by node id: the index of an action id
+      in the strings table, or -(n + 1) for the n-th barrier;
+    - the graph adjacency in CSR format (see
+      FrozenDigraph.csr_arrays());
+    - the actions table: for each action, its node id and the index
+      of its command in the strings table (-1 if none), and the
+      offsets of its XML attributes in the attributes table;
+    - the attributes table: pairs of (name, value) indexes in the
+      strings table.
+
+Integer arrays are little-endian signed 32 bits integers.
+
+The instructions tree (seq and par) is not part of a compiled model:
+Model.instructions is empty.
+"""
+import gc
+import struct
+import sys
+import zlib
+from array import array
+from logging import getLogger
+
+from sequencer.commons import SequencerError, get_version
+from sequencer.graph import FrozenDigraph
+from sequencer.ise import model, parser
+
+
+__author__ = "Pierre Vigneras"
+__copyright__ = "Copyright (c) 2010 Bull S.A.S."
+__credits__ = ["Pierre Vigneras"]
+__version__ = get_version()
+
+_LOGGER = getLogger(__name__)
+
+MAGIC = 'SEQISEC\n'
+# Increase on any change of the layout
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<%dsIII' % len(MAGIC))
+_SECTION_LENGTH = struct.Struct('<I')
+_STRING_SEPARATOR = u'\0'
+_SWAP = sys.byteorder != 'little'
+
+
+class BadCompiledModelError(SequencerError):
+    """
+    Raised when a compiled model can't be loaded.
+    """
+    pass
+
+
+def _array_to_bytes(an_array):
+    """
+    Return the little-endian bytes of the given array of integers.
+    """
+    result = array('i', an_array)
+    if _SWAP:
+        result.byteswap()
+    return result.tostring()
+
+def _array_from_bytes(data):
+    """
+    Return the array of integers of the given little-endian bytes.
+    """
+    result = array('i')
+    result.fromstring(data)
+    if _SWAP:
+        result.byteswap()
+    return result
+
+def dump(a_model, afile):
+    """
+    Write the compiled version of the given model to the given file
+    object (opened in binary mode).
+    """
+    strings = []
+    indexes = {}
+    def _intern(string):
+        """
+        Return the index of the given string in the strings table.
+        """
+        if string is None:
+            return -1
+        index = indexes.get(string)
+        if index is None:
+            index = len(strings)
+            indexes[string] = index
+            strings.append(string)
+        return index
+
+    dag = a_model.dag
+    nodes = array('i')
+    for node in (dag.node_from_id(i) for i in xrange(dag.ids_count())):
+        if isinstance(node, model.Barrier):
+            nodes.append(-(node.number + 1))
+        else:
+            assert node in a_model.actions, node
+            nodes.append(_intern(node))
+    actions = array('i')
+    attributes_offsets = array('i', [0])
+    attributes = array('i')
+    for action in a_model.actions.values():
+        actions.append(dag.node_id(action.id))
+        actions.append(_intern(action.command))
+        items = action.attributes.items()
+        if parser.ID_ATTR not in action.attributes:
+            # Keep the generated id
+            items.append((parser.ID_ATTR, action.id))
+        for (name, value) in items:
+            attributes.append(_intern(name))
+            attributes.append(_intern(value))
+        attributes_offsets.append(len(attributes))
+    sections = [_STRING_SEPARATOR.join(unicode(string)
+                                       for string in strings).encode('utf-8'),
+                _array_to_bytes(nodes)]
+    sections.extend(_array_to_bytes(an_array)
+                    for an_array in dag.csr_arrays())
+    sections.extend([_array_to_bytes(actions),
+                     _array_to_bytes(attributes_offsets),
+                     _array_to_bytes(attributes)])
+    payload = ''.join(_SECTION_LENGTH.pack(len(section)) + section
+                      for section in sections)
+    afile.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(payload),
+                             zlib.crc32(payload) & 0xffffffff))
+    afile.write(payload)
+    _LOGGER.debug("Compiled model written: %d actions, %d strings",
+                  len(a_model.actions), len(strings))
+
+def is_compiled(data):
+    """
+    Return True if the given bytes are the beginning of a compiled
+    model (at least len(MAGIC) bytes).
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+def load(afile, header=''):
+    """
+    Return the model read from the given compiled model file object
+    (opened in binary mode). header are the bytes already read from
+    the file object, if any (see is_compiled()).
+
+    Raise a BadCompiledModelError if the file is not a compiled model
+    of the current format version or if it is corrupted.
+    """
+    data = header + afile.read(_HEADER.size - len(header))
+    if len(data) != _HEADER.size or not is_compiled(data):
+        raise BadCompiledModelError("Not a compiled model")
+    (_, version, length, crc) = _HEADER.unpack(data)
+    if version != FORMAT_VERSION:
+        raise BadCompiledModelError("Unsupported compiled model version:" + \
+                                        " %d (expected: %d)." % \
+                                        (version, FORMAT_VERSION) + \
+                                        " It should be compiled again.")
+    payload = afile.read(length)
+    if len(payload) != length or zlib.crc32(payload) & 0xffffffff != crc:
+        raise BadCompiledModelError("Corrupted compiled model")
+    sections = []
+    offset = 0
+    while offset < length:
+        (size,) = _SECTION_LENGTH.unpack_from(payload, offset)
+        offset += _SECTION_LENGTH.size
+        sections.append(payload[offset:offset + size])
+        offset += size
+    strings = sections[0].decode('utf-8').split(_STRING_SEPARATOR)
+    (nodes, succ_offsets, succ_targets, pred_offsets, pred_targets,
+     actions, attributes_offsets, attributes) = [_array_from_bytes(section)
+                                                 for section in sections[1:]]
+    dag = FrozenDigraph.from_csr_arrays([strings[i] if i >= 0 \
+                                             else model.Barrier(-i - 1)
+                                         for i in nodes],
+                                        (succ_offsets, succ_targets,
+                                         pred_offsets, pred_targets))
+    a_model = model.Model()
+    a_model.dag = dag
+    # Objects created below live as long as the model: prevent the
+    # garbage collector from scanning them again and again while they
+    # are created.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for n in xrange(len(actions) // 2):
+            (start, end) = attributes_offsets[n], attributes_offsets[n + 1]
+            action_attributes = dict((strings[attributes[i]],
+                                      strings[attributes[i + 1]])
+                                     for i in xrange(start, end, 2))
+            command = actions[2 * n + 1]
+            action = model.Action.restore(action_attributes,
+                                          strings[command] if command >= 0 \
+                                              else None,
+                                          dag)
+            assert dag.node_id(action.id) == actions[2 * n]
+            a_model.actions[action.id] = action
+            a_model.deps.update(action.deps)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return a_model
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Durations history of actions.
+
+The history is a text file with one line per action of the following
+form:
+
+    duration<TAB>action_id
+
+where duration is the duration in seconds of the last execution of
+the action with the given id.
+
+Actions of coalesced components (see seqmake --coalesce) have an id
+made of the folded NodeSet of the components names, such as
+'n[1-3]#compute@hw/PowerOff', which changes whenever the membership
+changes: their durations are therefore recorded per component
+('n1#compute@hw/PowerOff', ...), and looked up the same way.
+"""
+import codecs
+import os
+from logging import getLogger
+
+from ClusterShell.NodeSet import NodeSet, NodeSetException
+from sequencer.commons import get_version
+
+
+__author__ = "Pierre Vigneras"
+__copyright__ = "Copyright (c) 2010 Bull S.A.S."
+__credits__ = ["Pierre Vigneras"]
+__version__ = get_version()
+
+_LOGGER = getLogger(__name__)
+
+_SEPARATOR = u'\t'
+
+def load(filename):
+    """
+    Return the mapping {action_id: duration} read from the given
+    history file. An empty mapping is returned if the file does not
+    exist.
+    """
+    durations = {}
+    if not os.path.exists(filename):
+        _LOGGER.debug("No such durations history: %s", filename)
+        return durations
+    with codecs.open(filename, 'r', encoding='utf-8') as history:
+        for line in history:
+            (duration, sep, id_) = line.rstrip(u'\n').partition(_SEPARATOR)
+            try:
+                durations[id_] = float(duration)
+            except ValueError:
+                _LOGGER.warning("%s: ignoring malformed line: %r",
+                                filename, line)
+    return durations
+
+def _ids_of(id_):
+    """
+    Return the list of per component action ids the given action id
+    stands for: a single one, unless the action is made on a folded
+    NodeSet of components.
+    """
+    (component, sep, rulename) = id_.rpartition(u'/')
+    (name, sep_type, fulltype) = component.partition(u'#')
+    if not sep or not sep_type:
+        return [id_]
+    try:
+        nodeset = NodeSet(name)
+    except NodeSetException:
+        return [id_]
+    if len(nodeset) < 2:
+        return [id_]
+    return [u"%s#%s/%s" % (node, fulltype, rulename) for node in nodeset]
+
+def duration_of(durations, id_, default):
+    """
+    Return the duration of the given action id from the given
+    {action_id: duration} mapping: for an action made on a folded
+    NodeSet of components, the longest known duration of its
+    components. Return default when no duration is known.
+    """
+    if id_ in durations:
+        return durations[id_]
+    known = [durations[member] for member in _ids_of(id_)
+             if member in durations]
+    return max(known) if known else default
+
+def update(filename, execution):
+    """
+    Update the given history file with the durations of the actions
+    executed by the given execution.
+    """
+    durations = load(filename)
+    for id_, action in execution.executed_actions.items():
+        started = getattr(action, 'started_time', None)
+        ended = getattr(action, 'ended_time', None)
+        if started is not None and ended is not None:
+            for member in _ids_of(id_):
+                durations[member] = ended - started
+    tmp = filename + '.tmp'
+    with codecs.open(tmp, 'w', encoding='utf-8') as history:
+        for id_ in sorted(durations):
+            history.write(u"%r%s%s\n" % (durations[id_], _SEPARATOR, id_))
+    os.rename(tmp, filename)
+    _LOGGER.debug("Durations history updated: %s", filename)
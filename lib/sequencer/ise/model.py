@@ -22,14 +22,15 @@ ISE Model implementation
 """
 from __future__ import print_function
 
+import sys
 import uuid
 from logging import getLogger
 
-from sequencer.commons import InternalError, CyclesDetectedError, get_version
+from sequencer.commons import SequencerError, InternalError, \
+    CyclesDetectedError, get_version
 from sequencer.ise import parser
 from sequencer.ise.errors import BadDepError, UnknownDepsError
-from pygraph.algorithms.cycles import find_cycle
-from pygraph.classes.digraph import digraph
+from sequencer.graph import Digraph, find_cycle
 from pygraph.classes.exceptions import AdditionError
 
 
@@ -56,10 +57,60 @@ def _get_element_from_xml(element, dag):
 def _add_all_edges(src_set, dest_set, graph):
     """
     Create edges from all src_set element to each element in dest_set in the given graph.
+
+    When this requires more edges than len(src_set) + len(dest_set),
+    a Barrier is inserted instead: each src_set element has an edge
+    to the barrier which has an edge to each dest_set element.
     """
+    if len(src_set) * len(dest_set) <= len(src_set) + len(dest_set):
+        for src in src_set:
+            for dst in dest_set:
+                _add_edge(src, dst, graph)
+        return
+    # Explicit dependencies have already been added: check they are
+    # not redundant with the ones we are about to create as
+    # _add_edge() does.
+    for src in src_set:
+        if graph.has_node(src):
+            for dst in graph.neighbors(src):
+                if dst in dest_set:
+                    raise BadDepError([src, dst])
+    barrier = Barrier(len(graph))
+    graph.add_node(barrier)
+    _LOGGER.debug("Creating: %s -> %s -> %s", src_set, barrier, dest_set)
     for src in src_set:
-        for dst in dest_set:
-            _add_edge(src, dst, graph)
+        _add_edge(src, barrier, graph)
+    for dst in dest_set:
+        _add_edge(barrier, dst, graph)
+
+def _actions_from(graph, nodes, adjacent):
+    """
+    Return the list of the given nodes where barriers are replaced by
+    their adjacent nodes (either graph.neighbors or graph.incidents).
+    """
+    result = []
+    for node in nodes:
+        if isinstance(node, Barrier):
+            result.extend(adjacent(node))
+        else:
+            result.append(node)
+    return result
+
+def actions_graph_of(dag):
+    """
+    Return a new Digraph of the actions of the given model graph:
+    barriers are replaced by the edges they stand for, as in
+    Action.next() and Action.all_deps(). This is the graph reported to
+    users.
+    """
+    result = Digraph()
+    actions = [node for node in dag.nodes() if not isinstance(node, Barrier)]
+    result.add_nodes(actions)
+    for action in actions:
+        for dep in _actions_from(dag, dag.neighbors(action), dag.neighbors):
+            if not result.has_edge((action, dep)):
+                result.add_edge((action, dep))
+    return result
 
 def _add_edge(src, dst, graph):
     """
@@ -78,26 +129,144 @@ def _add_edge(src, dst, graph):
         _LOGGER.error(str(addition_error))
         raise BadDepError([src, dst])
 
+class Barrier(object):
+    """
+    An internal node of the model graph. It stands for a dependency of
+    each of its incidents on each of its neighbors.
+
+    Barriers are used between consecutive blocks of a sequence: a
+    sequence of two parallels of n actions requires 2n edges instead
+    of n*n. They are not actions: Action.next() and Action.all_deps()
+    go through them.
+    """
+    __slots__ = ['number']
+
+    def __init__(self, number):
+        self.number = number
+
+    def __str__(self):
+        return "barrier-%d" % self.number
+
+    __repr__ = __str__
+
+def load(afile, validate=True):
+    """
+    Return the Model of the ISE XML document read from the given file
+    (a file name or a file object).
+
+    The model is built while the document is parsed: an element is
+    dropped as soon as its instruction has been built. When validate
+    is False, the document is not validated against the ISE schema:
+    this is faster, but it should be used with trusted input only.
+
+    Raise an lxml.etree.DocumentInvalid if validate is True and the
+    document is not valid, as parser.ISEParser does.
+    """
+    events = parser.iterparse(afile, validate)
+    try:
+        a_model = _build_from(events)
+    except SequencerError:
+        if not validate:
+            raise
+        error = sys.exc_info()
+        # The schema reports errors at the end of the document only:
+        # an invalid document must be reported as such, not by the
+        # error its invalid elements led to.
+        for _ in events:
+            pass
+        raise error[0], error[1], error[2]
+    a_model.close()
+    return a_model
+
+def _build_from(events):
+    """
+    Return the (not closed) Model built from the given iterparse()
+    events.
+    """
+    a_model = Model()
+    # The instructions built from the children of each container
+    # element being parsed
+    stack = []
+    for (event, element) in events:
+        tag = element.tag
+        if event == 'start':
+            if not stack and tag != parser.NS_INSTRUCTIONS_TAG:
+                raise InternalError("Unknown root element: " + str(element))
+            if tag != parser.NS_ACTION_TAG:
+                stack.append([])
+            continue
+        if tag == parser.NS_ACTION_TAG:
+            instruction = Action(element, a_model.dag)
+        elif tag == parser.NS_SEQ_TAG:
+            instruction = Sequence(element, a_model.dag, stack.pop())
+        elif tag == parser.NS_PAR_TAG:
+            instruction = Parallel(element, a_model.dag, stack.pop())
+        elif tag == parser.NS_INSTRUCTIONS_TAG and len(stack) == 1:
+            for instruction in stack.pop():
+                a_model.add_instruction(instruction)
+            continue
+        else:
+            raise InternalError("Unknown element: " + str(element))
+        if not stack:
+            raise InternalError("Element outside of the root element: " + \
+                                    str(element))
+        stack[-1].append(instruction)
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    return a_model
+
 class Model(object):
     """
     The ISE model. An XML tree is parsed and transformed into such a model.
     """
-    def __init__(self, root):
+    def __init__(self, root=None, acyclic=False):
+        """
+        Build the model of the given XML root element. Without root,
+        the model is empty until instructions are added with
+        add_instruction() and close() is called (see load()).
+
+        acyclic is given to close().
+        """
         self.instructions = []
         self.actions = {}
         self.deps = set()
-        self.dag = digraph()
-        for element in list(root):
-            tree = _get_element_from_xml(element, self.dag)
-            self.instructions.append(tree)
-            self.actions.update(tree.actions)
-            self.deps.update(tree.deps)
-        self.check_deps()
-        self.check_cycles()
+        self.dag = Digraph()
+        if root is not None:
+            for element in list(root):
+                self.add_instruction(_get_element_from_xml(element,
+                                                           self.dag))
+            self.close(acyclic)
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__, self.__dict__)
 
+    def add_instruction(self, instruction):
+        """
+        Add the given top level instruction, built from the graph of
+        this model.
+        """
+        self.instructions.append(instruction)
+        self.actions.update(instruction.actions)
+        self.deps.update(instruction.deps)
+
+    def close(self, acyclic=False):
+        """
+        Check the model once all its instructions have been added.
+
+        If acyclic is True, the instructions are known to be acyclic
+        (such as the ones of the ISM algorithms): cycles are not
+        checked.
+        """
+        self.check_deps()
+        if not acyclic:
+            self.check_cycles()
+        # The graph is not modified anymore: use the compact read-only
+        # version for the execution.
+        self.dag = self.dag.freeze()
+        for action in self.actions.values():
+            action.dag = self.dag
+
     def check_deps(self):
         """
         We didn't find a good way to express in the XSD the constraint
@@ -115,9 +284,10 @@ class Model(object):
         """
         Raise a CyclesDetectedError if a cycle is detected.
         """
-        cycles = find_cycle(self.dag)
+        cycles = [node for node in find_cycle(self.dag)
+                  if not isinstance(node, Barrier)]
         if cycles:
-            raise CyclesDetectedError(cycles, self.dag)
+            raise CyclesDetectedError(cycles, actions_graph_of(self.dag))
 
 class InstructionBase(object):
     """
@@ -139,11 +309,17 @@ class InstructionBase(object):
 
 class InstructionsContainer(InstructionBase):
     """Base class for container type instructions: seq or par"""
-    def __init__(self, element, dag):
+    def __init__(self, element, dag, instructions=None):
+        """
+        instructions are the instructions already built from the
+        children of the given element, if any.
+        """
         InstructionBase.__init__(self, element)
+        if instructions is None:
+            instructions = [_get_element_from_xml(item, dag)
+                            for item in list(element)]
         self.instructions = []
-        for item in list(element):
-            instruction = _get_element_from_xml(item, dag)
+        for instruction in instructions:
             self.instructions.append(instruction)
             self.actions.update(instruction.actions)
             self.deps.update(instruction.deps)
@@ -154,8 +330,8 @@ class Sequence(InstructionsContainer):
     """
     This class represents a sequence in the ISE model.
     """
-    def __init__(self, element, dag):
-        InstructionsContainer.__init__(self, element, dag)
+    def __init__(self, element, dag, instructions=None):
+        InstructionsContainer.__init__(self, element, dag, instructions)
         if self.instructions:
             # Starts from first instructions of first block
             self.starting_set = self.instructions[0].starting_set
@@ -191,8 +367,8 @@ class Parallel(InstructionsContainer):
     """
     This class represents a Parallel in the ISE model.
     """
-    def __init__(self, element, dag):
-        InstructionsContainer.__init__(self, element, dag)
+    def __init__(self, element, dag, instructions=None):
+        InstructionsContainer.__init__(self, element, dag, instructions)
         self.starting_set = set()
         self.ending_set = set()
         for i in self.instructions:
@@ -212,40 +388,84 @@ class Action(InstructionBase):
     """
     def __init__(self, element, dag):
         InstructionBase.__init__(self, element)
-        self.attributes = element.attrib
-        self.id = self.attributes.get(parser.ID_ATTR,
-                                      str(uuid.uuid4()))
-        if element.text is None:
-            _LOGGER.warning("Action command is None for: %s" + \
-                                " This will raise an exception" + \
-                                " on execution!",  self.id)
-        self.command = element.text
-        # Update the graph
-        self.dag = dag
-        if not dag.has_node(self.id):
-            dag.add_node(self.id)
+        # A copy: the element is dropped once the model is built
+        self._add_to(dag, self._init_from(dict(element.attrib),
+                                          element.text, dag))
 
+    @classmethod
+    def create(cls, attributes, command, dag):
+        """
+        Return a new action with the given XML attributes and command,
+        added to the given graph (see sequencer.ise.builder).
+        """
+        action = cls.__new__(cls)
+        InstructionBase.__init__(action, attributes)
+        action._add_to(dag, action._init_from(attributes, command, dag))
+        return action
+
+    @classmethod
+    def restore(cls, attributes, command, dag):
+        """
+        Return the action with the given XML attributes and command,
+        already in the given graph (see sequencer.ise.compiled).
+        """
+        action = cls.__new__(cls)
+        InstructionBase.__init__(action, attributes)
+        action._init_from(attributes, command, dag)
+        return action
+
+    def _init_from(self, attributes, command, dag):
+        """
+        Initialize this action from the given XML attributes and
+        command. Return the list of its explicit dependencies.
+        """
+        self.attributes = attributes
+        self.id = attributes.get(parser.ID_ATTR)
+        if self.id is None:
+            self.id = str(uuid.uuid4())
+        self.command = command
+        self.dag = dag
         self.actions[self.id] = self
         # We start when this action starts.
         self.starting_set = set([self.id])
         # We end when this action ends.
         self.ending_set = set([self.id])
 
-        self.component_set = self.attributes.get(parser.COMPONENT_SET_ATTR,
-                                                 parser.DEFAULT_COMPONENT_SET)
-        self.remote = self.attributes.get(parser.REMOTE_ATTR,
-                                          "false").lower() in ['true', '1',
-                                                               't', 'y',
-                                                               'yes']
-        self.force = self.attributes.get(parser.FORCE_ATTR,
-                                         parser.DEFAULT_FORCE)
-        # Handle explicit dependencies
-        deps_string = self.attributes.get(parser.DEPS_ATTR)
+        self.component_set = attributes.get(parser.COMPONENT_SET_ATTR,
+                                            parser.DEFAULT_COMPONENT_SET)
+        self.remote = attributes.get(parser.REMOTE_ATTR,
+                                     "false").lower() in ['true', '1',
+                                                          't', 'y',
+                                                          'yes']
+        self.force = attributes.get(parser.FORCE_ATTR,
+                                    parser.DEFAULT_FORCE)
+        # Resource tags (such as 'pdu:pdu12') used by this action
+        resources_string = attributes.get(parser.RESOURCES_ATTR, "")
+        self.resources = [tag.strip()
+                          for tag in resources_string.split(',')
+                          if tag.strip()]
+        deps_string = attributes.get(parser.DEPS_ATTR)
+        deps = []
         if deps_string:
-            for string in deps_string.split(','):
-                dep = string.strip()
-                self.deps.add(dep)
-                _add_edge(self.id, dep, dag)
+            deps = [string.strip() for string in deps_string.split(',')]
+        self.deps.update(deps)
+        return deps
+
+    def _add_to(self, dag, deps):
+        """
+        Add this action and its given explicit dependencies to the
+        given graph.
+        """
+        if self.command is None:
+            _LOGGER.warning("Action command is None for: %s" + \
+                                " This will raise an exception" + \
+                                " on execution!",  self.id)
+        # Update the graph
+        if not dag.has_node(self.id):
+            dag.add_node(self.id)
+        # Handle explicit dependencies
+        for dep in deps:
+            _add_edge(self.id, dep, dag)
 
         _LOGGER.debug("New object: %s", self)
 
@@ -257,11 +477,13 @@ class Action(InstructionBase):
         """
         Return the set of action ids that depends on this action.
         """
-        return self.dag.incidents(self.id)
+        return _actions_from(self.dag, self.dag.incidents(self.id),
+                             self.dag.incidents)
 
     def all_deps(self):
         """
         Return the set of action ids, this action depends on
         (implicitely or explicitely)
         """
-        return self.dag.neighbors(self.id)
+        return _actions_from(self.dag, self.dag.neighbors(self.id),
+                             self.dag.neighbors)
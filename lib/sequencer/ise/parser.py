@@ -67,6 +67,7 @@ REMOTE_ATTR = "remote"
 FORCE_ATTR = "force"
 DEFAULT_FORCE = FORCE_ALLOWED
 DEPS_ATTR = "deps"
+RESOURCES_ATTR = "resources"
 
 SEQ_TAG = "seq"
 PAR_TAG = "par"
@@ -78,11 +79,84 @@ NS_PAR_TAG = NS_ISE + PAR_TAG
 NS_ACTION_TAG = NS_ISE + ACTION_TAG
 NS_INSTRUCTIONS_TAG = NS_ISE + INSTRUCTIONS_TAG
 
+# The compiled ISE XML schema, see get_schema()
+_SCHEMA = None
+
+def get_schema():
+    """
+    Return the ISE XML schema. It is compiled on the first call only.
+    """
+    global _SCHEMA
+    if _SCHEMA is None:
+        _SCHEMA = etree.XMLSchema(etree.parse(os.path.join(_RESOURCE_DIR,
+                                                           _ISE_XSD_FILENAME)))
+    return _SCHEMA
+
+
+class _UTF8Reader(object):
+    """
+    A file object returning the unicode strings read from the given
+    file object as UTF-8 encoded strings: lxml.etree.iterparse() only
+    reads bytes.
+    """
+    def __init__(self, afile):
+        self.afile = afile
+
+    def read(self, size=-1):
+        """
+        Read at most size bytes.
+        """
+        data = self.afile.read(size)
+        if isinstance(data, unicode):
+            return data.encode('utf-8')
+        return data
+
+
+def iterparse(afile, validate=True):
+    """
+    Return an iterator over the ('start', element) and ('end',
+    element) events of the ISE XML document read from the given file
+    (a file name or a file object), see lxml.etree.iterparse().
+
+    An lxml.etree.XMLSyntaxError is raised if the document is not well
+    formed. When validate is True, the document is validated against
+    the ISE schema while it is parsed: an lxml.etree.DocumentInvalid
+    is raised if it is not valid, as ISEParser does. Note that lxml
+    reports most validation errors at the end of the document only:
+    events of invalid elements may be returned before.
+    """
+    if afile is None:
+        raise ValueError("Invalid Argument: None")
+    if hasattr(afile, 'read'):
+        afile = _UTF8Reader(afile)
+    events = etree.iterparse(afile, events=('start', 'end'),
+                             remove_blank_text=True,
+                             remove_comments=True,
+                             schema=get_schema() if validate else None)
+    if not validate:
+        return events
+    return _validity_errors_of(events)
+
+def _validity_errors_of(events):
+    """
+    Return the given iterparse() events, where schema validation
+    errors are raised as lxml.etree.DocumentInvalid.
+    """
+    try:
+        for event in events:
+            yield event
+    except etree.XMLSyntaxError as xse:
+        if etree.ErrorTypes.SCHEMAV_NOROOT <= xse.code \
+                <= etree.ErrorTypes.SCHEMAV_MISC:
+            raise etree.DocumentInvalid(str(xse))
+        raise
+
+
 class ISEParser(object):
     """
     This class represents the parser of the ISE.
     """
-    def __init__(self, afile):
+    def __init__(self, afile, validate=True):
         if (afile is None):
             raise ValueError("Invalid Argument: None")
 
@@ -91,10 +165,8 @@ class ISEParser(object):
         parser = etree.XMLParser(remove_blank_text=True, remove_comments=True)
         tree = etree.parse(afile, parser)
         self.root = tree.getroot()
-        xsd_doc = etree.parse(os.path.join(_RESOURCE_DIR,
-                                           _ISE_XSD_FILENAME))
-        xsd = etree.XMLSchema(xsd_doc)
-        xsd.assertValid(self.root)
+        if validate:
+            get_schema().assertValid(self.root)
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__, self.__dict__)
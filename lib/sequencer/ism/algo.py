@@ -23,25 +23,29 @@ ISM Algorithm implementation
 Implements the actual algorithm that transforms a graph (usually
 computed by the DGM) into a sequence for execution.
 
-The result is a tuple (ise_model, xml) where xml is the XML that
-has been generated for the creation of the ise_model.
+The result is a tuple (ise_model, xml, error) where xml is the XML
+that has been generated for the creation of the ise_model, if any: the
+instructions sequence is created by a builder (see
+sequencer.ise.builder), by default the XMLBuilder.
 
 Graph should be a dag. Its nodes should have the following attributes:
 - rule.name -> rule.action: the action to execute.
+
+Algorithms accept a coalesce flag: when it is True, nodes with the
+same remote actions and the same dependencies are merged into a
+single node before the transformation (see
+_coalesce_remote_actions()).
 """
 from __future__ import print_function
 
 import logging
 
-import sequencer.ise.model as ise_model
-from sequencer.commons import SequencerError, CyclesDetectedError, \
-     get_version, remove_leaves
-from sequencer.ise.parser import ACTION, SEQ, PAR, ISE, \
-    NS_SEQ_TAG, DEPS_ATTR
+from sequencer.commons import CyclesDetectedError, get_version
+from sequencer.ise.builder import XMLBuilder
+from sequencer.ise.parser import DEPS_ATTR
 from sequencer.ise.rc import FORCE_ALLOWED
-from lxml import etree as ET
-from pygraph.algorithms.critical import transitive_edges
-from pygraph.algorithms.cycles import find_cycle
+from sequencer.graph import find_cycle, reduced_edges
+from ClusterShell.NodeSet import NodeSet, NodeSetParseError
 from pygraph.algorithms.sorting import topological_sorting
 
 
@@ -59,6 +63,9 @@ def _check_valid(graph):
     Check that the given graph is valid. This function does not return
     anything. It raise an exception however if the graph is considered
     invalid.
+
+    Cycles are detected afterwards, while useless dependencies are
+    removed (see _remove_useless_deps_and_nodes()).
     """
     if graph is None:
         raise ValueError("The given graph is None!")
@@ -66,52 +73,152 @@ def _check_valid(graph):
     if not graph.DIRECTED:
         raise ValueError("The given graph is not a directed graph!")
 
-    cycle = find_cycle(graph)
-    if len(cycle) != 0:
-        _LOGGER.error("A cycle has been detected")
-        raise CyclesDetectedError(cycle, graph)
 
+def _remove_useless_deps_and_nodes(graph):
+    """
+    Remove useless nodes i.e. nodes with no attributes are nodes with
+    no actions and can therefore be removed. Each of their ancestors
+    is linked to each of their descendants instead.
+
+    Remove also useless dependencies such as: A->B->C, A->C. In such a
+    case, A->C is useless.
 
-def _remove_useless_deps(graph):
+    Both are done in a single sweep over the graph (see
+    sequencer.graph.reduced_edges()): no useless dependency is created
+    while removing nodes. This sweep also detects cycles: a
+    CyclesDetectedError is raised before the graph is modified.
     """
-    Remove useless dependencies such as: A->B->C, A->C. In such a
-    case, A->C is useless. Such edge will be removed in the given graph.
+    reduced = reduced_edges(graph, lambda node: graph.node_attributes(node))
+    if reduced is None:
+        _LOGGER.error("A cycle has been detected")
+        raise CyclesDetectedError(find_cycle(graph), graph)
+    reduced = set(reduced)
+    for node in graph.nodes():
+        if len(graph.node_attributes(node)) == 0:
+            _LOGGER.info("Removing useless node (no action): %s", node)
+            graph.del_node(node)
+    for edge in graph.edges():
+        if edge not in reduced:
+            _LOGGER.info("Removing useless dependency: %s", edge)
+            graph.del_edge(edge)
+    for edge in reduced:
+        if not graph.has_edge(edge):
+            _LOGGER.debug("Adding edge: %s -> %s", edge[0], edge[1])
+            graph.add_edge(edge)
+
+def _get_remote_name_from(node, attributes):
+    """
+    Return a tuple (name, fulltype) for the given node (of the form
+    name#type@category) if its actions can be coalesced with the ones
+    of other nodes, None otherwise: all its actions should be remote
+    and its name should be a single node of a NodeSet.
     """
-    useless_edges = transitive_edges(graph)
-    for edge in set(useless_edges):
-        _LOGGER.info("Removing useless dependency: %s", edge)
-        graph.del_edge(edge)
+    for attribute in attributes:
+        if _get_cmd_remote_from(attribute[1])[1] != "true":
+            return None
+    (name, sep, fulltype) = node.rpartition('#')
+    if not sep:
+        return None
+    try:
+        nodeset = NodeSet(name)
+    except NodeSetParseError:
+        return None
+    if len(nodeset) != 1 or str(nodeset) != name:
+        return None
+    return (name, fulltype)
 
-def _remove_useless_nodes(graph):
+def _number(keys_of):
     """
-    Remove useless nodes i.e. nodes with no attributes are nodes with
-    no actions and can therefore be removed.
+    Return the ({node: class} mapping, classes count) where nodes with
+    equal keys in the given {node: key} mapping share the same class.
     """
+    classes = dict()
+    class_of = dict((node, classes.setdefault(key, len(classes)))
+                    for node, key in keys_of.iteritems())
+    return (class_of, len(classes))
+
+def _coalesce_remote_actions(graph):
+    """
+    Replace the nodes of the given (reduced) graph that have the same
+    remote actions (same rules, parameters and commands), the same
+    type, the same dependencies and the same reverse dependencies by
+    a single node: its name is the folded NodeSet of their names, so
+    each of its actions is executed on all of them by a single
+    ClusterShell worker.
+
+    Dependencies are compared once coalesced: groups are refined
+    until they are stable, so that parallel per node chains such as
+    n1#os -> n1#hw and n2#os -> n2#hw are coalesced into
+    n[1-2]#os -> n[1-2]#hw.
+
+    Such nodes are not linked to each other: the graph remains
+    acyclic.
+    """
+    keys_of = dict()
     for node in graph.nodes():
         attributes = graph.node_attributes(node)
-        if len(attributes) == 0:
-            _LOGGER.info("Removing useless node (no action): %s", node)
-            parents = frozenset(graph.incidents(node))
-            children = frozenset(graph.neighbors(node))
-            for parent in parents:
-                _LOGGER.debug("Removing edge: %s -> %s", parent, node)
-                graph.del_edge((parent, node))
-                for child in children:
-                    if graph.has_edge((node, child)):
-                        _LOGGER.debug("Removing edge: %s -> %s", node, child)
-                        graph.del_edge((node, child))
-                    _LOGGER.debug("Adding edge: %s -> %s", parent, child)
-                    graph.add_edge((parent, child))
+        remote_name = _get_remote_name_from(node, attributes)
+        if remote_name is None:
+            keys_of[node] = (node,)
+        else:
+            keys_of[node] = (remote_name[1], tuple(attributes))
+    (class_of, count) = _number(keys_of)
+    while True:
+        signatures = dict((node,
+                           (class_of[node],
+                            frozenset(class_of[dst]
+                                      for dst in graph.neighbors(node)),
+                            frozenset(class_of[src]
+                                      for src in graph.incidents(node))))
+                          for node in graph.nodes())
+        (refined, refined_count) = _number(signatures)
+        if refined_count == count:
+            break
+        (class_of, count) = (refined, refined_count)
+    groups = dict()
+    for node in graph.nodes():
+        groups.setdefault(class_of[node], []).append(node)
+    # The node standing for each class once coalesced
+    merged_of = dict()
+    for cls, nodes in groups.iteritems():
+        if len(nodes) < 2:
+            merged_of[cls] = nodes[0]
+            continue
+        fulltype = keys_of[nodes[0]][0]
+        merged_of[cls] = "%s#%s" % (NodeSet.fromlist(node.rpartition('#')[0]
+                                                     for node in nodes),
+                                    fulltype)
+    coalesced = [cls for cls, nodes in groups.iteritems() if len(nodes) > 1]
+    if not coalesced:
+        return
+    edges = set()
+    for cls in coalesced:
+        nodes = groups[cls]
+        merged = merged_of[cls]
+        _LOGGER.info("Coalescing remote actions of %d nodes into: %s",
+                     len(nodes), merged)
+        edges.update((merged, merged_of[class_of[dst]])
+                     for dst in graph.neighbors(nodes[0]))
+        edges.update((merged_of[class_of[src]], merged)
+                     for src in graph.incidents(nodes[0]))
+    for cls in coalesced:
+        for node in groups[cls]:
             graph.del_node(node)
+        graph.add_node(merged_of[cls], attrs=list(keys_of[groups[cls][0]][1]))
+    for edge in edges:
+        graph.add_edge(edge)
+    _remove_useless_deps_and_nodes(graph)
 
-def _prepare(graph, options=None):
+def _prepare(graph, coalesce=False):
     """
-    Perform various preparation on the given graph according to given
-    options.
+    Perform various preparation on the given graph. If coalesce is
+    True, remote actions are coalesced (see
+    _coalesce_remote_actions()).
     """
     _check_valid(graph)
-    _remove_useless_deps(graph)
-    _remove_useless_nodes(graph)
+    _remove_useless_deps_and_nodes(graph)
+    if coalesce:
+        _coalesce_remote_actions(graph)
 
 def _get_cmd_remote_from(cmd):
     """
@@ -152,9 +259,10 @@ def _get_info_from(node, attribute):
 
 def _create_actions_from(node, graph, create_deps=False):
     """
-    Create an XML action from the given node in the given graph.  if
-    'create_deps' is True, dependencies are expressed explicitely
-    (using the 'deps' action XML attribute)
+    Return the list of (command, attributes) of the actions of the
+    given node in the given graph. if 'create_deps' is True,
+    dependencies are expressed explicitely (using the 'deps' action
+    XML attribute)
     """
     actions = []
     attributes = graph.node_attributes(node)
@@ -164,25 +272,18 @@ def _create_actions_from(node, graph, create_deps=False):
         (cmd, remote) = _get_cmd_remote_from(attribute[1])
         (id_, params) = _get_info_from(node, attribute)
         component_set = node
+        action = {'id': id_,
+                  'component_set': component_set,
+                  'remote': remote,
+                  'force': params.get('force', FORCE_ALLOWED)}
         if create_deps:
             deps = []
             for dep in graph.neighbors(node):
                 dep_attributes = graph.node_attributes(dep)
                 for dep_attribute in dep_attributes:
                     deps.append(_get_info_from(dep, dep_attribute)[0])
-            action = ACTION(cmd,
-                            id=id_,
-                            component_set=component_set,
-                            deps=",".join(deps),
-                            remote=remote,
-                            force=params.get('force', FORCE_ALLOWED))
-        else:
-            action = ACTION(cmd,
-                            id=id_,
-                            component_set=component_set,
-                            remote=remote,
-                            force=params.get('force', FORCE_ALLOWED))
-        actions.append(action)
+            action[DEPS_ATTR] = ",".join(deps)
+        actions.append((cmd, action))
 
 
     if len(actions) == 0:
@@ -190,8 +291,15 @@ def _create_actions_from(node, graph, create_deps=False):
 
     return actions
 
+def _make_actions_from(builder, node_action_set):
+    """
+    Return the list of actions built by the given builder for the
+    given list of (command, attributes).
+    """
+    return [builder.action(cmd, **attributes)
+            for (cmd, attributes) in node_action_set]
 
-def _make_instruction_from(node_action_set):
+def _make_instruction_from(builder, node_action_set):
     """
     Return the instruction for the given set of actions.  The result
     is either a SEQ when the set contains more than one action, the action
@@ -204,104 +312,123 @@ def _make_instruction_from(node_action_set):
     if nb == 0:
         return None
 
+    actions = _make_actions_from(builder, node_action_set)
     if nb == 1:
-        return node_action_set[0]
+        return actions[0]
 
     assert len(node_action_set) > 1, "%r" % node_action_set
-    return SEQ(*node_action_set)
+    return builder.seq(*actions)
 
-def _create_final_xml_from(actions, ise_structure):
+def _create_final_result_from(builder, actions, ise_structure):
     """
-    Create the final XML document from the given set of actions.  The
-    given ise_structure is either a SEQ or a PAR. It is used only if
-    len(actions) > 1
+    Create the final result from the given set of actions.  The
+    given ise_structure is either builder.seq or builder.par. It is
+    used only if len(actions) > 1
 
     This method returns a tuple (ise_model, xml_document,
-    error).  if ise_model is None, error is the exception
-    that has been raised.
+    error) (see InstructionsBuilder.result()).
+
+    The dependency graph has been checked (see _prepare()) and
+    instructions follow its edges: they are acyclic by construction.
     """
     if len(actions) > 1:
         # Several actions should be enclosed by either a SEQ or a PAR
         # ISE structure.
-        xml_result = ISE(ise_structure(*actions))
+        return builder.result([ise_structure(*actions)], acyclic=True)
     elif len(actions) == 1:
         # We only have a single action, no need to include it in a PAR
         # or a SEQ.
-        xml_result = ISE(actions[0])
-    else:
-        # No action at all, make an empty document, PAR or SEQ is not
-        # required either.
-        _LOGGER.warning("No actions found at all!")
-        xml_result = ISE()
-
-    if _LOGGER.isEnabledFor(logging.DEBUG):
-        _LOGGER.debug("XML result is: %s",
-                      ET.tostring(xml_result, pretty_print=True))
-
-    # Gives the XML to the model so various check can be performed!
-    model = None
-    error = None
-    # Do not prevent cycle detections from writing the XML result to a
-    # file. This can be used for debugging purpose!
-    try:
-        model = ise_model.Model(xml_result)
-    except SequencerError as se:
-        error = se
-
-    return (model, xml_result, error)
+        return builder.result([actions[0]], acyclic=True)
+    # No action at all, make an empty document, PAR or SEQ is not
+    # required either.
+    _LOGGER.warning("No actions found at all!")
+    return builder.result([], acyclic=True)
 
-def order_seq_only(graph):
+def order_seq_only(graph, builder=None, coalesce=False):
     """
     A topological sort is performed on the graph. All actions are
     enclosed into a Sequence ISE structure.
     """
-    _prepare(graph)
+    _prepare(graph, coalesce)
+    if builder is None:
+        builder = XMLBuilder()
     nodes = topological_sorting(graph.reverse())
     actions = []
     for node in nodes:
-        actions.extend(_create_actions_from(node, graph, create_deps=False))
+        node_action_set = _create_actions_from(node, graph, create_deps=False)
+        actions.extend(_make_actions_from(builder, node_action_set))
 
-    return _create_final_xml_from(actions, SEQ)
+    return _create_final_result_from(builder, actions, builder.seq)
 
 
-def order_par_only(graph):
+def order_par_only(graph, builder=None, coalesce=False):
     """
     All instructions are executed within a Parallel ISE
     structure. Dependencies are specified using explicit dependencies
     (the deps ISE Action XML attribute).
     """
-    _prepare(graph)
+    _prepare(graph, coalesce)
+    if builder is None:
+        builder = XMLBuilder()
     instructions = []
     for node in graph.nodes():
         node_action_set = _create_actions_from(node, graph, create_deps=True)
-        i = _make_instruction_from(node_action_set)
+        i = _make_instruction_from(builder, node_action_set)
         if (i is not None):
             instructions.append(i)
 
-    return _create_final_xml_from(instructions, PAR)
+    return _create_final_result_from(builder, instructions, builder.par)
+
+
+class _PendingSequence(list):
+    """
+    The instructions of a SEQ that is not built yet: more
+    instructions can be appended to it (see order_optimal()).
+    """
+    pass
 
+def _make_block_from(builder, node_action_set):
+    """
+    Return the block for the given set of actions: a
+    _PendingSequence when the set contains more than one action, the
+    action itself if the set contains only one action, or None if the
+    set is empty.
+    """
+    actions = _make_actions_from(builder, node_action_set)
+    if len(actions) == 0:
+        return None
+    if len(actions) == 1:
+        return actions[0]
+    return _PendingSequence(actions)
 
+def _make_instruction_for(builder, block):
+    """
+    Return the instruction for the given block.
+    """
+    if isinstance(block, _PendingSequence):
+        return builder.seq(*block)
+    return block
 
-def _make_deps_leaf(node, node_action_set):
+def _make_deps_leaf(builder, node, node_action_set):
     """
-    Return the instruction for a leaf.
+    Return the block for a leaf.
     """
     _LOGGER.debug("Node %s is a leaf", node)
-    return _make_instruction_from(node_action_set)
+    return _make_block_from(builder, node_action_set)
 
-def _optimal_xml_block_for_root(graph, root, xml_cache):
+def _optimal_block_for_root(builder, graph, root, block_cache):
     """
-    Return the optimal XML block for the given root node.
+    Return the optimal block for the given root node.
     Note: the given 'root' *must* be a root in the graph!
 
-    xml_cache maps a node with its already computed xml block
+    block_cache maps a node with its already computed block
 
-    For a given (non-computed) node, the XML is created using the
+    For a given (non-computed) node, the block is created using the
     following schema:
 
     Create a PAR that includes each node.deps.
     Create a SEQ between the node and the created PAR.
-    return the SEQ as the XML block.
+    return the SEQ as the block.
 
     Things to take care of:
     Multiple actions -> SEQ
@@ -311,6 +438,9 @@ def _optimal_xml_block_for_root(graph, root, xml_cache):
 
     When a dep is already in the cache, an explicit dependency should
     be made instead of an implicit SEQ.
+
+    A SEQ block is a _PendingSequence: the SEQ of a dependency can
+    then be merged with the SEQ of the node before it is built.
     """
 
     def _make_explicit_deps(node_action_set, dep):
@@ -322,85 +452,92 @@ def _optimal_xml_block_for_root(graph, root, xml_cache):
         dep_attributes = graph.node_attributes(dep)
         for dep_attribute in dep_attributes:
             deps.append(_get_info_from(dep, dep_attribute)[0])
-        for action in node_action_set:
+        for (cmd, attributes) in node_action_set:
             new_deps = ",".join(deps)
-            current_deps = action.get(DEPS_ATTR)
+            current_deps = attributes.get(DEPS_ATTR)
             if (current_deps is None):
                 current_deps = new_deps
             else:
                 current_deps = current_deps + "," + new_deps
-            action.set(DEPS_ATTR, current_deps)
+            attributes[DEPS_ATTR] = current_deps
         return node_action_set
 
 
     def _make_deps_single(node, node_action_set, dep):
         """
-        Return the instruction for a node in the graph with a single
+        Return the block for a node in the graph with a single
         dependency.
         """
         # Only one child: make a SEQ with it directly
-        xml_block = _xml_block_for(graph, dep)
-        if (xml_block is None):
-            # Child XML block has already been computed
+        block = _block_for(graph, dep)
+        if (block is None):
+            # Child block has already been computed
             # Make an explicit dependency
             _LOGGER.debug("Making %s an explicit dependency of %s", dep, node)
             node_action_set = _make_explicit_deps(node_action_set, dep)
-            return _make_instruction_from(node_action_set)
+            return _make_block_from(builder, node_action_set)
 
         # A child does exist.
-        if (xml_block.tag == NS_SEQ_TAG):
+        if isinstance(block, _PendingSequence):
             _LOGGER.debug("Making %s an implicit dependency of %s (merging)",
                           dep, node)
             # It is already a sequence, we should merge with it
-            for action in node_action_set:
-                xml_block.append(action)
-            return xml_block
+            block.extend(_make_actions_from(builder, node_action_set))
+            return block
 
         # Make an implicit dependency
         _LOGGER.debug("Making %s an implicit dependency of %s", dep, node)
-        return SEQ(xml_block, _make_instruction_from(node_action_set))
+        return _PendingSequence([block,
+                                 _make_instruction_from(builder,
+                                                        node_action_set)])
 
     def _make_deps_several(node, node_action_set, deps):
         """
-        Return the instruction for a node in the graph with several
+        Return the block for a node in the graph with several
         dependencies.
         """
         par_dep = []
         for dep in deps:
-            xml_block = _xml_block_for(graph, dep)
-            if (xml_block is None):
-                # This dep XML block has already been computed
+            block = _block_for(graph, dep)
+            if (block is None):
+                # This dep block has already been computed
                 # Make an explicit dependendy
                 _LOGGER.debug("Making %s an explicit dependency of %s", dep, node)
                 node_action_set = _make_explicit_deps(node_action_set, dep)
             else:
                 # Add dep to the PAR group of implicit dependency
                 _LOGGER.debug("Making %s an implicit dependency of %s", dep, node)
-                par_dep.append(xml_block)
+                par_dep.append(block)
 
         if (len(par_dep) == 0):
             # No PAR has been computed, therefore the SEQ is also useless
-            return _make_instruction_from(node_action_set)
+            return _make_block_from(builder, node_action_set)
         elif (len(par_dep) == 1):
             # PAR is useless, but not the SEQ!
-            if (par_dep[0].tag == NS_SEQ_TAG):
+            if isinstance(par_dep[0], _PendingSequence):
                 # Dep is already a SEQ, merge with it
-                for action in node_action_set:
-                    par_dep[0].append(action)
+                par_dep[0].extend(_make_actions_from(builder,
+                                                     node_action_set))
                 return par_dep[0]
             # Add the SEQ
-            return SEQ(par_dep[0], _make_instruction_from(node_action_set))
+            return _PendingSequence([par_dep[0],
+                                     _make_instruction_from(builder,
+                                                            node_action_set)])
 
-        return SEQ(PAR(*par_dep), _make_instruction_from(node_action_set))
+        par = builder.par(*[_make_instruction_for(builder, block)
+                            for block in par_dep])
+        return _PendingSequence([par,
+                                 _make_instruction_from(builder,
+                                                        node_action_set)])
 
 
     def _make_deps(node, node_action_set, deps):
         """
-        Return the instruction for the given node with the given
+        Return the block for the given node with the given
         action set and dependencies.
         """
         if (len(deps) == 0):
-            return _make_deps_leaf(node, node_action_set)
+            return _make_deps_leaf(builder, node, node_action_set)
 
         if (len(deps) == 1):
             return _make_deps_single(node, node_action_set, deps[0])
@@ -412,51 +549,53 @@ def _optimal_xml_block_for_root(graph, root, xml_cache):
 
 
     # Internal recursive function
-    def _xml_block_for(graph, node):
+    def _block_for(graph, node):
         """
-        Return the XML block or None if the given node has already
+        Return the block or None if the given node has already
         been processed
         """
         _LOGGER.info("Treating %s", node)
-        if (node in xml_cache):
+        if (node in block_cache):
             _LOGGER.debug("Given node %s is already in cache.", node)
             return None
-        # Start creating the XML for the given node
+        # Start creating the block for the given node
         # Dependencies will be updated afterwards when required
         node_action_set = _create_actions_from(node,
                                                graph,
                                                create_deps=False)
         deps = graph.neighbors(node)
-        instruction = _make_deps(node, node_action_set, deps)
-        xml_cache[node] = instruction
-        return instruction
+        block = _make_deps(node, node_action_set, deps)
+        block_cache[node] = block
+        return block
 
-    return _xml_block_for(graph, root)
+    return _block_for(graph, root)
 
-def order_optimal(graph):
+def order_optimal(graph, builder=None, coalesce=False):
     """
     The optimal solution does the following:
 
     1. Starts from root nodes
-    2. for each such root node, create the optimal xml block
+    2. for each such root node, create the optimal block
     3. make a PAR block with those roots node
 
     """
-    _prepare(graph)
+    _prepare(graph, coalesce)
+    if builder is None:
+        builder = XMLBuilder()
     nodes = graph.nodes()
-    xml_cache = dict()
+    block_cache = dict()
     roots = []
     for node in nodes:
         # Starts from root nodes
         if (len(graph.incidents(node)) == 0):
-            instruction = _optimal_xml_block_for_root(graph, node, xml_cache)
-            if (instruction is not None):
-                roots.append(instruction)
+            block = _optimal_block_for_root(builder, graph, node, block_cache)
+            if (block is not None):
+                roots.append(_make_instruction_for(builder, block))
 
     # roots elements cat be started in parallel
-    return _create_final_xml_from(roots, PAR)
+    return _create_final_result_from(builder, roots, builder.par)
 
-def order_mixed(graph):
+def order_mixed(graph, builder=None, coalesce=False):
     """
     This algorithm does the following: it starts from
     leaves. Add them into a Parallel ISE structure. It removes
@@ -475,44 +614,51 @@ def order_mixed(graph):
 
     As a side effect, each action at layer n-1 will have s(n)
     dependencies on each action at layer n (action set at layer n is of
-    size s(n)). Therefore the number of edges in the final graph is in
-    Sum(s(i-1)*s(i)) for all i in [1, n] where n is the last action set
-    with no dependencies.
-
-    For clusters with thousands of nodes, this can lead to a very huge
-    number of edges (count several gigabytes of memory for their internal
-    representations)!
+    size s(n)). The ISE model does not create Sum(s(i-1)*s(i)) edges
+    for them though: a barrier node is inserted between consecutive
+    layers (see sequencer.ise.model.Barrier) so the number of edges
+    is in Sum(s(i-1) + s(i)).
 
     E.g: a->b, a->c, d->b, it returns seq(par(b,c),par(a,d)). And therefore
     d will have to wait the end of both b and c while only b is
     required.
+
+    Layers are computed with a counter of remaining neighbors per
+    node: when a layer is done, only incidents of its nodes are
+    updated, and those whose counter drops to zero make the next
+    layer. Within a layer, nodes keep the graph order.
     """
-    _prepare(graph)
+    _prepare(graph, coalesce)
+    if builder is None:
+        builder = XMLBuilder()
 
     nodes = graph.nodes()
+    rank = dict((node, i) for i, node in enumerate(nodes))
+    remaining = dict((node, len(graph.neighbors(node))) for node in nodes)
+    leaves = [node for node in nodes if remaining[node] == 0]
     par_list = []
-    while len(nodes) > 0:
+    while len(leaves) > 0:
         instructions = []
-        leaves = []
-        for node in nodes:
+        next_leaves = []
+        for node in leaves:
             _LOGGER.debug("Node: %s", node)
-            if len(graph.neighbors(node)) == 0:
-                leaves.append(node)
-                node_action_set = _create_actions_from(node,
-                                                       graph,
-                                                       create_deps=False)
-                i = _make_instruction_from(node_action_set)
-                if (i is not None):
-                    instructions.append(i)
+            node_action_set = _create_actions_from(node,
+                                                   graph,
+                                                   create_deps=False)
+            i = _make_instruction_from(builder, node_action_set)
+            if (i is not None):
+                instructions.append(i)
+            for parent in graph.incidents(node):
+                remaining[parent] -= 1
+                if remaining[parent] == 0:
+                    next_leaves.append(parent)
 
         if len(instructions) > 1:
-            par_list.append(PAR(*instructions))
+            par_list.append(builder.par(*instructions))
         elif len(instructions) == 1:
             par_list.append(instructions[0])
         else:
-            _LOGGER.debug("No instructions found in nodes: %s", nodes)
-        remove_leaves(graph, leaves)
-        nodes = graph.nodes()
-
-    return _create_final_xml_from(par_list, SEQ)
+            _LOGGER.debug("No instructions found in nodes: %s", leaves)
+        leaves = sorted(next_leaves, key=rank.get)
 
+    return _create_final_result_from(builder, par_list, builder.seq)
@@ -36,6 +36,7 @@ from os import EX_OK, path
 from sequencer.commons import get_version, add_options_to
 from sequencer.ism.algo import order_mixed, \
     order_seq_only, order_par_only, order_optimal
+from sequencer.ise import compiled
 from lxml import etree as ET
 from pygraph.readwrite.markup import read
 
@@ -82,7 +83,9 @@ def _parse(config, ism_args):
     cmd = path.basename(sys.argv[0])
     progname=to_unicode(cmd).encode('ascii', 'replace')
     opt_parser = optparse.OptionParser(usage, description=doc, prog=progname)
-    add_options_to(opt_parser, ['--file', '--out', '--algo'], config)
+    add_options_to(opt_parser, ['--file', '--out', '--algo', '--coalesce',
+                                '--compileto'],
+                   config)
     (ism_options, action_args) = opt_parser.parse_args(ism_args)
     if len(action_args) != 0:
         opt_parser.error(SEQMAKE_ACTION_NAME + \
@@ -90,13 +93,16 @@ def _parse(config, ism_args):
 
     return (ism_options, action_args)
 
-def makesequence(depgraph, algo_type):
+def makesequence(depgraph, algo_type, builder=None, coalesce=False):
     """
     Make the sequence for the given dependency graph using the given
-    algorithm type.
+    algorithm type and instructions builder (see
+    sequencer.ise.builder). The XML document is created by default.
+    If coalesce is True, remote actions are coalesced (see
+    sequencer.ism.algo).
     """
     algo = ALGO_TYPES[algo_type]
-    return algo(depgraph)
+    return algo(depgraph, builder, coalesce)
 
 def seqmake(db, config, ism_args):
     """
@@ -114,7 +120,9 @@ def seqmake(db, config, ism_args):
     xml = src.read()
     depgraph = read(xml)
 
-    (ise_model, xml_result, error) = makesequence(depgraph, ism_options.algo)
+    coalesce = ism_options.coalesce == 'yes'
+    (ise_model, xml_result, error) = makesequence(depgraph, ism_options.algo,
+                                                  None, coalesce)
     if error is not None:
         # Issue a warning here (and not error) since the only thing
         # really required is the availability of the xml_result
@@ -123,6 +131,11 @@ def seqmake(db, config, ism_args):
     dst = ism_options.out
     _LOGGER.debug("Writing to: %s", dst)
 
+    if ise_model is not None and ism_options.compileto is not None:
+        with open(ism_options.compileto, 'wb') as afile:
+            compiled.dump(ise_model, afile)
+        _LOGGER.debug("Compiled model written to: %s", ism_options.compileto)
+
     output = ET.tostring(xml_result, pretty_print=True, encoding="UTF-8")
     if dst == '-':
         _LOGGER.output(output)
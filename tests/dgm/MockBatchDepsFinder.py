@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+import os
+import sys
+
+
+# This script is used for unit testing of the Bull sequencer
+# Dependency Graph Maker stage: it implements the batch depsfinder
+# protocol. Each call is logged as a line in the given log file.
+
+if len(sys.argv) < 2:
+    print("Usage: " + sys.argv[0] + " logfile " + \
+              "id1=dep1,dep2 id2=dep3 ... idN=depN")
+    # From /usr/include/sysexits.h
+    sys.exit(os.EX_USAGE)
+
+deps_for = dict()
+for arg in sys.argv[2:]:
+    (id_, sep, deps) = arg.partition('=')
+    deps_for[id_] = deps.split(',')
+
+ids = [line.strip() for line in sys.stdin if len(line.strip()) != 0]
+with open(sys.argv[1], 'a') as log:
+    log.write(" ".join(ids) + "\n")
+
+for id_ in ids:
+    if id_ in deps_for:
+        print(id_ + " " + " ".join(deps_for[id_]))
+
+sys.exit(os.EX_OK)
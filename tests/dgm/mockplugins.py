@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Mock depsfinder and filter plugins used for unit testing of the
+Dependency Graph Maker stage.
+"""
+
+CALLS = []
+
+def deps(var_map, *dep_ids):
+    """
+    Depsfinder plugin returning the given dependency ids.
+    """
+    CALLS.append(var_map['%id'])
+    return dep_ids
+
+def child(var_map, type_):
+    """
+    Depsfinder plugin returning a dependency of the given type, named
+    after the component.
+    """
+    CALLS.append(var_map['%id'])
+    return [var_map['%name'] + "-child#" + type_]
+
+def name_is(var_map, name):
+    """
+    Filter plugin accepting components with the given name.
+    """
+    CALLS.append(var_map['%id'])
+    return var_map['%name'] == name
+
+def failing(var_map, *args):
+    """
+    Plugin raising an error.
+    """
+    raise RuntimeError("Failing plugin")
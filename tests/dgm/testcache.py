@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Test the depsfinder cache
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+from sequencer.dgm.cache import DepsFinderCache, FilterCache
+from sequencer.dgm.model import RuleSet, Component
+
+import tests.dgm.tools as tools
+from tests.commons import BaseTest
+
+
+class TestDGMDepsFinderCache(BaseTest):
+    """
+    Test the depsfinder cache.
+    """
+    def setUp(self):
+        BaseTest.setUp(self)
+        (fd, self.filename) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+        (fd, self.logfile) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+        os.remove(self.logfile)
+        BaseTest.tearDown(self)
+
+    def _get_rule(self, name="R1", depsfinder="Depsfinder"):
+        return tools.create_rule(ruleset=self.__class__.__name__,
+                                 name=name,
+                                 types=["ta@cat"],
+                                 depsfinder=depsfinder,
+                                 dependson=["R2"])
+
+    def test_put_get(self):
+        cache = DepsFinderCache(self.filename)
+        rule = self._get_rule()
+        component = Component("a#ta@cat")
+        self.assertTrue(cache.get(rule, component) is None)
+        cache.put(rule, component, [u"b#tb@cat", u"c#tb@cat"])
+        cache.put(rule, Component("d#ta@cat"), [])
+        self.assertEquals(cache.get(rule, component),
+                          [u"b#tb@cat", u"c#tb@cat"])
+        self.assertEquals(cache.get(rule, Component("d#ta@cat")), [])
+        cache.close()
+        # Entries are persistent
+        cache = DepsFinderCache(self.filename)
+        self.assertEquals(cache.get(rule, component),
+                          [u"b#tb@cat", u"c#tb@cat"])
+        # A rule modification invalidates its entries
+        self.assertTrue(cache.get(self._get_rule(depsfinder="Other"),
+                                  component) is None)
+        self.assertEquals(cache.stats[u"hits"], 1)
+        self.assertEquals(cache.stats[u"misses"], 1)
+        stats = cache.get_total_stats()
+        self.assertEquals(stats[u"hits"], 3)
+        self.assertEquals(stats[u"misses"], 2)
+        cache.close()
+
+    def test_ttl(self):
+        cache = DepsFinderCache(self.filename, ttl=0)
+        rule = self._get_rule()
+        component = Component("a#ta@cat")
+        cache.put(rule, component, [u"b#tb@cat"])
+        time.sleep(0.01)
+        self.assertTrue(cache.get(rule, component) is None)
+        self.assertEquals(cache.stats[u"expired"], 1)
+        self.assertEquals(len(cache.get_entries_count()), 0)
+        cache.close()
+
+    def test_lru_eviction(self):
+        cache = DepsFinderCache(self.filename, size=2)
+        rule = self._get_rule()
+        for name in ["a", "b", "c"]:
+            cache.put(rule, Component(name + "#ta@cat"), [])
+            time.sleep(0.01)
+        # 'a' becomes the most recently used
+        self.assertEquals(cache.get(rule, Component("a#ta@cat")), [])
+        cache.close()
+        self.assertEquals(cache.stats[u"evicted"], 1)
+        cache = DepsFinderCache(self.filename, size=2)
+        self.assertEquals(cache.get(rule, Component("a#ta@cat")), [])
+        self.assertTrue(cache.get(rule, Component("b#ta@cat")) is None)
+        self.assertEquals(cache.get(rule, Component("c#ta@cat")), [])
+        cache.close()
+
+    def test_size_bound_while_running(self):
+        cache = DepsFinderCache(self.filename, size=2)
+        cache.batch_size = 1
+        rule = self._get_rule()
+        for name in ["a", "b", "c"]:
+            cache.put(rule, Component(name + "#ta@cat"), [])
+            time.sleep(0.01)
+        self.assertEquals(cache.get_entries_count(),
+                          {(self.__class__.__name__, u"R1"): 2})
+        self.assertTrue(cache.get(rule, Component("a#ta@cat")) is None)
+        self.assertEquals(cache.stats[u"evicted"], 1)
+        cache.close()
+
+    def test_shared_file(self):
+        rule = self._get_rule()
+        for batch_size in [1, 100]:
+            first = DepsFinderCache(self.filename)
+            first.batch_size = batch_size
+            first.put(rule, Component("a#ta@cat"), [u"b#tb@cat"])
+            self.assertEquals(first.get(rule, Component("a#ta@cat")),
+                              [u"b#tb@cat"])
+            # The first cache is still open
+            second = DepsFinderCache(self.filename)
+            second.batch_size = batch_size
+            second.put(rule, Component("c#ta@cat"), [])
+            self.assertEquals(second.get(rule, Component("c#ta@cat")), [])
+            second.close()
+            self.assertEquals(first.get(rule, Component("c#ta@cat")), [])
+            first.close()
+            cache = DepsFinderCache(self.filename)
+            self.assertEquals(len(cache.get_entries_count()), 1)
+            self.assertEquals(cache.invalidate(), 2)
+            cache.close()
+
+    def test_unavailable(self):
+        filename = os.path.join(self.filename + ".missing", "cache.db")
+        cache = DepsFinderCache(filename)
+        rule = self._get_rule()
+        cache.put(rule, Component("a#ta@cat"), [])
+        self.assertTrue(cache.get(rule, Component("a#ta@cat")) is None)
+        self.assertRaises(sqlite3.OperationalError, cache.invalidate)
+        cache.close()
+
+    def test_invalidate(self):
+        cache = DepsFinderCache(self.filename)
+        r1 = self._get_rule()
+        r2 = self._get_rule(name="R2")
+        component = Component("a#ta@cat")
+        cache.put(r1, component, [])
+        cache.put(r2, component, [])
+        self.assertEquals(cache.get_entries_count(),
+                          {(self.__class__.__name__, u"R1"): 1,
+                           (self.__class__.__name__, u"R2"): 1})
+        self.assertEquals(cache.invalidate(self.__class__.__name__,
+                                           [u"R2"]), 1)
+        self.assertEquals(cache.invalidate("UnknownRuleSet"), 0)
+        self.assertEquals(cache.get(r1, component), [])
+        self.assertTrue(cache.get(r2, component) is None)
+        self.assertEquals(cache.invalidate(), 1)
+        self.assertEquals(len(cache.get_entries_count()), 0)
+        cache.close()
+
+    def test_depgraph_with_cache(self):
+        """
+        The second computation of the depgraph should not call any
+        depsfinder.
+        """
+        deps_for = {"a#ta@cat": ["b#tb@cat"]}
+        rules = set()
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R1",
+                                    action="Action for %id",
+                                    types=["ta@cat"],
+                                    depsfinder=tools.\
+                                        getMockBatchDepsFinderCmd(self.logfile,
+                                                                  deps_for),
+                                    dependson=["R2"]))
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R2",
+                                    action="Action for %id",
+                                    types=["tb@cat"]))
+        for i in range(2):
+            cache = DepsFinderCache(self.filename)
+            depgraph = RuleSet(rules).get_depgraph([Component("a#ta@cat")],
+                                                   cache=cache)
+            cache.close()
+            self.assertTrue(depgraph.dag.has_edge(("a#ta@cat", "b#tb@cat")))
+            self.assertEquals(len(depgraph.components_map["b#tb@cat"].actions),
+                              1)
+        self.assertEquals(cache.stats[u"hits"], 1)
+        with open(self.logfile) as log:
+            self.assertEquals(len(log.readlines()), 1)
+
+
+class TestDGMFilterCache(BaseTest):
+    """
+    Test the filter decisions cache.
+    """
+    def setUp(self):
+        BaseTest.setUp(self)
+        (fd, self.filename) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+        (fd, self.logfile) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+        os.remove(self.logfile)
+        BaseTest.tearDown(self)
+
+    def _get_calls(self):
+        with open(self.logfile) as log:
+            return [line.strip() for line in log]
+
+    def _get_rule(self, name="R1"):
+        # The filter logs each call and accepts components named 'a'
+        return tools.create_rule(ruleset=self.__class__.__name__,
+                                 name=name,
+                                 types=["ta@cat"],
+                                 filter="bash -c 'echo %%id >> %s;" % \
+                                     self.logfile + \
+                                     " [[ %name == a ]]'")
+
+    def test_put_get(self):
+        cache = FilterCache(self.filename)
+        component = Component("a#ta@cat")
+        self.assertTrue(cache.get(u"filter %id", component) is None)
+        cache.put(u"filter %id", component, True)
+        cache.put(u"other %id", component, False)
+        self.assertTrue(cache.get(u"filter %id", component))
+        self.assertFalse(cache.get(u"other %id", component))
+        self.assertEquals(cache.stats, {u"hits": 2, u"misses": 1})
+        cache.close()
+        cache = FilterCache(self.filename, ttl=0)
+        time.sleep(0.01)
+        self.assertTrue(cache.get(u"filter %id", component) is None)
+        cache.close()
+
+    def test_rule_filter_with_store(self):
+        components = [Component("a#ta@cat"), Component("b#ta@cat")]
+        for i in range(2):
+            cache = FilterCache(self.filename)
+            rule = self._get_rule()
+            rule.set_filter_caching_policy(True, cache)
+            self.assertTrue(rule.pass_filter(components[0]))
+            self.assertEquals(rule.pass_filter_all(components),
+                              [components[0]])
+            cache.close()
+        # Each component has been filtered once
+        self.assertEquals(self._get_calls(), ["a#ta@cat", "b#ta@cat"])
+
+    def test_depgraph_exclude(self):
+        for i in range(2):
+            cache = FilterCache(self.filename, exclude=["R1"])
+            rules = [self._get_rule()]
+            depgraph = RuleSet(rules).get_depgraph([Component("a#ta@cat")],
+                                                   filter_cache=cache)
+            cache.close()
+            self.assertEquals(len(depgraph.remaining_components), 0)
+            # Still cached during the run
+            self.assertTrue(rules[0].pass_filter(Component("a#ta@cat")))
+        # Excluded: called each time
+        self.assertEquals(self._get_calls(), ["a#ta@cat", "a#ta@cat"])
+
+    def test_shared_file(self):
+        component = Component("a#ta@cat")
+        first = FilterCache(self.filename)
+        first.batch_size = 1
+        first.put(u"filter %id", component, True)
+        # The first cache is still open
+        second = FilterCache(self.filename)
+        second.batch_size = 1
+        self.assertTrue(second.get(u"filter %id", component))
+        second.put(u"other %id", component, False)
+        second.close()
+        self.assertFalse(first.get(u"other %id", component))
+        first.close()
+
+    def test_unavailable(self):
+        cache = FilterCache(os.path.join(self.filename + ".missing",
+                                         "cache.db"))
+        rules = [self._get_rule()]
+        depgraph = RuleSet(rules).get_depgraph([Component("a#ta@cat")],
+                                               filter_cache=cache)
+        cache.close()
+        self.assertEquals(len(depgraph.remaining_components), 0)
+        self.assertEquals(self._get_calls(), ["a#ta@cat"])
@@ -20,8 +20,11 @@
 """
 Test the DGM Model
 """
+import gc
+import weakref
+
 from sequencer.dgm.errors import UnknownDepError
-from sequencer.dgm.model import RuleSet, Component, ALL, NONE, AllFilter, NoneFilter, ReFilter, ScriptFilter, FullType
+from sequencer.dgm.model import RuleSet, Component, ALL, NONE, AllFilter, NoneFilter, ReFilter, ScriptFilter, FullType, TypeIndex
 
 import tests.dgm.tools as tools
 from tests.commons import BaseTest
@@ -210,6 +213,40 @@ class TestDGMModel_RuleBasic(BaseTest):
         self.assertTrue(rule.pass_filter(Component("foo#bar@cat")))
         self.assertFalse(rule.pass_filter(Component("bar#foo@cat")))
 
+    def test_rule_pass_filter_batch(self):
+        rule = tools.create_rule("RS",
+                                 "RN",
+                                 filter="batch: grep '^foo.*-%rulename'")
+        components = [Component("foo1-RN#bar@cat"),
+                      Component("bar-RN#foo@cat"),
+                      Component("foo2-RN#bar@cat")]
+        self.assertEquals(rule.pass_filter_all(components),
+                          [components[0], components[2]])
+        self.assertTrue(rule.pass_filter(Component("foo3-RN#bar@cat")))
+        self.assertFalse(rule.pass_filter(Component("bar#foo@cat")))
+
+    def test_rule_pass_filter_all_bash(self):
+        rule = tools.create_rule("RS", "RN",
+                                 filter="bash -c '[[ %name =~ foo ]]'")
+        components = [Component("foo#bar@cat"), Component("bar#foo@cat")]
+        self.assertEquals(rule.pass_filter_all(components), [components[0]])
+        # Second call: taken from the cache
+        self.assertEquals(rule.pass_filter_all(components), [components[0]])
+
+    def test_rule_pass_filter_plugin(self):
+        rule = tools.create_rule("RS", "RN",
+                                 filter="py:tests.dgm.mockplugins:name_is foo")
+        self.assertTrue(rule.pass_filter(Component("foo#bar@cat")))
+        self.assertFalse(rule.pass_filter(Component("bar#foo@cat")))
+
+        rule = tools.create_rule("RS", "RN",
+                                 filter="py:tests.dgm.mockplugins:failing")
+        self.assertFalse(rule.pass_filter(Component("foo#bar@cat")))
+
+        rule = tools.create_rule("RS", "RN",
+                                 filter="py:tests.dgm.mockplugins:unknown")
+        self.assertFalse(rule.pass_filter(Component("foo#bar@cat")))
+
     def test_rule_pass_filter_re_id(self):
         rule = tools.create_rule("RS", "RN", filter="%id =~ foo#bar@cat")
         self.assertTrue(rule.pass_filter(Component("foo#bar@cat")))
@@ -290,6 +327,28 @@ class TestDGMModel_RuleBasic(BaseTest):
         self.assertTrue(rule.match_type(Component("foo#baz@cat")))
         self.assertTrue(rule.match_type(Component("bar#foo@cat")))
 
+    def test_type_index(self):
+        r1 = tools.create_rule("RS", "R1", types=["bar@cat"])
+        r2 = tools.create_rule("RS", "R2", types=["bar@cat", "baz@ALL"])
+        r3 = tools.create_rule("RS", "R3", types=["ALL@cat2"])
+        r4 = tools.create_rule("RS", "R4", types=[ALL])
+        rules = [r1, r2, r3, r4]
+        index = TypeIndex.from_rules(rules)
+        for component in [Component("foo#bar@cat"),
+                          Component("foo#baz@cat"),
+                          Component("foo#baz@cat2"),
+                          Component("foo#bar@cat2"),
+                          Component("foo#other@other")]:
+            expected = set(rule.name for rule in rules \
+                               if rule.match_type(component))
+            self.assertEquals(set(rule.name \
+                                      for rule in index.lookup(component)),
+                              expected)
+            # Second lookup comes from the cache
+            self.assertEquals(set(rule.name \
+                                      for rule in index.lookup(component)),
+                              expected)
+
 
 class TestDGMModel_RuleError(BaseTest):
     """
@@ -539,3 +598,20 @@ class TestDGMModel_ComponentBasic(BaseTest):
         self.assertEquals(component.category, "cat")
 
 
+
+    def test_shared_type(self):
+        component1 = Component("foo#type@cat")
+        component2 = Component("bar", "ty" + "pe", "cat")
+        self.assertFalse(hasattr(component1, '__dict__'))
+        self.assertTrue(component1.type is component2.type)
+        self.assertTrue(component1.category is component2.category)
+        self.assertTrue(component1.fulltype is component2.fulltype)
+        self.assertEquals(str(component1.fulltype), "type@cat")
+        self.assertEquals(component1.actions, {})
+
+    def test_shared_type_released(self):
+        component = Component("foo#released_type@cat")
+        fulltype = weakref.ref(component.fulltype)
+        del component
+        gc.collect()
+        self.assertTrue(fulltype() is None)
@@ -20,8 +20,13 @@
 """
 Test the DGM Model
 """
-from sequencer.dgm.model import RuleSet, Component
+import os
+import sys
+import tempfile
 
+from sequencer.dgm.model import RuleSet, Component, DepGraph
+
+import tests.dgm.mockplugins as mockplugins
 import tests.dgm.tools as tools
 from tests.commons import BaseGraph
 
@@ -796,3 +801,315 @@ class TestDGMModel_DepGraph(BaseGraph):
         self.assertTrue("R1" in components["a#ta@cat"].actions)
         self.assertTrue("R1" in components["b#tb@cat"].actions)
         self.assertNoEdgeBetween(depgraph.dag, "a#ta@cat", "b#tb@cat")
+
+    def _assertSameDepGraph(self, expected, actual):
+        self.assertEquals(set(expected.components_map),
+                          set(actual.components_map))
+        self.assertEquals(set(expected.dag.nodes()), set(actual.dag.nodes()))
+        self.assertEquals(set(expected.dag.edges()), set(actual.dag.edges()))
+        for edge in expected.dag.edges():
+            self.assertEquals(expected.dag.edge_label(edge),
+                              actual.dag.edge_label(edge))
+        for node in expected.dag.nodes():
+            self.assertEquals(expected.dag.node_attributes(node),
+                              actual.dag.node_attributes(node))
+
+    def _make_chain_rules(self):
+        """
+        RuleSet: R1:#ta->R2:#tb->R3:#tc
+        a#ta depsfinder returns b1#tb, b2#tb,
+        b#tb depsfinder returns c#tc
+        """
+        rules = set()
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R1",
+                                    action="Action for %id",
+                                    types=["ta@cat"],
+                                    depsfinder=tools.getMockDepsFinderCmd(["b1#tb@cat",
+                                                                           "b2#tb@cat"]),
+                                    dependson=["R2"]))
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R2",
+                                    action="Action for %id",
+                                    types=["tb@cat"],
+                                    depsfinder=tools.getMockDepsFinderCmd(["c#tc@cat"]),
+                                    dependson=["R3"]))
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R3",
+                                    action="Action for %id",
+                                    types=["tc@cat"]))
+        return rules
+
+    def test_jobs_same_depgraph(self):
+        """
+        Check that the concurrent computation (jobs > 1) gives the
+        same dependency graph than the serial one.
+        """
+        serial = RuleSet(self._make_chain_rules())\
+            .get_depgraph([Component("a#ta@cat")])
+        concurrent = RuleSet(self._make_chain_rules())\
+            .get_depgraph([Component("a#ta@cat")], jobs=4)
+        self.assertTrue(concurrent.dag.has_edge(("a#ta@cat", "b1#tb@cat")))
+        self.assertTrue(concurrent.dag.has_edge(("b2#tb@cat", "c#tc@cat")))
+        self._assertSameDepGraph(serial, concurrent)
+
+    def test_jobs_same_depgraph_cycle(self):
+        """
+        Same as test_multiple_actions_cycle() with jobs > 1.
+        """
+        rules = set()
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R1",
+                                    action="Action for a",
+                                    types=["ta@cat"]))
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R2",
+                                    action="Action for a",
+                                    types=["ta@cat"],
+                                    depsfinder=tools.getMockDepsFinderCmd(["a#ta@cat"]),
+                                    dependson=["R1"]))
+        serial = RuleSet(rules).get_depgraph([Component("a#ta@cat")])
+        concurrent = RuleSet(rules).get_depgraph([Component("a#ta@cat")],
+                                                 jobs=2)
+        self.assertEquals(len(concurrent.components_map["a#ta@cat"].actions), 2)
+        self._assertSameDepGraph(serial, concurrent)
+
+    def test_batch_depsfinder(self):
+        """
+        RuleSet: R1:#ta->R2:#tb->R3:#tc with batch depsfinders
+        Components: a1#ta, a2#ta
+        Expecting: one depsfinder call per rule and the same graph
+        than with the one component per call depsfinders.
+        """
+        (fd, logfile) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+        try:
+            rules = set()
+            r1_deps = {"a1#ta@cat": ["b1#tb@cat", "b2#tb@cat"],
+                       "a2#ta@cat": ["b2#tb@cat", "b3#tb@cat"]}
+            r2_deps = {"b1#tb@cat": ["c#tc@cat"],
+                       "b2#tb@cat": ["c#tc@cat"]}
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R1",
+                                        action="Action for %id",
+                                        types=["ta@cat"],
+                                        depsfinder=tools.\
+                                            getMockBatchDepsFinderCmd(logfile,
+                                                                      r1_deps),
+                                        dependson=["R2"]))
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R2",
+                                        action="Action for %id",
+                                        types=["tb@cat"],
+                                        depsfinder=tools.\
+                                            getMockBatchDepsFinderCmd(logfile,
+                                                                      r2_deps),
+                                        dependson=["R3"]))
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R3",
+                                        action="Action for %id",
+                                        types=["tc@cat"]))
+            depgraph = RuleSet(rules).get_depgraph([Component("a1#ta@cat"),
+                                                    Component("a2#ta@cat")])
+            with open(logfile) as log:
+                calls = [set(line.split()) for line in log]
+            self.assertEquals(calls, [set(r1_deps), set(["b1#tb@cat",
+                                                         "b2#tb@cat",
+                                                         "b3#tb@cat"])])
+            self.assertEquals(len(depgraph.dag.nodes()), 6)
+            self.assertTrue(depgraph.dag.has_edge(("a1#ta@cat", "b1#tb@cat")))
+            self.assertTrue(depgraph.dag.has_edge(("a2#ta@cat", "b3#tb@cat")))
+            self.assertTrue(depgraph.dag.has_edge(("b2#tb@cat", "c#tc@cat")))
+            self.assertEquals(len(depgraph.dag.neighbors("b3#tb@cat")), 0)
+            self.assertEquals(depgraph.dag.edge_label(("b1#tb@cat",
+                                                       "c#tc@cat")), "R3")
+            for id_ in depgraph.dag.nodes():
+                self.assertEquals(len(depgraph.components_map[id_].actions), 1)
+        finally:
+            os.remove(logfile)
+
+    def test_batch_filter(self):
+        """
+        RuleSet: R1:#ta->R2:#tb with a batch filter on R2
+        Components: a1#ta, a2#ta, a3#ta
+        Expecting: one filter call for the whole discovery wave.
+        """
+        (fd, logfile) = tempfile.mkstemp(prefix=self.__class__.__name__)
+        os.close(fd)
+        try:
+            rules = set()
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R1",
+                                        action="Action for %id",
+                                        types=["ta@cat"],
+                                        depsfinder="py:tests.dgm." + \
+                                            "mockplugins:child tb@cat",
+                                        dependson=["R2"]))
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R2",
+                                        action="Action for %id",
+                                        types=["tb@cat"],
+                                        filter="batch: sh -c 'echo call" + \
+                                            " >> %s; grep -v ^a3'" % logfile))
+            depgraph = RuleSet(rules).get_depgraph([Component("a1#ta@cat"),
+                                                    Component("a2#ta@cat"),
+                                                    Component("a3#ta@cat")])
+            with open(logfile) as log:
+                self.assertEquals(len(log.readlines()), 1)
+            self.assertTrue(depgraph.dag.has_edge(("a1#ta@cat",
+                                                   "a1-child#tb@cat")))
+            self.assertTrue(depgraph.dag.has_edge(("a2#ta@cat",
+                                                   "a2-child#tb@cat")))
+            self.assertEquals(len(depgraph.dag.neighbors("a3#ta@cat")), 0)
+            self.assertEquals(len(depgraph.components_map["a1-child#tb@cat"]\
+                                      .actions), 1)
+        finally:
+            os.remove(logfile)
+
+    def test_component_in_two_depgraphs(self):
+        """
+        A component given to a second depgraph keeps its actions in the
+        first one.
+        """
+        def _ruleset(action):
+            return RuleSet([tools.create_rule(ruleset=self.__class__.__name__,
+                                              name="R1",
+                                              action=action,
+                                              types=["ta@cat"])])
+        component = Component("a#ta@cat")
+        first = _ruleset("First").get_depgraph([component])
+        second = _ruleset("Second").get_depgraph([component])
+        self.assertEquals(component.actions, {"R1": "First"})
+        self.assertEquals(first.components_map["a#ta@cat"].actions,
+                          {"R1": "First"})
+        self.assertEquals(second.components_map["a#ta@cat"].actions,
+                          {"R1": "Second"})
+
+    def test_root_rules_for_deep_chain(self):
+        """
+        A long chain of rules R0->R1->...->Rn should not hit the
+        recursion limit.
+        """
+        n = 2 * sys.getrecursionlimit()
+        rules = set()
+        for i in range(n):
+            rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                        name="R%d" % i,
+                                        types=["t%d@cat" % (i % 3)],
+                                        dependson=[] if i == n - 1 \
+                                            else ["R%d" % (i + 1)]))
+        types = RuleSet(rules).root_rules_for
+        self.assertEquals(len(types), 3)
+        for i in range(3):
+            self.assertEquals([rule.name for rule in types["t%d@cat" % i]],
+                              ["R%d" % i])
+
+    def test_root_rules_for_cycle_shared_type(self):
+        """
+        All rules of a cycle are potential roots for their types, rules
+        they depend on are not.
+        """
+        rules = set()
+        r1 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R1",
+                               types=["ta@cat", "tc@cat"],
+                               dependson=["R1", "R2"])
+        r2 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R2",
+                               types=["ta@cat", "tb@cat"])
+        rules.add(r1)
+        rules.add(r2)
+        types = RuleSet(rules).root_rules_for
+        self.assertEquals(len(types), 3, types)
+        self.assertEquals(types["ta@cat"], set([r1]))
+        self.assertEquals(types["tb@cat"], set([r2]))
+        self.assertEquals(types["tc@cat"], set([r1]))
+
+    def test_root_rules_for_cycle_components(self):
+        """
+        RuleSet: R0 -> R1 -> R2 -> R1, R2 -> R3
+        The cycle R1 <-> R2 comes after R0 and before R3.
+        """
+        rules = set()
+        r0 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R0",
+                               types=["t0@cat"],
+                               dependson=["R1"])
+        r1 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R1",
+                               types=["ta@cat", "t0@cat"],
+                               dependson=["R2"])
+        r2 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R2",
+                               types=["ta@cat", "tb@cat"],
+                               dependson=["R1", "R3"])
+        r3 = tools.create_rule(ruleset=self.__class__.__name__,
+                               name="R3",
+                               types=["tb@cat", "tc@cat"])
+        for rule in [r0, r1, r2, r3]:
+            rules.add(rule)
+        types = RuleSet(rules).root_rules_for
+        self.assertEquals(len(types), 4, types)
+        self.assertEquals(types["t0@cat"], set([r0]))
+        self.assertEquals(types["ta@cat"], set([r1, r2]))
+        self.assertEquals(types["tb@cat"], set([r2]))
+        self.assertEquals(types["tc@cat"], set([r3]))
+
+    def test_deep_depgraph(self):
+        """
+        A long chain of dependencies n0->n1->...->nN should not hit
+        the recursion limit.
+        """
+        n = 2 * sys.getrecursionlimit()
+
+        class ChainDepGraph(DepGraph):
+            def _find_deps(self, components, rule):
+                result = dict()
+                for component in components:
+                    i = int(component.name[1:])
+                    result[component.id] = [] if i == n - 1 \
+                        else ["n%d#tn@cat" % (i + 1)]
+                return result
+
+        rules = [tools.create_rule(ruleset=self.__class__.__name__,
+                                   name="R1",
+                                   action="Action for %id",
+                                   types=["tn@cat"],
+                                   depsfinder="Unused",
+                                   dependson=["R1"])]
+        depgraph = ChainDepGraph(RuleSet(rules), [Component("n0#tn@cat")])
+        self.assertEquals(len(depgraph.dag.nodes()), n)
+        self.assertEquals(len(depgraph.dag.edges()), n - 1)
+        self.assertEquals(depgraph.dag.edge_label(("n0#tn@cat",
+                                                   "n1#tn@cat")), "R1")
+        for id_ in depgraph.components_map:
+            self.assertEquals(depgraph.components_map[id_].actions,
+                              {"R1": "Action for " + id_})
+
+    def test_plugin_depsfinder(self):
+        """
+        RuleSet: R1:#ta->R2:#tb with a plugin depsfinder
+        Components: a#ta
+        Expecting: a#ta -> b1#tb, b2#tb
+        """
+        del mockplugins.CALLS[:]
+        rules = set()
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R1",
+                                    action="Action for %id",
+                                    types=["ta@cat"],
+                                    depsfinder="py:tests.dgm.mockplugins:deps" + \
+                                        " b1#tb@cat b2#tb@cat",
+                                    dependson=["R2"]))
+        rules.add(tools.create_rule(ruleset=self.__class__.__name__,
+                                    name="R2",
+                                    action="Action for %id",
+                                    types=["tb@cat"],
+                                    depsfinder="py:tests.dgm.mockplugins:failing",
+                                    dependson=["R1"]))
+        depgraph = RuleSet(rules).get_depgraph([Component("a#ta@cat")])
+        self.assertEquals(len(depgraph.dag.nodes()), 3)
+        self.assertTrue(depgraph.dag.has_edge(("a#ta@cat", "b1#tb@cat")))
+        self.assertTrue(depgraph.dag.has_edge(("a#ta@cat", "b2#tb@cat")))
+        self.assertEquals(len(depgraph.components_map["b1#tb@cat"].actions), 1)
+        self.assertEquals(mockplugins.CALLS, ["a#ta@cat"])
@@ -32,6 +32,7 @@ assert sqlite3.paramstyle == 'qmark'
 
 _DGM_TEST_DIR = os.path.dirname(__file__)
 _MOCK_DEPSFINDER_SCRIPT_NAME = u"MockDepsFinder.py"
+_MOCK_BATCH_DEPSFINDER_SCRIPT_NAME = u"MockBatchDepsFinder.py"
 
 def getMockDepsFinderFullPath():
     return os.path.join(_DGM_TEST_DIR, _MOCK_DEPSFINDER_SCRIPT_NAME)
@@ -39,6 +40,12 @@ def getMockDepsFinderFullPath():
 def getMockDepsFinderCmd(deps):
     return "python " + getMockDepsFinderFullPath() + " " + " ".join(deps)
 
+def getMockBatchDepsFinderCmd(logfile, deps_for):
+    return "batch: python " + \
+        os.path.join(_DGM_TEST_DIR, _MOCK_BATCH_DEPSFINDER_SCRIPT_NAME) + \
+        " " + logfile + " " + \
+        " ".join([id_ + "=" + ",".join(deps_for[id_]) for id_ in deps_for])
+
 def create_rule(ruleset,
                 name,
                 # Trailing comma is required!
@@ -23,7 +23,7 @@ import unittest
 import lxml
 from sequencer.ise.rc import ACTION_RC_KO, ACTION_RC_WARNING, \
     ACTION_RC_OK, ACTION_RC_UNEXECUTED
-from sequencer.ise import api
+from sequencer.ise import api, model
 from sequencer.ise.parser import ISE, SEQ, PAR, ACTION
 
 from tests.ise import tools
@@ -674,3 +674,195 @@ class TestISEAPITree(AssertAPI):
 
         self.assertTrue(a3.started_time > a2.ended_time)
 
+
+    def _make_layers(self, rc_of):
+        """
+        Return SEQ(PAR(a0, a1, a2), PAR(b0, b1, b2)). The rc of each
+        action is given by rc_of(id).
+        """
+        def _par(prefix):
+            return PAR(*[ACTION(tools.getMockActionCmd(rc_of(prefix + str(i)),
+                                                       "STD", "ERR"),
+                                id=prefix + str(i))
+                         for i in range(3)])
+        return ISE(SEQ(_par("a"), _par("b")))
+
+    def test_S_PP_OK(self):
+        doc = self._make_layers(lambda id_: ACTION_RC_OK)
+        xml = lxml.etree.tostring(doc, pretty_print=True)
+        with io.StringIO(unicode(xml)) as reader:
+            execution = api.execute(reader)
+            self.assertEquals(ACTION_RC_OK, execution.rc)
+            actionsMap = execution.executed_actions
+            self.assertEquals(6, len(actionsMap))
+            for i in range(3):
+                for j in range(3):
+                    self.assertTrue(actionsMap["b%d" % i].started_time >= \
+                                        actionsMap["a%d" % j].ended_time)
+
+    def test_S_PKOP(self):
+        doc = self._make_layers(lambda id_: ACTION_RC_KO if id_ == "a1" \
+                                    else ACTION_RC_OK)
+        xml = lxml.etree.tostring(doc, pretty_print=True)
+        with io.StringIO(unicode(xml)) as reader:
+            execution = api.execute(reader)
+            self.assertEquals(ACTION_RC_KO, execution.rc)
+            self.assertEquals(set(["a0", "a1", "a2"]),
+                              set(execution.executed_actions))
+            self.assertEquals(["a1"], execution.error_actions.keys())
+
+
+class TestISEAPISchedule(unittest.TestCase):
+    """
+    Check the critical scheduling of the ISE API
+    """
+
+    def _make_doc(self):
+        def _action(id_):
+            return ACTION(tools.getMockActionCmd(ACTION_RC_OK, id_, id_),
+                          id=id_)
+        return ISE(PAR(_action("short"),
+                       SEQ(_action("l1"), _action("l2"), _action("l3"))))
+
+    def test_priorities(self):
+        a_model = model.Model(self._make_doc())
+        dag = a_model.dag
+        priorities = api.get_priorities(a_model)
+        self.assertEquals(priorities[dag.node_id("short")], 1.0)
+        self.assertEquals(priorities[dag.node_id("l1")], 3.0)
+        self.assertEquals(priorities[dag.node_id("l3")], 1.0)
+        priorities = api.get_priorities(a_model, {"short": 10.0, "l1": 2.0})
+        self.assertEquals(priorities[dag.node_id("short")], 10.0)
+        # l2 and l3 weigh the average duration: 6.0
+        self.assertEquals(priorities[dag.node_id("l1")], 14.0)
+
+    def test_critical_first(self):
+        for durations, first in [(None, "l1"),
+                                 ({"short": 10.0, "l1": 1.0,
+                                   "l2": 1.0, "l3": 1.0}, "short")]:
+            execution = api.execute_model(model.Model(self._make_doc()),
+                                          fanout=1,
+                                          schedule=api.SCHEDULE_CRITICAL,
+                                          durations=durations)
+            self.assertEquals(ACTION_RC_OK, execution.rc)
+            actions = execution.executed_actions
+            self.assertEquals(4, len(actions))
+            self.assertEquals(1, execution.best_fanout)
+            started = sorted(actions.values(),
+                             key=lambda action: action.started_time)
+            self.assertEquals(first, started[0].id)
+
+    def _fake_execution(self, doc, durations):
+        """
+        Return an execution of the model of the given doc where each
+        action took the duration given by durations(id).
+        """
+        execution = api.execute_model(model.Model(doc), doexec=False)
+        for id_, action in execution.model.actions.items():
+            action.started_time = 0.0
+            action.ended_time = durations(id_)
+            execution.executed_actions[id_] = action
+        return execution
+
+    def test_critical_path(self):
+        durations = {"short": 10.0, "l1": 1.0, "l2": 2.0, "l3": 1.0}
+        execution = self._fake_execution(self._make_doc(), durations.get)
+        (optimal, path, slacks) = api.get_critical_path(execution)
+        self.assertEquals(optimal, 10.0)
+        self.assertEquals(path, ["short"])
+        self.assertEquals(slacks, {"short": 0.0, "l1": 6.0,
+                                   "l2": 6.0, "l3": 6.0})
+        durations["short"] = 1.0
+        execution = self._fake_execution(self._make_doc(), durations.get)
+        (optimal, path, slacks) = api.get_critical_path(execution)
+        self.assertEquals(optimal, 4.0)
+        self.assertEquals(path, ["l1", "l2", "l3"])
+        self.assertEquals(slacks["short"], 3.0)
+        self.assertEquals(slacks["l2"], 0.0)
+
+    def test_critical_path_shared(self):
+        # 2^50 paths: each of them must not be visited
+        layers = [PAR(ACTION("true", id="a%d" % i),
+                      ACTION("true", id="b%d" % i)) for i in range(50)]
+        execution = self._fake_execution(ISE(SEQ(*layers)),
+                                         lambda id_: 2.0 if id_ == "b7" \
+                                             else 1.0)
+        (optimal, path, slacks) = api.get_critical_path(execution)
+        self.assertEquals(optimal, 51.0)
+        self.assertEquals(len(path), 50)
+        self.assertTrue("b7" in path)
+        self.assertEquals(slacks["a7"], 1.0)
+        self.assertEquals(slacks["b8"], 0.0)
+
+    def test_roots(self):
+        # Only actions without dependencies are scheduled first
+        doc = ISE(SEQ(PAR(ACTION("true", id="a1"), ACTION("true", id="a2"),
+                          ACTION("true", id="a3")),
+                      PAR(ACTION("true", id="a4"), ACTION("true", id="a5")),
+                      ACTION("true", id="a6", deps="a1")))
+        execution = api.execute_model(model.Model(doc), doexec=False)
+        self.assertEquals(sorted(execution._roots), ["a1", "a2", "a3"])
+
+    def test_submission_errors(self):
+        # task.shell() raises on invalid node sets: such actions must
+        # not take a fanout slot.
+        def _action(id_):
+            return ACTION(tools.getMockActionCmd(ACTION_RC_OK, id_, id_),
+                          id=id_)
+        bad_actions = [ACTION("true", id="bad%d" % i, remote="true",
+                              component_set="n[%d-#type@cat" % i)
+                       for i in range(3)]
+        doc = ISE(PAR(*(bad_actions + [_action("a1"), _action("a2")])))
+        execution = api.execute_model(model.Model(doc), fanout=2,
+                                      schedule=api.SCHEDULE_CRITICAL)
+        self.assertEquals(sorted(execution.executed_actions), ["a1", "a2"])
+        self.assertEquals(sorted(execution.error_actions),
+                          ["bad0", "bad1", "bad2"])
+        self.assertEquals(0, execution.running)
+
+
+class TestISEAPIResources(unittest.TestCase):
+    """
+    Check the resource limits of the ISE API
+    """
+
+    def _make_doc(self):
+        def _action(id_, resources):
+            return ACTION(tools.getMockActionCmd(ACTION_RC_OK, id_, id_),
+                          id=id_, resources=resources)
+        return ISE(PAR(_action("a0", "pdu:p1"),
+                       _action("a1", "pdu:p1, rack:r1"),
+                       _action("a2", "pdu:p2"),
+                       _action("a3", "pdu:p2,rack:r1")))
+
+    def _assert_sequential(self, actions, id1, id2):
+        (first, second) = sorted([actions[id1], actions[id2]],
+                                 key=lambda action: action.started_time)
+        self.assertTrue(second.started_time >= first.ended_time)
+
+    def test_resources(self):
+        a_model = model.Model(self._make_doc())
+        self.assertEquals(a_model.actions["a0"].resources, ["pdu:p1"])
+        self.assertEquals(a_model.actions["a1"].resources,
+                          ["pdu:p1", "rack:r1"])
+        self.assertEquals(api.get_resource_kind("rack:r1"), "rack")
+
+    def test_limits(self):
+        for schedule in api.SCHEDULE_TYPES:
+            execution = api.execute_model(model.Model(self._make_doc()),
+                                          schedule=schedule,
+                                          limits={"pdu": 1})
+            self.assertEquals(ACTION_RC_OK, execution.rc)
+            actions = execution.executed_actions
+            self.assertEquals(4, len(actions))
+            # One action per pdu at a time, but both pdus are used
+            self.assertEquals(2, execution.best_fanout)
+            self._assert_sequential(actions, "a0", "a1")
+            self._assert_sequential(actions, "a2", "a3")
+
+    def test_unlimited_kind(self):
+        execution = api.execute_model(model.Model(self._make_doc()),
+                                      limits={"rack": 2})
+        self.assertEquals(ACTION_RC_OK, execution.rc)
+        self.assertEquals(4, len(execution.executed_actions))
+        self.assertEquals(4, execution.best_fanout)
@@ -20,6 +20,8 @@
 """
 Unit test of the ISE CLI ('sequencer [options] seqexec [options]')
 """
+import csv
+import json
 import os
 import tempfile
 from subprocess import Popen, PIPE
@@ -193,3 +195,50 @@ class TestCLIBasic(tools.AssertCLI):
         self.assertUnexecutedActions(output, ids=["b"])
         self.assertEquals(process.returncode, ACTION_RC_KO)
 
+    def _get_report_output(self, report_format):
+        doc = ISE(SEQ(ACTION(tools.getMockActionCmd(ACTION_RC_KO,
+                                                    "Message2StdOut",
+                                                    "Message2StdErr"),
+                             id="a"),
+                      ACTION(tools.getMockActionCmd(ACTION_RC_OK,
+                                                    "Message2StdOut",
+                                                    "Message2StdErr"),
+                             id="b")))
+        xml = lxml.etree.tostring(doc, pretty_print=True)
+        process = Popen(["sequencer", "seqexec", "--report", "all",
+                         "--reportformat", report_format],
+                        stdin=PIPE,
+                        stdout=PIPE,
+                        stderr=PIPE,
+                        env={'PATH':BIN_PATH,
+                             'PYTHONPATH':PYTHON_PATH}
+                        )
+        (output, error) = process.communicate(xml)
+        print "Output: %s\nError: %s" % (output, error)
+        self.assertEquals(process.returncode, ACTION_RC_KO)
+        return output
+
+    def test_ReportCSV(self):
+        output = self._get_report_output('csv')
+        ids = dict()
+        for line in csv.reader(output.splitlines()):
+            # Skip headers, progress and actions outputs
+            if len(line) > 1 and line[0] != 'report':
+                ids.setdefault(line[0], []).append(line[1])
+        self.assertEquals(ids.get('model'), ["a", "b"])
+        self.assertEquals(ids.get('exec'), ["a"])
+        self.assertEquals(ids.get('error'), ["a"])
+        self.assertEquals(ids.get('unexec'), ["b"])
+        self.assertEquals(ids.get('critical'), ["a"])
+
+    def test_ReportJSON(self):
+        output = self._get_report_output('json')
+        rows = [json.loads(line) for line in output.splitlines()
+                if line.startswith('{')]
+        self.assertEquals([(row['report'], row['Id']) for row in rows],
+                          [('model', 'a'), ('model', 'b'),
+                           ('exec', 'a'),
+                           ('error', 'a'),
+                           ('unexec', 'b'),
+                           ('critical', 'a')])
+        self.assertEquals(rows[-1]['Critical'], '*')
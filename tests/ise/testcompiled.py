@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Test compiled ISE models
+"""
+import io
+import unittest
+
+import lxml.etree
+from sequencer.ise import api, cli, compiled, model
+from sequencer.ise.parser import ISE, SEQ, PAR, ACTION
+from sequencer.ise.rc import ACTION_RC_OK
+
+from tests.ise import tools
+
+
+class TestCompiled(unittest.TestCase):
+
+    def _make_model(self):
+        ok_cmd = tools.getMockActionCmd(ACTION_RC_OK, "Out", "Err")
+        return model.Model(ISE(SEQ(ACTION(ok_cmd, id="a1", desc=u"Prémière"),
+                                   PAR(ACTION(ok_cmd, id="a2",
+                                              resources="pdu:p1"),
+                                       SEQ(ACTION(ok_cmd, id="a3"),
+                                           ACTION(ok_cmd, id="a4",
+                                                  deps="a1")),
+                                       ACTION(id="a5")),
+                                   ACTION(ok_cmd, remote="true"))))
+
+    def _compile(self, a_model):
+        output = io.BytesIO()
+        compiled.dump(a_model, output)
+        return output.getvalue()
+
+    def _edges(self, a_model):
+        return [tuple(str(node) for node in edge)
+                for edge in a_model.dag.edges()]
+
+    def test_RoundTrip(self):
+        expected = self._make_model()
+        data = self._compile(expected)
+        self.assertTrue(compiled.is_compiled(data))
+        loaded = compiled.load(io.BytesIO(data))
+        self.assertEquals(loaded.instructions, [])
+        self.assertEquals(sorted(loaded.actions), sorted(expected.actions))
+        self.assertEquals(loaded.deps, expected.deps)
+        self.assertEquals(self._edges(loaded), self._edges(expected))
+        for id_, action in loaded.actions.items():
+            other = expected.actions[id_]
+            self.assertEquals(action.attributes.get('desc'),
+                              other.attributes.get('desc'))
+            self.assertEquals(action.command, other.command)
+            self.assertEquals(action.remote, other.remote)
+            self.assertEquals(action.resources, other.resources)
+            self.assertEquals(sorted(action.all_deps()),
+                              sorted(other.all_deps()))
+            self.assertEquals(sorted(action.next()), sorted(other.next()))
+
+    def test_Execute(self):
+        loaded = compiled.load(io.BytesIO(self._compile(self._make_model())))
+        execution = api.execute_model(loaded)
+        self.assertEquals(execution.rc, ACTION_RC_OK)
+        self.assertEquals(sorted(execution.executed_actions),
+                          ['a1', 'a2', 'a3', 'a4'])
+        self.assertEquals(sorted(execution.error_actions), ['a5'])
+
+    def test_Detection(self):
+        expected = self._make_model()
+        data = self._compile(expected)
+        loaded = cli.load_model(io.BytesIO(data))
+        self.assertEquals(sorted(loaded.actions), sorted(expected.actions))
+        xml = lxml.etree.tostring(ISE(SEQ(ACTION("true", id="a"))))
+        loaded = cli.load_model(io.BytesIO(xml))
+        self.assertEquals(sorted(loaded.actions), ['a'])
+
+    def test_Corrupted(self):
+        data = self._compile(self._make_model())
+        self.assertRaises(compiled.BadCompiledModelError,
+                          compiled.load, io.BytesIO(data[:-1]))
+        corrupted = data[:-1] + chr((ord(data[-1]) + 1) % 256)
+        self.assertRaises(compiled.BadCompiledModelError,
+                          compiled.load, io.BytesIO(corrupted))
+        self.assertRaises(compiled.BadCompiledModelError,
+                          compiled.load, io.BytesIO('<instructions/>'))
+
+    def test_Version(self):
+        data = self._compile(self._make_model())
+        size = len(compiled.MAGIC)
+        other = data[:size] + chr(compiled.FORMAT_VERSION + 1) + \
+            data[size + 1:]
+        self.assertRaises(compiled.BadCompiledModelError,
+                          compiled.load, io.BytesIO(other))
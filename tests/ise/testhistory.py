@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+"""
+Test the durations history
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from sequencer.ise import history
+
+
+class _Action(object):
+    def __init__(self, started_time, ended_time):
+        self.started_time = started_time
+        self.ended_time = ended_time
+
+
+class _Execution(object):
+    def __init__(self, executed_actions):
+        self.executed_actions = executed_actions
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'durations')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_missing(self):
+        self.assertEquals(history.load(self.filename), {})
+
+    def test_update(self):
+        history.update(self.filename,
+                       _Execution({u'a#t/Rule': _Action(10.0, 12.5),
+                                   u'b c': _Action(1.0, 2.0)}))
+        self.assertEquals(history.load(self.filename),
+                          {u'a#t/Rule': 2.5, u'b c': 1.0})
+        history.update(self.filename,
+                       _Execution({u'b c': _Action(1.0, 4.0)}))
+        self.assertEquals(history.load(self.filename),
+                          {u'a#t/Rule': 2.5, u'b c': 3.0})
+
+    def test_malformed(self):
+        with open(self.filename, 'w') as history_file:
+            history_file.write("foo\tbar\n1.5\tok\n")
+        self.assertEquals(history.load(self.filename), {u'ok': 1.5})
+
+    def test_coalesced(self):
+        history.update(self.filename,
+                       _Execution({u'n[1-2]#t@c/Rule': _Action(1.0, 3.0)}))
+        durations = history.load(self.filename)
+        self.assertEquals(durations, {u'n1#t@c/Rule': 2.0,
+                                      u'n2#t@c/Rule': 2.0})
+        durations[u'n3#t@c/Rule'] = 5.0
+        self.assertEquals(history.duration_of(durations,
+                                              u'n[2-4]#t@c/Rule', 1.0), 5.0)
+        self.assertEquals(history.duration_of(durations,
+                                              u'n1#t@c/Rule', 1.0), 2.0)
+        self.assertEquals(history.duration_of(durations,
+                                              u'n[5-6]#t@c/Rule', 1.0), 1.0)
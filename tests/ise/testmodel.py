@@ -19,12 +19,14 @@
 ###############################################################################
 from __future__ import print_function
 
+import io
 import tempfile
 
 import lxml.etree
-from sequencer.commons import CyclesDetectedError, output_graph
+from sequencer.commons import CyclesDetectedError, InternalError, \
+    output_graph, write_graph_to
 from sequencer.ise.errors import UnknownDepsError, BadDepError
-from sequencer.ise import model
+from sequencer.ise import model, parser
 from sequencer.ise.parser import ISE,SEQ,PAR,ACTION
 
 from tests.ise.tools import AssertModel
@@ -224,6 +226,48 @@ class TestISEModelDep(AssertModel):
                             "Bad Dep is: %s" % error.bad_dep)
 
 
+    def test_barrierCycles(self):
+        """
+        Check that barriers do not appear in reported cycles
+        """
+        doc = ISE(SEQ(PAR(ACTION("Action1", id="id1", deps="id4"),
+                          ACTION("Action2", id="id2"),
+                          ACTION("Action3", id="id3")),
+                      PAR(ACTION("Action4", id="id4"),
+                          ACTION("Action5", id="id5"))))
+        try:
+            model.Model(doc)
+            self.fail("CyclesDetectedError not raised!")
+        except CyclesDetectedError as error:
+            cycles = error.get_all_cycles()
+            self.assertEquals([sorted(cycle) for cycle in cycles],
+                              [["id1", "id4"]])
+            self.assertFalse([node for node in error.graph.nodes()
+                              if isinstance(node, model.Barrier)])
+
+    def test_actionsGraph(self):
+        """
+        Check that barriers do not appear in the reported graph
+        """
+        doc = ISE(SEQ(PAR(ACTION("Action1", id="id1"),
+                          ACTION("Action2", id="id2"),
+                          ACTION("Action3", id="id3")),
+                      PAR(ACTION("Action4", id="id4"),
+                          ACTION("Action5", id="id5"))))
+        a_model = model.Model(doc)
+        self.assertTrue([node for node in a_model.dag.nodes()
+                         if isinstance(node, model.Barrier)])
+        graph = model.actions_graph_of(a_model.dag)
+        self.assertEquals(sorted(graph.nodes()),
+                          ["id1", "id2", "id3", "id4", "id5"])
+        self.assertEquals(sorted(graph.edges()),
+                          [(dst, src)
+                           for dst in ["id4", "id5"]
+                           for src in ["id1", "id2", "id3"]])
+        with tempfile.NamedTemporaryFile(suffix=".dot") as dot_file:
+            write_graph_to(graph, dot_file.name)
+            self.assertFalse("barrier" in dot_file.read())
+
     def test_unknownDeps(self):
         doc = ISE(PAR(ACTION("Action1", id="id1"),
                       ACTION("Action2", id="id2", deps="id1, id3, id4")))
@@ -370,6 +414,51 @@ class TestISEModelDep(AssertModel):
 
         self._checkCycleDetection(doc, [['id4','id5'], ['id6', 'id2']])
 
+    def test_SeqOfParsUsesBarrier(self):
+        size = 100
+        doc = ISE(SEQ(PAR(*[ACTION("A%d" % i, id="a%d" % i)
+                            for i in range(size)]),
+                      PAR(*[ACTION("B%d" % i, id="b%d" % i)
+                            for i in range(size)])))
+        a_model = model.Model(doc)
+        self.assertActionsNb(a_model, 2 * size)
+        # 2n edges instead of n*n
+        self.assertEquals(a_model.dag.edges_count(), 2 * size)
+        a_ids = set("a%d" % i for i in range(size))
+        b_ids = set("b%d" % i for i in range(size))
+        for i in range(size):
+            self.assertEquals(set(a_model.actions["a%d" % i].next()), b_ids)
+            self.assertEquals(a_model.actions["a%d" % i].all_deps(), [])
+            self.assertEquals(set(a_model.actions["b%d" % i].all_deps()),
+                              a_ids)
+            self.assertEquals(a_model.actions["b%d" % i].next(), [])
+
+    def test_uselessDepWithBarrier(self):
+        doc = ISE(SEQ(PAR(ACTION("Action1", id="id1"),
+                          ACTION("Action2", id="id2"),
+                          ACTION("Action3", id="id3")),
+                      PAR(ACTION("Action4", id="id4"),
+                          ACTION("Action5", id="id5", deps="id2"),
+                          ACTION("Action6", id="id6"))))
+        try:
+            model.Model(doc)
+            self.fail("BadDepError not raised! I was expecting dep: (id5, id2)")
+        except BadDepError as error:
+            self.assertEquals(['id5', 'id2'], error.bad_dep)
+
+    def test_CyclesWithBarrier(self):
+        doc = ISE(SEQ(PAR(ACTION("Action1", id="id1", deps="id5"),
+                          ACTION("Action2", id="id2"),
+                          ACTION("Action3", id="id3")),
+                      PAR(ACTION("Action4", id="id4"),
+                          ACTION("Action5", id="id5"),
+                          ACTION("Action6", id="id6"))))
+        try:
+            model.Model(doc)
+            self.fail("CyclesDetectedError not raised!")
+        except CyclesDetectedError as error:
+            self.assertEquals(set(error.cycle), set(['id1', 'id5']))
+
 
 class TestISEModelTree(AssertModel):
     """Test ISE Models with a tree architecture."""
@@ -422,4 +511,87 @@ class TestISEModelTree(AssertModel):
         self.assertAction(actions[1], cmd="Action3")
 
 
+class TestISEModelLoad(AssertModel):
+    """Test the model built while parsing."""
+
+    def _make_doc(self):
+        return ISE(SEQ(ACTION("Action1", id="a1", desc="First"),
+                       PAR(ACTION("Action2", id="a2", resources="pdu:p1"),
+                           SEQ(ACTION("Action3", id="a3"),
+                               ACTION("Action4", id="a4", deps="a1")),
+                           desc="Par"),
+                       PAR(ACTION("Action5", id="a5"),
+                           ACTION("Action6", id="a6")),
+                       ACTION("Action7", id="a7", remote="true")))
+
+    def _load(self, doc, validate=True):
+        xml = lxml.etree.tostring(doc, pretty_print=True)
+        with io.StringIO(unicode(xml)) as reader:
+            return model.load(reader, validate)
+
+    def test_SameAsModel(self):
+        doc = self._make_doc()
+        expected = model.Model(doc)
+        for validate in [True, False]:
+            loaded = self._load(doc, validate)
+            self.assertEquals(str(loaded.instructions),
+                              str(expected.instructions))
+            self.assertEquals(sorted(loaded.actions), sorted(expected.actions))
+            self.assertEquals(loaded.deps, expected.deps)
+            self.assertEquals([str(edge) for edge in loaded.dag.edges()],
+                              [str(edge) for edge in expected.dag.edges()])
+            for id_, action in loaded.actions.items():
+                other = expected.actions[id_]
+                self.assertEquals(action.command, other.command)
+                self.assertEquals(action.description, other.description)
+                self.assertEquals(action.remote, other.remote)
+                self.assertEquals(action.resources, other.resources)
+                self.assertEquals(sorted(action.all_deps()),
+                                  sorted(other.all_deps()))
+            self.assertEquals(loaded.instructions[0].instructions[1]\
+                                  .description, "Par")
+
+    def _load_string(self, xml, validate=True):
+        with io.BytesIO(xml) as reader:
+            return model.load(reader, validate)
+
+    def test_Invalid(self):
+        doc = ISE(SEQ(ACTION("Action1", id="id1"),
+                      ACTION("Action2", id="id1")))
+        self.assertRaises(lxml.etree.DocumentInvalid, self._load, doc)
+        self.assertRaises(ValueError, model.load, None)
+
+    def test_InvalidRoot(self):
+        xml = lxml.etree.tostring(SEQ(ACTION("Action1", id="a1")))
+        self.assertRaises(lxml.etree.DocumentInvalid,
+                          self._load_string, xml)
+        self.assertRaises(InternalError, self._load_string, xml, False)
+
+    def test_InvalidNamespace(self):
+        xml = '<instructions xmlns="http://www.example.com/other">' + \
+            '<seq><action id="a1">Action1</action></seq></instructions>'
+        self.assertRaises(lxml.etree.DocumentInvalid,
+                          self._load_string, xml)
+        self.assertRaises(InternalError, self._load_string, xml, False)
+
+    def test_InvalidNesting(self):
+        xml = lxml.etree.tostring(ISE(SEQ(ACTION("Action1", id="a1"),
+                                          ISE(ACTION("Action2",
+                                                     id="a2")))))
+        self.assertRaises(lxml.etree.DocumentInvalid,
+                          self._load_string, xml)
+        self.assertRaises(InternalError, self._load_string, xml, False)
+
+    def test_NotWellFormed(self):
+        xml = lxml.etree.tostring(ISE(SEQ(ACTION("Action1", id="a1"))))
+        self.assertRaises(lxml.etree.XMLSyntaxError,
+                          self._load_string, xml[:-5])
+
+    def test_Cycles(self):
+        doc = ISE(SEQ(ACTION("Action1", id="a1", deps="a2"),
+                      ACTION("Action2", id="a2")))
+        self.assertRaises(CyclesDetectedError, self._load, doc, False)
+
+    def test_SchemaCached(self):
+        self.assertTrue(parser.get_schema() is parser.get_schema())
 
@@ -21,11 +21,13 @@
 Test the ISM Algorithm
 """
 from sequencer.commons import CyclesDetectedError
-from sequencer.ism.algo import REMOTE_CHAR
+from sequencer.ise.builder import ModelBuilder, XMLBuilder
+from sequencer.ism.algo import REMOTE_CHAR, _prepare
 from pygraph.classes.digraph import digraph
 
 from tests.ism.tools import add_action
 
+import copy
 import random
 
 class AbstractISMAlgo(object):
@@ -102,6 +104,42 @@ class AbstractISMAlgo(object):
         self.assertTrue("a#ta/Rule1" in ise_model.actions)
         self.assertTrue("b#tb/Rule2" in ise_model.actions)
 
+    def test_parallel_nops(self):
+        # a -> nop1 -> b, a -> nop2 -> b: a single a -> b edge is
+        # created
+        depgraph = digraph()
+        add_action(depgraph, "a#ta", [("Rule1", "cmd1")])
+        add_action(depgraph, "b#tb", [("Rule2", "cmd2")])
+        depgraph.add_node("nop1#t")
+        depgraph.add_node("nop2#t")
+        depgraph.add_edge(('a#ta', 'nop1#t'))
+        depgraph.add_edge(('a#ta', 'nop2#t'))
+        depgraph.add_edge(('nop1#t', 'b#tb'))
+        depgraph.add_edge(('nop2#t', 'b#tb'))
+        (ise_model, xml, error) = self.order(copy.deepcopy(depgraph))
+        self.assertActionsNb(ise_model, 2)
+        _prepare(depgraph)
+        self.assertEquals(depgraph.edges(), [('a#ta', 'b#tb')])
+
+    def test_hub_nop(self):
+        # Parents -> switch (no action) -> children: each parent
+        # depends on each child.
+        depgraph = digraph()
+        depgraph.add_node("switch#t")
+        for i in range(5):
+            add_action(depgraph, "p%d#tp" % i, [("Rule1", "cmd1")])
+            depgraph.add_edge(("p%d#tp" % i, "switch#t"))
+        for i in range(10):
+            add_action(depgraph, "c%d#tc" % i, [("Rule2", "cmd2")])
+            depgraph.add_edge(("switch#t", "c%d#tc" % i))
+        # Redundant with p0 -> switch -> c0
+        depgraph.add_edge(("p0#tp", "c0#tc"))
+        (ise_model, xml, error) = self.order(copy.deepcopy(depgraph))
+        self.assertActionsNb(ise_model, 15)
+        _prepare(depgraph)
+        self.assertFalse(depgraph.has_node("switch#t"))
+        self.assertEquals(len(depgraph.edges()), 50)
+
     def _pathExist(self, depgraph, src, dst):
         """
         Returns true if a path exists in the given depgraph between nodes
@@ -202,6 +240,77 @@ class AbstractISMAlgo(object):
         self.assertAction(a, id="a#ta/Rule1", cs="a#ta",
                           cmd="cmd1", remote=True)
 
+    def _make_poweroff_depgraph(self):
+        depgraph = digraph()
+        poweroff = ("PowerOff", REMOTE_CHAR + "poweroff")
+        for i in xrange(1, 5):
+            add_action(depgraph, "n%d#compute@hw" % i, [poweroff])
+            add_action(depgraph, "io%d#io@hw" % i, [poweroff])
+        # Not coalesced: local, other force mode, not a single node
+        add_action(depgraph, "n5#compute@hw", [("PowerOff", "poweroff")])
+        add_action(depgraph, "n6#compute@hw", [("PowerOff?force=never",
+                                                REMOTE_CHAR + "poweroff")])
+        add_action(depgraph, "n[7-8]#compute@hw", [poweroff])
+        add_action(depgraph, "pdu#pdu@hw", [("Off", "pduoff")])
+        for node in depgraph.nodes():
+            if node.startswith("n") and node != "n4#compute@hw":
+                depgraph.add_edge(("pdu#pdu@hw", node))
+        return depgraph
+
+    def test_coalesce(self):
+        depgraph = self._make_poweroff_depgraph()
+        (ise_model, xml, error) = self.order(depgraph, None, True)
+        self.assertEquals(error, None)
+        self.assertEquals(sorted(ise_model.actions),
+                          ["io[1-4]#io@hw/PowerOff",
+                           "n4#compute@hw/PowerOff",
+                           "n5#compute@hw/PowerOff",
+                           "n6#compute@hw/PowerOff",
+                           "n[1-3]#compute@hw/PowerOff",
+                           "n[7-8]#compute@hw/PowerOff",
+                           "pdu#pdu@hw/Off"])
+        coalesced = ise_model.actions["n[1-3]#compute@hw/PowerOff"]
+        self.assertAction(coalesced, id="n[1-3]#compute@hw/PowerOff",
+                          cs="n[1-3]#compute@hw", cmd="poweroff",
+                          remote=True)
+        self.assertEquals(coalesced.next(), ["pdu#pdu@hw/Off"])
+        # Some algorithms add more dependencies (see order_mixed())
+        deps = ise_model.actions["pdu#pdu@hw/Off"].all_deps()
+        for id_ in ["n5#compute@hw/PowerOff", "n6#compute@hw/PowerOff",
+                    "n[1-3]#compute@hw/PowerOff",
+                    "n[7-8]#compute@hw/PowerOff"]:
+            self.assertTrue(id_ in deps, id_)
+
+    def test_coalesce_chains(self):
+        depgraph = digraph()
+        for i in xrange(1, 5):
+            add_action(depgraph, "n%d#os@sw" % i,
+                       [("Stop", REMOTE_CHAR + "shutdown")])
+            add_action(depgraph, "n%d#compute@hw" % i,
+                       [("PowerOff", REMOTE_CHAR + "poweroff")])
+            depgraph.add_edge(("n%d#compute@hw" % i, "n%d#os@sw" % i))
+        add_action(depgraph, "pdu#pdu@hw", [("Off", "pduoff")])
+        for i in xrange(1, 4):
+            depgraph.add_edge(("pdu#pdu@hw", "n%d#compute@hw" % i))
+        (ise_model, xml, error) = self.order(depgraph, None, True)
+        self.assertEquals(error, None)
+        self.assertEquals(sorted(ise_model.actions),
+                          ["n4#compute@hw/PowerOff",
+                           "n4#os@sw/Stop",
+                           "n[1-3]#compute@hw/PowerOff",
+                           "n[1-3]#os@sw/Stop",
+                           "pdu#pdu@hw/Off"])
+        self.assertTrue("n[1-3]#os@sw/Stop" in
+                        ise_model.actions["n[1-3]#compute@hw/PowerOff"]\
+                            .all_deps())
+        self.assertTrue("n[1-3]#compute@hw/PowerOff" in
+                        ise_model.actions["pdu#pdu@hw/Off"].all_deps())
+
+    def test_no_coalesce(self):
+        depgraph = self._make_poweroff_depgraph()
+        (ise_model, xml, error) = self.order(depgraph)
+        self.assertActionsNb(ise_model, 12)
+
     def _test_action_force(self, force_mode):
         depgraph = digraph()
         add_action(depgraph, "a#ta", [("Rule1?force=" + force_mode, "cmd1")])
@@ -251,3 +360,43 @@ class AbstractISMAlgo(object):
         except CyclesDetectedError:
             pass
 
+    def _random_depgraph(self, size, density):
+        depgraph = digraph()
+        for i in xrange(size):
+            name = "n%d#t" % i
+            actions_nb = random.randint(0, 3)
+            add_action(depgraph, name,
+                       [("Rule%d" % j, random.choice(["", "@"]) + "Cmd%d" % j)
+                        for j in xrange(actions_nb)])
+        for src in xrange(size):
+            for dst in xrange(src + 1, size):
+                if random.random() < density:
+                    depgraph.add_edge(("n%d#t" % dst, "n%d#t" % src))
+        return depgraph
+
+    def test_same_model_from_builders(self):
+        random.seed(2468)
+        for size, density in [(1, 0), (10, 0.3), (30, 0.1), (30, 0.3)]:
+            depgraph = self._random_depgraph(size, density)
+            (xml_model, xml, error) = self.order(copy.deepcopy(depgraph),
+                                                 XMLBuilder())
+            self.assertNotEquals(xml, None)
+            (ise_model, none, error) = self.order(copy.deepcopy(depgraph),
+                                                  ModelBuilder())
+            self.assertEquals(none, None)
+            self.assertEquals(error, None)
+            self.assertEquals([str(i) for i in ise_model.instructions],
+                              [str(i) for i in xml_model.instructions])
+            self.assertEquals(sorted(ise_model.actions),
+                              sorted(xml_model.actions))
+            self.assertEquals(ise_model.deps, xml_model.deps)
+            for id_, action in ise_model.actions.items():
+                other = xml_model.actions[id_]
+                self.assertEquals(action.command, other.command)
+                self.assertEquals(action.component_set, other.component_set)
+                self.assertEquals(action.remote, other.remote)
+                self.assertEquals(action.force, other.force)
+                self.assertEquals(sorted(action.all_deps()),
+                                  sorted(other.all_deps()))
+                self.assertEquals(sorted(action.next()),
+                                  sorted(other.next()))
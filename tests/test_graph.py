@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+###############################################################################
+# Copyright (C) Bull S.A.S (2010, 2011)
+# Contributor: Pierre Vignéras <pierre.vigneras@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+from sequencer.commons import convert_uni_graph_to_str, CyclesDetectedError
+from sequencer.graph import Digraph, find_cycle, transitive_edges, \
+     reduced_edges, strongly_connected_components
+from pygraph.algorithms.accessibility import mutual_accessibility
+from pygraph.algorithms.critical import transitive_edges as \
+     pygraph_transitive_edges
+from pygraph.classes.digraph import digraph
+from pygraph.classes.exceptions import AdditionError
+import random
+import unittest
+
+"""Test the compact graph implementation."""
+
+
+class DigraphTest(unittest.TestCase):
+
+    def _make_graph(self):
+        graph = Digraph()
+        graph.add_nodes(['a', 'b', 'c', 'd'])
+        graph.add_edge(('a', 'b'))
+        graph.add_edge(('a', 'c'), label='ac')
+        graph.add_edge(('b', 'd'), wt=3)
+        graph.add_edge(('c', 'd'), attrs=[('color', 'red')])
+        graph.add_node_attribute('a', ('action', 'echo a'))
+        return graph
+
+    def _check_graph(self, graph):
+        self.assertEqual(graph.nodes(), ['a', 'b', 'c', 'd'])
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.neighbors('a'), ['b', 'c'])
+        self.assertEqual(graph.incidents('d'), ['b', 'c'])
+        self.assertEqual(graph.incidents('a'), [])
+        self.assertEqual(sorted(graph.edges()),
+                         [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'd')])
+        self.assertTrue(graph.has_edge(('a', 'b')))
+        self.assertFalse(graph.has_edge(('b', 'a')))
+        self.assertFalse(graph.has_edge(('a', 'unknown')))
+        self.assertEqual(graph.edge_label(('a', 'c')), 'ac')
+        self.assertEqual(graph.edge_label(('a', 'b')), '')
+        self.assertEqual(graph.edge_weight(('b', 'd')), 3)
+        self.assertEqual(graph.edge_weight(('a', 'b')), 1)
+        self.assertEqual(graph.edge_attributes(('c', 'd')),
+                         [('color', 'red')])
+        self.assertEqual(graph.node_attributes('a'), [('action', 'echo a')])
+        self.assertEqual(graph.node_attributes('b'), [])
+
+    def testDigraph(self):
+        self._check_graph(self._make_graph())
+
+    def testFrozenDigraph(self):
+        frozen = self._make_graph().freeze()
+        self._check_graph(frozen)
+        self._check_graph(frozen.thaw())
+        self.assertEqual(frozen.edges_count(), 4)
+
+    def testAdditionError(self):
+        graph = self._make_graph()
+        self.assertRaises(AdditionError, graph.add_node, 'a')
+        self.assertRaises(AdditionError, graph.add_edge, ('a', 'b'))
+        self.assertRaises(AdditionError, graph.add_edge, ('a', 'unknown'))
+
+    def testDelete(self):
+        graph = self._make_graph()
+        graph.del_edge(('a', 'b'))
+        self.assertFalse(graph.has_edge(('a', 'b')))
+        self.assertEqual(graph.incidents('b'), [])
+        graph.del_node('d')
+        self.assertFalse(graph.has_node('d'))
+        self.assertEqual(graph.nodes(), ['a', 'b', 'c'])
+        self.assertEqual(graph.edges(), [('a', 'c')])
+        frozen = graph.freeze()
+        self.assertEqual(frozen.nodes(), ['a', 'b', 'c'])
+        self.assertEqual(frozen.edges(), [('a', 'c')])
+        # Nodes can be added again
+        graph.add_node('d')
+        graph.add_edge(('d', 'a'))
+        self.assertEqual(graph.incidents('a'), ['d'])
+
+    def testReverse(self):
+        reverse = self._make_graph().reverse()
+        self.assertEqual(reverse.neighbors('d'), ['b', 'c'])
+        self.assertEqual(reverse.edge_label(('c', 'a')), 'ac')
+
+    def testPygraph(self):
+        graph = self._make_graph()
+        pygraph = graph.to_pygraph()
+        self.assertTrue(isinstance(pygraph, digraph))
+        self.assertEqual(sorted(pygraph.edges()), sorted(graph.edges()))
+        self.assertEqual(pygraph.edge_label(('a', 'c')), 'ac')
+        self.assertEqual(pygraph.node_attributes('a'),
+                         [('action', 'echo a')])
+        converted = Digraph.from_pygraph(pygraph)
+        self.assertEqual(sorted(converted.edges()), sorted(graph.edges()))
+        self.assertEqual(converted.edge_weight(('b', 'd')), 3)
+        self.assertEqual(converted.edge_attributes(('c', 'd')),
+                         [('color', 'red')])
+        self.assertTrue(isinstance(convert_uni_graph_to_str(graph), digraph))
+
+    def testFindCycle(self):
+        graph = self._make_graph()
+        self.assertEqual(find_cycle(graph), [])
+        self.assertEqual(find_cycle(graph.freeze()), [])
+        graph.add_edge(('d', 'a'))
+        cycle = find_cycle(graph)
+        self.assertTrue(cycle in [['a', 'b', 'd'], ['a', 'c', 'd']], cycle)
+        self.assertEqual(find_cycle(graph.freeze()), cycle)
+
+    def testFindCycleDeep(self):
+        graph = Digraph()
+        size = 50000
+        graph.add_nodes(xrange(size))
+        for i in xrange(size - 1):
+            graph.add_edge((i, i + 1))
+        self.assertEqual(find_cycle(graph), [])
+        graph.add_edge((size - 1, 0))
+        self.assertEqual(len(find_cycle(graph)), size)
+
+    def testFindCyclePygraph(self):
+        graph = self._make_graph().to_pygraph()
+        self.assertEqual(find_cycle(graph), [])
+        graph.add_edge(('d', 'd'))
+        self.assertEqual(find_cycle(graph), ['d'])
+
+
+def _random_dag(size, density):
+    graph = digraph()
+    graph.add_nodes(range(size))
+    for src in xrange(size):
+        for dst in xrange(src + 1, size):
+            if random.random() < density:
+                graph.add_edge((src, dst))
+    return graph
+
+
+class StronglyConnectedComponentsTest(unittest.TestCase):
+
+    def _random_graph(self, size, density):
+        graph = digraph()
+        graph.add_nodes(range(size))
+        for src in xrange(size):
+            for dst in xrange(size):
+                if random.random() < density:
+                    graph.add_edge((src, dst))
+        return graph
+
+    def _check_order(self, graph, components):
+        # A component comes after the components it has edges to
+        rank = {}
+        for i, component in enumerate(components):
+            for node in component:
+                rank[node] = i
+        for (src, dst) in graph.edges():
+            self.assertTrue(rank[src] >= rank[dst], (src, dst))
+
+    def testSameAsPygraph(self):
+        random.seed(13579)
+        for size, density in [(1, 0), (1, 1), (10, 0.1), (50, 0.02),
+                              (50, 0.05), (100, 0.5)]:
+            graph = self._random_graph(size, density)
+            expected = mutual_accessibility(graph)
+            for a_graph in [graph, Digraph.from_pygraph(graph),
+                            Digraph.from_pygraph(graph).freeze()]:
+                components = strongly_connected_components(a_graph)
+                self.assertEqual(sum(len(component)
+                                     for component in components), size)
+                for component in components:
+                    self.assertEqual(sorted(component),
+                                     expected[component[0]])
+                self._check_order(graph, components)
+
+    def testDeep(self):
+        graph = Digraph()
+        size = 50000
+        graph.add_nodes(xrange(size))
+        for i in xrange(size - 1):
+            graph.add_edge((i, i + 1))
+        self.assertEqual(len(strongly_connected_components(graph)), size)
+        graph.add_edge((size - 1, 0))
+        self.assertEqual(len(strongly_connected_components(graph)), 1)
+
+    def testAllCycles(self):
+        graph = Digraph()
+        graph.add_nodes(['a', 'b', 'c', 'd', 'e'])
+        graph.add_edge(('a', 'b'))
+        graph.add_edge(('b', 'a'))
+        graph.add_edge(('b', 'c'))
+        graph.add_edge(('d', 'd'))
+        error = CyclesDetectedError(find_cycle(graph), graph)
+        self.assertEqual(sorted(sorted(cycle)
+                                for cycle in error.get_all_cycles()),
+                         [['a', 'b'], ['d']])
+
+
+class TransitiveEdgesTest(unittest.TestCase):
+
+    def testSimple(self):
+        graph = Digraph()
+        graph.add_nodes(['a', 'b', 'c', 'd'])
+        graph.add_edge(('a', 'b'))
+        graph.add_edge(('b', 'c'))
+        graph.add_edge(('a', 'c'))
+        graph.add_edge(('a', 'd'))
+        self.assertEqual(transitive_edges(graph), [('a', 'c')])
+        self.assertEqual(transitive_edges(graph.freeze()), [('a', 'c')])
+
+    def testCycle(self):
+        graph = Digraph()
+        graph.add_nodes(['a', 'b', 'c'])
+        graph.add_edge(('a', 'b'))
+        graph.add_edge(('b', 'c'))
+        graph.add_edge(('a', 'c'))
+        graph.add_edge(('c', 'a'))
+        self.assertEqual(transitive_edges(graph), [])
+
+    def testSameAsPygraph(self):
+        random.seed(12345)
+        for size, density in [(1, 0), (10, 0.3), (50, 0.1),
+                              (100, 0.05), (100, 0.5)]:
+            graph = _random_dag(size, density)
+            self.assertEqual(set(transitive_edges(graph)),
+                             set(pygraph_transitive_edges(graph)))
+
+
+class ReducedEdgesTest(unittest.TestCase):
+
+    def _contract(self, graph, removed):
+        # The straightforward way: remove nodes one by one, then
+        # remove transitive edges.
+        for node in removed:
+            parents = list(graph.incidents(node))
+            children = list(graph.neighbors(node))
+            graph.del_node(node)
+            for parent in parents:
+                for child in children:
+                    if not graph.has_edge((parent, child)):
+                        graph.add_edge((parent, child))
+        for edge in set(pygraph_transitive_edges(graph)):
+            graph.del_edge(edge)
+        return set(graph.edges())
+
+    def testSameAsContraction(self):
+        random.seed(54321)
+        for size, density in [(1, 0), (10, 0.3), (50, 0.1),
+                              (100, 0.05), (100, 0.2)]:
+            for ratio in [0, 0.2, 0.5, 1]:
+                graph = _random_dag(size, density)
+                removed = set(node for node in graph.nodes()
+                              if random.random() < ratio)
+                result = reduced_edges(graph,
+                                       lambda node: node not in removed)
+                self.assertEqual(len(result), len(set(result)))
+                self.assertEqual(set(result), self._contract(graph, removed))
+
+    def testCycle(self):
+        graph = Digraph()
+        graph.add_nodes(['a', 'b'])
+        graph.add_edge(('a', 'b'))
+        graph.add_edge(('b', 'a'))
+        self.assertEqual(reduced_edges(graph, lambda node: True), None)
+
+
+if __name__ == "__main__":
+    unittest.main()